@@ -0,0 +1,145 @@
+"""
+Near-duplicate clustering on a synthetic alert-storm inbox: monitoring
+alerts and CI notifications that differ only in hosts, numbers and ids,
+mixed with ordinary mail. Compares LLM calls with deduplication off, on for
+a whole-inbox run, and on for the storm arriving in waves (as new-email jobs
+would see it, where later waves copy from already processed members).
+
+Usage (from the backend directory):
+    python -m benchmarks.dedup_alert_storm --emails 2000 --storm-share 0.8 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.llm_routing import make_emails as make_regular_emails
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+ALERTS = [
+    ("alerts@monitoring.example.com", "[FIRING] High CPU on {host}",
+     "Alert: HighCPUUsage\nSeverity: critical\nHost: {host}\nCPU usage is {pct}% (threshold 90%) since {time}.\n"
+     "Runbook: https://runbooks.example.com/cpu\nPlease acknowledge the alert in the on-call console. Incident {hex}."),
+    ("alerts@monitoring.example.com", "[FIRING] Disk almost full on {host}",
+     "Alert: DiskSpaceLow\nSeverity: warning\nHost: {host}\nVolume /var/lib/data is {pct}% full ({free} GB free) as of {time}.\n"
+     "Runbook: https://runbooks.example.com/disk\nIncident {hex}."),
+    ("ci@builds.example.com", "Build #{build} failed on main",
+     "The pipeline for commit {hex} failed at stage test after {mins} minutes.\n{failures} tests failed in suite integration.\n"
+     "Can you take a look at the logs: https://ci.example.com/builds/{build}\nThis is an automated message from the CI server."),
+    ("noreply@status.example.com", "Service status: api-gateway degraded",
+     "Status update {time}: elevated error rates ({pct}% 5xx) on api-gateway in region eu-west-{region}.\n"
+     "Our engineers are investigating. Next update in {mins} minutes. Reference {hex}."),
+]
+
+def make_storm(count: int, seed: int):
+    from models import Email
+    rng = random.Random(seed)
+    emails = []
+    for i in range(count):
+        sender, subject, body = rng.choice(ALERTS)
+        values = {
+            "host": f"web-{rng.randint(1, 40):02d}.prod", "pct": rng.randint(50, 99), "free": rng.randint(1, 20),
+            "time": f"2024-01-01T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}Z", "hex": f"{rng.getrandbits(40):010x}",
+            "build": rng.randint(1000, 9999), "mins": rng.randint(2, 45), "failures": rng.randint(1, 12), "region": rng.randint(1, 3),
+        }
+        emails.append(Email(
+            id=f"storm_{i:05d}",
+            sender=sender,
+            subject=subject.format(**values),
+            body=body.format(**values),
+            timestamp=BASE_TIME + timedelta(seconds=30 * i),
+        ))
+    return emails
+
+async def run(emails, fake, concurrency: int, dedup: bool, waves: int = 1):
+    from services.dedup import dedup_index
+    from services.processor import process_inbox
+    from services.result_cache import result_cache
+    from services.store import store
+
+    with store.batch():
+        store.clear_emails()
+    # Cold cache, so exact duplicates aren't already answered by an earlier run
+    result_cache.entries.clear()
+    fake.reset_usage()
+    ordered = sorted(emails, key=lambda e: e.timestamp)
+    size = -(-len(ordered) // waves)
+    deduplicated = 0
+    start = time.perf_counter()
+    for i in range(0, len(ordered), size):
+        wave = ordered[i:i + size]
+        with store.batch():
+            for email in wave:
+                store.add_email(email)
+        stats = await process_inbox(concurrency=concurrency, email_ids=[e.id for e in wave], dedup=dedup)
+        deduplicated += stats["deduplicated"]
+    elapsed = time.perf_counter() - start
+    results = {e.id: (e.category, e.action_items or []) for e in store.get_all_emails()}
+    return {
+        "llm_calls": fake.call_count,
+        "prompt_tokens": fake.prompt_chars // 4,
+        "elapsed_seconds": round(elapsed, 3),
+        "deduplicated": deduplicated,
+        "clusters": len(dedup_index.clusters(2)),
+    }, results
+
+def agreement(results, baseline, index: int) -> float:
+    return round(sum(results[k][index] == v[index] for k, v in baseline.items()) / max(1, len(baseline)), 4)
+
+async def main():
+    parser = argparse.ArgumentParser(description="LLM calls saved by near-duplicate clustering on an alert storm")
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--storm-share", type=float, default=0.8, help="Share of the inbox that is alerts and notifications")
+    parser.add_argument("--waves", type=int, default=10, help="Batches the storm arrives in for the incremental run")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency per call (seconds)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    # The global store and LLM cache persist to the working directory
+    os.chdir(workdir)
+    os.environ["LLM_BACKEND"] = "fake"
+
+    from services import llm_engine
+    from services.dedup import dedup_index
+    from services.fake_llm import FakeChatModel
+    from services.store import store
+
+    fake = FakeChatModel(latency=args.latency)
+    llm_engine.set_llm(fake, model_name="fake-chat")
+
+    storm_count = int(args.emails * args.storm_share)
+    emails = make_storm(storm_count, seed=1) + make_regular_emails(args.emails - storm_count, seed=2, prefix="mail")
+
+    start = time.perf_counter()
+    for email in emails:
+        dedup_index.fingerprint(email)
+    fingerprint_ms = (time.perf_counter() - start) * 1000 / max(1, len(emails))
+
+    baseline, baseline_results = await run(emails, fake, args.concurrency, dedup=False)
+    deduped, deduped_results = await run(emails, fake, args.concurrency, dedup=True)
+    waves, waves_results = await run(emails, fake, args.concurrency, dedup=True, waves=args.waves)
+    for stats, results in ((deduped, deduped_results), (waves, waves_results)):
+        stats["llm_calls_saved"] = baseline["llm_calls"] - stats["llm_calls"]
+        stats["category_agreement"] = agreement(results, baseline_results, 0)
+        stats["action_item_agreement"] = agreement(results, baseline_results, 1)
+
+    print(json.dumps({
+        "emails": args.emails,
+        "storm_emails": storm_count,
+        "fingerprint_ms_per_email": round(fingerprint_ms, 3),
+        "no_dedup": baseline,
+        "dedup": deduped,
+        "dedup_in_waves": waves,
+    }, indent=2))
+    store.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
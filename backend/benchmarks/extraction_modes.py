@@ -0,0 +1,77 @@
+"""
+Compare the combined (single-call) and two-step extraction modes on the
+fixture inbox using the fake chat model: LLM calls, prompt/completion
+tokens (estimated at ~4 characters per token) and wall time.
+
+Usage (from the backend directory):
+    python -m benchmarks.extraction_modes --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+FIXTURES = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "mock_inbox.json"))
+
+def load_fixtures():
+    from models import Email
+    with open(FIXTURES, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for item in data:
+        item["timestamp"] = datetime.fromisoformat(item["timestamp"].replace("Z", "+00:00"))
+    return [Email(**item) for item in data]
+
+async def run_mode(mode: str, fake, concurrency: int):
+    from services.store import store
+    from services.processor import process_inbox
+
+    with store.batch():
+        store.clear_emails()
+        for email in load_fixtures():
+            store.add_email(email)
+
+    fake.reset_usage()
+    start = time.perf_counter()
+    stats = await process_inbox(concurrency=concurrency, force=True, mode=mode)
+    elapsed = time.perf_counter() - start
+    emails = store.get_all_emails()
+    return {
+        "mode": mode,
+        "emails": len(emails),
+        "llm_calls": fake.call_count,
+        "prompt_tokens": fake.prompt_chars // 4,
+        "completion_tokens": fake.completion_chars // 4,
+        "tokens_per_email": round((fake.prompt_chars + fake.completion_chars) / 4 / max(1, len(emails)), 1),
+        "elapsed_seconds": round(elapsed, 3),
+        "with_summary": sum(1 for e in emails if e.summary),
+        "failed": stats["failed"],
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Combined vs two-step extraction")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake model latency per call (seconds)")
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    # The global store and LLM cache persist to the working directory
+    os.chdir(workdir)
+    os.environ["LLM_BACKEND"] = "fake"
+
+    from services import llm_engine
+    from services.fake_llm import FakeChatModel
+
+    fake = FakeChatModel(latency=args.latency)
+    llm_engine.set_llm(fake, model_name="fake-chat")
+
+    results = [await run_mode(mode, fake, args.concurrency) for mode in ("two_step", "combined")]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+Inbox-wide chat context cost: the original full walk with string
+concatenation versus the incrementally maintained digest (cached render,
+re-render after a change, update cost per store write) and aggregate
+questions answered without the LLM.
+
+Usage (from the backend directory):
+    python -m benchmarks.inbox_digest --emails 1000 10000 50000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+CATEGORIES = ["To-Do", "Important", "Newsletter", "Spam"]
+DEADLINES = ["Friday", "tomorrow", "2024-01-10", "end of month", "next week", None]
+
+def make_email(i: int, rng: random.Random):
+    from models import Email
+    category = rng.choice(CATEGORIES)
+    items = [{"task": f"Follow up on item {i}-{n}", "deadline": rng.choice(DEADLINES)} for n in range(rng.randint(1, 2))] if category == "To-Do" else []
+    return Email(
+        id=f"e{i:06d}",
+        sender=f"user{rng.randint(0, 500)}@example.com",
+        subject=f"Subject {i}",
+        body="Lorem ipsum dolor sit amet. " * rng.randint(2, 30),
+        timestamp=datetime(2024, 1, 1) + timedelta(minutes=i),
+        category=category,
+        action_items=items,
+        summary=f"Summary of email {i}",
+        read=rng.random() < 0.5,
+    )
+
+def naive_summary(emails) -> str:
+    """The original /chat context: every email, built with repeated +=."""
+    inbox_summary = "Inbox Overview:\n"
+    for email in emails:
+        inbox_summary += f"- From: {email.sender}, Subject: {email.subject}, Category: {email.category or 'Uncategorized'}\n"
+        if email.summary:
+            inbox_summary += f"  Summary: {email.summary}\n"
+        elif len(email.body) < 200:
+            inbox_summary += f"  Body: {email.body}\n"
+        else:
+            inbox_summary += f"  Body Preview: {email.body[:200]}...\n"
+    return inbox_summary
+
+def timed(fn, repeat: int) -> float:
+    """Mean milliseconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def bench(size: int, repeat: int):
+    from services.digest import inbox_digest
+    from services.store import store
+
+    rng = random.Random(size)
+    emails = [make_email(i, rng) for i in range(size)]
+    with store.batch():
+        store.clear_emails()
+        for email in emails:
+            store.add_email(email)
+    today = date(2024, 1, 8)
+
+    naive_ms = timed(lambda: naive_summary(store.get_all_emails()), max(1, repeat // 10))
+    inbox_digest.render(today)
+    cached_ms = timed(lambda: inbox_digest.render(today), repeat)
+
+    def write_then_render():
+        email = emails[rng.randrange(size)].copy()
+        email.read = not email.read
+        store.update_email(email)
+        inbox_digest.render(today)
+    rerender_ms = timed(write_then_render, repeat)
+
+    questions = ["How many To-Dos are due this week?", "how many unread emails do I have?", "top senders"]
+    answer_ms = timed(lambda: [inbox_digest.answer(q, today) for q in questions], repeat) / len(questions)
+    return {
+        "emails": size,
+        "naive_context_ms": round(naive_ms, 3),
+        "naive_context_chars": len(naive_summary(store.get_all_emails())),
+        "digest_cached_render_ms": round(cached_ms, 4),
+        "digest_write_and_render_ms": round(rerender_ms, 3),
+        "digest_chars": len(inbox_digest.render(today)),
+        "aggregate_answer_ms": round(answer_ms, 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Inbox digest vs full-inbox chat context")
+    parser.add_argument("--emails", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    # The global store persists to the working directory
+    os.chdir(workdir)
+    os.environ["LLM_BACKEND"] = "fake"
+
+    from services.store import store
+    results = [bench(size, args.repeat) for size in args.emails]
+    print(json.dumps(results, indent=2))
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Per-task routing with the local classifier: categorization on CPU with
+escalation to the chat model, compared with sending every email to the
+chat model. Uses a synthetic inbox labelled by the fake model (standing in
+for past LLM labels), so accuracy here reflects the synthetic data only.
+
+Usage (from the backend directory):
+    python -m benchmarks.llm_routing --train 2000 --emails 1000 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+TOPICS = ["budget", "roadmap", "launch", "hiring", "security review", "quarterly report", "offsite", "migration", "vendor contract", "design doc"]
+TEMPLATES = {
+    "newsletter": ("news@{domain}", "Your weekly {topic} digest", "This week in {topic}: five stories you missed. Read more on our blog. You are receiving this newsletter because you subscribed. Unsubscribe at any time."),
+    "spam": ("promo{n}@{domain}", "Congratulations, you are a winner!", "You have been selected as the lottery winner of {amount}. Click here to claim your {topic} prize before it expires."),
+    "todo": ("{name}@company.com", "{topic} follow-up", "Hi, can you send me the updated {topic} numbers by {day}? Please also review the attached notes. Thanks, {name}"),
+    # Colleague-forwarded newsletters share vocabulary with both sides, so some escalate
+    "forward": ("{name}@company.com", "Fwd: {topic} news", "Forwarding this weekly {topic} roundup from the vendor, worth a look before {day}. {name}"),
+    "fyi": ("{name}@company.com", "Update on the {topic}", "Hi team, the {topic} went well yesterday. The final numbers look good and we are on track for {day}. {name}"),
+}
+NAMES = ["alice", "bob", "carol", "dan", "erin", "frank", "grace", "heidi"]
+DAYS = ["Monday", "Tuesday", "Friday", "next week", "end of month"]
+DOMAINS = ["news.example.com", "mailer.example.org", "deals.example.net"]
+
+def make_emails(count: int, seed: int, prefix: str):
+    from models import Email
+    rng = random.Random(seed)
+    emails = []
+    for i in range(count):
+        sender, subject, body = TEMPLATES[rng.choice(list(TEMPLATES))]
+        values = {
+            "topic": rng.choice(TOPICS), "name": rng.choice(NAMES), "day": rng.choice(DAYS),
+            "domain": rng.choice(DOMAINS), "n": rng.randint(1, 99), "amount": f"${rng.randint(1, 9)},000,000",
+        }
+        emails.append(Email(
+            id=f"{prefix}_{i:05d}",
+            sender=sender.format(**values),
+            subject=subject.format(**values),
+            body=body.format(**values),
+            timestamp=BASE_TIME + timedelta(minutes=i),
+        ))
+    return emails
+
+async def run(emails, fake, concurrency: int):
+    from services import llm_engine
+    from services.processor import process_inbox
+    from services.store import store
+
+    with store.batch():
+        store.clear_emails()
+        for email in emails:
+            store.add_email(email)
+    fake.reset_usage()
+    routing_before = dict(llm_engine.routing_stats)
+    start = time.perf_counter()
+    stats = await process_inbox(concurrency=concurrency, force=True)
+    elapsed = time.perf_counter() - start
+    return {
+        "llm_calls": fake.call_count,
+        "prompt_tokens": fake.prompt_chars // 4,
+        "elapsed_seconds": round(elapsed, 3),
+        "classified_locally": llm_engine.routing_stats["local"] - routing_before["local"],
+        "escalated": llm_engine.routing_stats["escalated"] - routing_before["escalated"],
+        "failed": stats["failed"],
+    }, {e.id: e.category for e in store.get_all_emails()}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Local classifier routing vs chat model for categorization")
+    parser.add_argument("--train", type=int, default=2000, help="Emails labelled by the fake model for training")
+    parser.add_argument("--emails", type=int, default=1000, help="Emails processed in each run")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake model latency per call (seconds)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    # The global store, LLM cache and classifier persist to the working directory
+    os.chdir(workdir)
+    os.environ["LLM_BACKEND"] = "fake"
+
+    from services import llm_engine
+    from services.fake_llm import FakeChatModel
+    from services.local_classifier import local_classifier, train
+    from services.store import store
+
+    # "Past LLM labels": the training inbox categorized by the fake model
+    fake = FakeChatModel(latency=0.0)
+    llm_engine.set_llm(fake, model_name="fake-chat")
+    await run(make_emails(args.train, seed=1, prefix="train"), fake, args.concurrency)
+    start = time.perf_counter()
+    local_classifier.set_model(train(store.get_all_emails()))
+    train_seconds = time.perf_counter() - start
+
+    fake.latency = args.latency
+    emails = make_emails(args.emails, seed=2, prefix="eval")
+    llm_engine.set_route("categorize", None)
+    baseline, baseline_categories = await run(emails, fake, args.concurrency)
+    llm_engine.set_route("categorize", "local")
+    routed, routed_categories = await run(emails, fake, args.concurrency)
+
+    agreement = sum(routed_categories[k] == v for k, v in baseline_categories.items()) / max(1, len(baseline_categories))
+    print(json.dumps({
+        "emails": args.emails,
+        "train_emails": args.train,
+        "train_seconds": round(train_seconds, 3),
+        "threshold": local_classifier.threshold,
+        "chat_model_only": baseline,
+        "local_classifier_routed": routed,
+        "category_agreement": round(agreement, 4),
+    }, indent=2))
+    store.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
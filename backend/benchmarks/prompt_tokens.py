@@ -0,0 +1,96 @@
+"""
+Per-email token report for prompt preprocessing: tokens in the raw body versus
+the cleaned body and the body sent for each task after budgeting. Runs on the
+mock inbox plus synthetic noisy variants (quoted reply chain, signature and
+disclaimer, HTML, oversized body), since the fixture emails are short and clean.
+
+Usage (from the backend directory):
+    python -m benchmarks.prompt_tokens
+    python -m benchmarks.prompt_tokens --no-synthetic --tasks categorize chat
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.prompt_prep import TOKEN_BUDGETS, clean_email_body, count_tokens, prepare_email, _encoding
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "mock_inbox.json")
+
+QUOTED_CHAIN = """
+
+On Tue, Mar 4, 2024 at 9:12 AM Dana Lee <dana@example.com> wrote:
+> Thanks, that works for me. Can you also send the updated figures?
+>
+> On Mon, Mar 3, 2024 at 4:40 PM Sam Ortiz <sam@example.com> wrote:
+>> Here is the first draft of the quarterly summary. Let me know what you think.
+""" + "\n".join(f">> Previous discussion line {i} about budgets, owners and timelines." for i in range(40))
+
+SIGNATURE = """
+
+--
+Alex Morgan
+Senior Program Manager | Example Corp
++1 555 0100 | alex.morgan@example.com
+
+CONFIDENTIALITY NOTICE: This e-mail message, including any attachments, is for the sole use of the
+intended recipient(s) and may contain confidential and privileged information. Any unauthorized review,
+use, disclosure or distribution is prohibited. If you are not the intended recipient, please contact the
+sender by reply e-mail and destroy all copies of the original message.
+"""
+
+def as_html(body: str) -> str:
+    paragraphs = "".join(f"<p style=\"margin:0 0 12px 0;font-family:Arial\">{line}</p>" for line in body.split("\n") if line.strip())
+    return f"<html><head><style>p {{ color: #333; }}</style></head><body><div class=\"msg\">{paragraphs}</div></body></html>"
+
+def load_emails(include_synthetic: bool):
+    with open(DATA_PATH, "r") as f:
+        emails = [(e["id"], e["body"]) for e in json.load(f)]
+    if not include_synthetic:
+        return emails
+    synthetic = []
+    for email_id, body in emails[:5]:
+        synthetic.append((f"{email_id}+reply_chain", body + QUOTED_CHAIN))
+        synthetic.append((f"{email_id}+signature", body + SIGNATURE))
+        synthetic.append((f"{email_id}+html", as_html(body + SIGNATURE)))
+    synthetic.append(("synthetic_long", emails[0][1] + "\n\n" + "\n".join(
+        f"Item {i}: status update on workstream {i % 12}, owner and next steps follow." for i in range(1500))))
+    return emails + synthetic
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt preprocessing token report")
+    parser.add_argument("--tasks", nargs="+", choices=sorted(TOKEN_BUDGETS), default=["categorize", "action_items", "batch", "chat"])
+    parser.add_argument("--no-synthetic", action="store_true", help="Only report the mock inbox emails")
+    args = parser.parse_args()
+
+    exact = _encoding() is not None
+    print(f"Token counts: {'tokenizer' if exact else 'estimated (chars / 4)'}")
+    print("Budgets: " + ", ".join(f"{task}={TOKEN_BUDGETS[task]}" for task in args.tasks))
+    print()
+
+    header = f"{'email':<28} {'raw':>7} {'cleaned':>8}" + "".join(f" {task:>13}" for task in args.tasks)
+    print(header)
+    print("-" * len(header))
+    totals = {"raw": 0, "cleaned": 0, **{task: 0 for task in args.tasks}}
+    for email_id, body in load_emails(not args.no_synthetic):
+        raw = count_tokens(body)
+        cleaned = count_tokens(clean_email_body(body))
+        sent = {task: prepare_email(body, task).tokens for task in args.tasks}
+        totals["raw"] += raw
+        totals["cleaned"] += cleaned
+        for task in args.tasks:
+            totals[task] += sent[task]
+        print(f"{email_id:<28} {raw:>7} {cleaned:>8}" + "".join(f" {sent[task]:>13}" for task in args.tasks))
+
+    print("-" * len(header))
+    print(f"{'total':<28} {totals['raw']:>7} {totals['cleaned']:>8}" + "".join(f" {totals[task]:>13}" for task in args.tasks))
+    print()
+    for key in ["cleaned", *args.tasks]:
+        saved = totals["raw"] - totals[key]
+        share = saved / totals["raw"] * 100 if totals["raw"] else 0.0
+        print(f"{key:>13}: {saved} tokens saved ({share:.1f}% of raw input)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+CPU cost of the read endpoints and of a persistence flush: FastAPI's
+default response encoding (and response_model re-validation) versus the
+pre-encoded per-email JSON, cold (first request after a change) and warm.
+
+Usage (from the backend directory):
+    python -m benchmarks.serialization --emails 10000 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate_inbox
+
+def processed(emails, rng: random.Random):
+    """Fill in what processing would have added, so payloads have realistic size."""
+    result = []
+    for email in emails:
+        email = email.copy()
+        email.category = rng.choice(["To-Do", "Important", "Newsletter", "Spam"])
+        email.summary = f"Email about {email.subject.lower()}"
+        email.action_items = [{"task": "Review and respond", "deadline": "Friday"}] if email.category == "To-Do" else []
+        email.decided_by = "llm"
+        result.append(email)
+    return result
+
+async def cpu_ms(client, url: str, repeat: int, params=None, before=None) -> float:
+    """Mean process CPU milliseconds per request (client side included, identical for every variant)."""
+    total = 0.0
+    size = 0
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.process_time()
+        response = await client.get(url, params=params)
+        total += time.process_time() - start
+        size = len(response.content)
+    return round(total * 1000 / repeat, 3), size
+
+def add_default_routes(app, store):
+    """The endpoints as they were: FastAPI encodes (and re-validates) the models itself."""
+    from models import Email
+
+    @app.get("/bench/default/emails")
+    def default_emails():
+        return store.get_all_emails()
+
+    @app.get("/bench/default/emails/{email_id}", response_model=Email)
+    def default_email(email_id: str):
+        return store.get_email(email_id)
+
+def default_snapshot(store) -> bytes:
+    data = {
+        "emails": {k: v.dict() for k, v in list(store.emails.items())},
+        "prompts": {k: v.dict() for k, v in list(store.prompts.items())},
+        "drafts": {k: v.dict() for k, v in list(store.drafts.items())},
+        "rules": {k: v.dict() for k, v in list(store.rules.items())},
+    }
+    return json.dumps(data, default=str).encode("utf-8")
+
+def timed_ms(fn, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return round((time.process_time() - start) * 1000 / repeat, 3)
+
+async def bench(size: int, repeat: int):
+    import httpx
+    import main as app_main
+    from services.serialization import email_json, orjson
+    from services.store import store
+
+    rng = random.Random(size)
+    emails = processed(generate_inbox(size, seed=size), rng)
+    with store.batch():
+        store.clear_emails()
+        for email in emails:
+            store.add_email(email)
+
+    def forget():
+        email_json.entries.clear()
+
+    one_id = emails[size // 2].id
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app_main.app), base_url="http://bench") as client:
+        default_list, default_bytes = await cpu_ms(client, "/bench/default/emails", repeat)
+        cold_list, fast_bytes = await cpu_ms(client, "/emails", repeat, before=forget)
+        warm_list, _ = await cpu_ms(client, "/emails", repeat)
+        lean_list, lean_bytes = await cpu_ms(client, "/emails", repeat, params={"view": "list"})
+        page_fast, _ = await cpu_ms(client, "/emails", repeat * 10, params={"limit": 50})
+        single_default, _ = await cpu_ms(client, f"/bench/default/emails/{one_id}", repeat * 10)
+        single_fast, _ = await cpu_ms(client, f"/emails/{one_id}", repeat * 10)
+
+    # Encoding a JSON snapshot after 1% of the inbox changed (disk writes excluded)
+    def change_some():
+        for email in rng.sample(emails, max(1, size // 100)):
+            email = store.get_email(email.id).copy()
+            email.read = not email.read
+            store.update_email(email)
+    change_some()
+    flush_default = timed_ms(lambda: default_snapshot(store), max(1, repeat // 4))
+
+    def fast_snapshot():
+        change_some()
+        return store.backend.encode_snapshot()
+    # Includes making the changes, so it slightly overstates the flush itself
+    flush_fast = timed_ms(fast_snapshot, max(1, repeat // 4))
+
+    return {
+        "emails": size,
+        "encoder": "orjson" if orjson is not None else "json",
+        "full_list_cpu_ms": {"default": default_list, "fast_cold": cold_list, "fast_warm": warm_list, "lean_view": lean_list},
+        "full_list_bytes": {"default": default_bytes, "fast": fast_bytes, "lean_view": lean_bytes},
+        "full_list_speedup_warm": round(default_list / warm_list, 1) if warm_list else None,
+        "page_of_50_cpu_ms": page_fast,
+        "single_email_cpu_ms": {"default": single_default, "fast": single_fast},
+        "snapshot_cpu_ms_after_1pct_changed": {"default": flush_default, "fast": flush_fast},
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Response and persistence serialization cost")
+    parser.add_argument("--emails", type=int, nargs="+", default=[10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    # The global store persists to the working directory
+    os.chdir(workdir)
+    os.environ["LLM_BACKEND"] = "fake"
+
+    import main as app_main
+    from services.store import store
+    add_default_routes(app_main.app, store)
+    results = [await bench(size, args.repeat) for size in args.emails]
+    print(json.dumps(results, indent=2))
+    store.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+Insert/update latency and bulk ingest time of the storage backends at different inbox sizes.
+
+Usage (from the backend directory):
+    python -m benchmarks.store_benchmark --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from models import Email
+from services.storage import create_backend
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+CATEGORIES = ["Important", "To-Do", "Newsletter", "Spam"]
+
+def make_email(i: int) -> Email:
+    return Email(
+        id=f"bench_{i:07d}",
+        sender=f"user{i % 500}@example.com",
+        subject=f"Benchmark email {i}",
+        body="Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 10,
+        timestamp=BASE_TIME + timedelta(minutes=i),
+    )
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def summarize(latencies):
+    return {
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+def bench_backend(kind: str, size: int, ops: int, workdir: str):
+    from services.store import Store
+
+    path = os.path.join(workdir, f"{kind}_{size}.{'db' if kind == 'sqlite' else 'json'}")
+    store = Store(backend=create_backend(kind, path))
+
+    # Preload the inbox with a single bulk write
+    for i in range(size):
+        email = make_email(i)
+        store.emails[email.id] = email
+    store.save_to_disk()
+
+    inserts = []
+    for i in range(size, size + ops):
+        email = make_email(i)
+        start = time.perf_counter()
+        store.add_email(email)
+        inserts.append(time.perf_counter() - start)
+
+    updates = []
+    for _ in range(ops):
+        email = store.get_email(f"bench_{random.randrange(size):07d}")
+        email.category = random.choice(CATEGORIES)
+        start = time.perf_counter()
+        store.update_email(email)
+        updates.append(time.perf_counter() - start)
+
+    store.backend.close()
+    return {"insert": summarize(inserts), "update": summarize(updates)}
+
+def bench_ingest(kind: str, size: int, workdir: str) -> float:
+    """Seconds to ingest `size` emails inside store.batch(), including the final flush."""
+    from services.store import Store
+
+    path = os.path.join(workdir, f"ingest_{kind}_{size}.{'db' if kind == 'sqlite' else 'json'}")
+    store = Store(backend=create_backend(kind, path))
+    start = time.perf_counter()
+    with store.batch():
+        for i in range(size):
+            store.add_email(make_email(i))
+    store.flush()
+    elapsed = time.perf_counter() - start
+    store.close()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage backend latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--ops", type=int, default=200, help="Measured inserts/updates per run (SQLite)")
+    parser.add_argument("--json-ops", type=int, default=10, help="Measured inserts/updates per run (JSON, rewrites the whole file)")
+    parser.add_argument("--backends", nargs="+", default=["json", "sqlite"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # The global store in services.store persists to the working directory
+        os.chdir(workdir)
+        print(f"{'backend':<8} {'emails':>8} {'op':<7} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+        for size in args.sizes:
+            for kind in args.backends:
+                ops = args.json_ops if kind == "json" else args.ops
+                result = bench_backend(kind, size, ops, workdir)
+                for op, stats in result.items():
+                    print(f"{kind:<8} {size:>8} {op:<7} {stats['mean_ms']:>10} {stats['p50_ms']:>10} {stats['p99_ms']:>10}")
+
+        print()
+        print(f"{'backend':<8} {'emails':>8} {'batched ingest (s)':>20}")
+        for size in args.sizes:
+            for kind in args.backends:
+                print(f"{kind:<8} {size:>8} {bench_ingest(kind, size, workdir):>20.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Concurrency stress test for the store: ingestion (watcher-style diff sync in a
+thread), inbox processing (fake LLM on the event loop) and paginated
+GET /emails requests run at the same time. Every page is checked for
+ordering and duplicates, and the indexes and persisted state are checked
+against the in-memory emails at the end. Prints GET /emails latency
+percentiles; exits non-zero on any inconsistency.
+
+Usage (from the backend directory):
+    python -m benchmarks.store_stress --emails 2000 --duration 10 --backend sqlite
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+def make_email(i: int, revision: int = 0):
+    from models import Email
+    return Email(
+        id=f"stress_{i:06d}",
+        sender=f"user{i % 50}@example.com",
+        subject=f"Stress email {i}",
+        body=f"Please review item {i} (revision {revision}). " * 5,
+        timestamp=BASE_TIME + timedelta(minutes=i),
+    )
+
+def ingestion_loop(size: int, stop: threading.Event, stats: dict, errors: list):
+    """Repeatedly sync a drifting inbox: some emails deleted, added, edited or marked read."""
+    from services.ingestion import sync_emails
+
+    present = set(range(size))
+    revisions = {}
+    next_id = size
+    while not stop.is_set():
+        try:
+            for i in random.sample(sorted(present), min(len(present), size // 20)):
+                present.discard(i)
+            for _ in range(size // 20):
+                present.add(next_id)
+                next_id += 1
+            for i in random.sample(sorted(present), min(len(present), size // 50)):
+                revisions[i] = revisions.get(i, 0) + 1
+            incoming = []
+            for i in present:
+                email = make_email(i, revisions.get(i, 0))
+                email.read = i % 7 == stats["syncs"] % 7
+                incoming.append(email)
+            sync_emails(incoming)
+            stats["syncs"] += 1
+        except Exception as e:
+            errors.append(f"ingestion: {e!r}")
+        time.sleep(0.05)
+
+def check_page(emails, label: str, errors: list):
+    keys = [(e.timestamp, e.id) for e in emails]
+    if len(set(keys)) != len(keys):
+        errors.append(f"{label}: duplicate emails in one result")
+    if keys != sorted(keys, reverse=True):
+        errors.append(f"{label}: results out of order")
+
+def reader_thread_loop(stop: threading.Event, stats: dict, errors: list):
+    """Direct multi-step reads from another thread (what sync handlers and the watcher do)."""
+    from services.store import store
+
+    while not stop.is_set():
+        try:
+            snapshot = store.snapshot()
+            emails, _ = snapshot.query_emails()
+            check_page(emails, "thread reader (all)", errors)
+            if len(emails) != len(snapshot):
+                errors.append(f"thread reader: walked {len(emails)} emails in a snapshot of {len(snapshot)}")
+            todo, _ = snapshot.query_emails(category="To-Do")
+            check_page(todo, "thread reader (To-Do)", errors)
+            for email in todo:
+                if email.category != "To-Do":
+                    errors.append(f"thread reader: {email.id} has category {email.category} in the To-Do index")
+            stats["thread_reads"] += 1
+        except Exception as e:
+            errors.append(f"thread reader: {e!r}")
+        time.sleep(0.001)
+
+async def http_reader(client, stop: threading.Event, latencies: list, errors: list):
+    """Page through GET /emails and check ordering and duplicates on every page."""
+    while not stop.is_set():
+        cursor = None
+        seen = set()
+        last = None
+        while True:
+            params = {"limit": 200}
+            if cursor:
+                params["cursor"] = cursor
+            start = time.perf_counter()
+            response = await client.get("/emails", params=params)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(f"GET /emails returned {response.status_code}")
+                break
+            for item in response.json():
+                key = (item["timestamp"], item["id"])
+                if item["id"] in seen:
+                    errors.append(f"GET /emails: duplicate {item['id']} across pages")
+                if last is not None and key >= last:
+                    errors.append(f"GET /emails: {item['id']} out of order")
+                seen.add(item["id"])
+                last = key
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+
+async def processing_loop(stop: threading.Event, stats: dict, errors: list):
+    from services.processor import process_inbox
+
+    while not stop.is_set():
+        try:
+            # force keeps category updates (and index moves) flowing for the whole run
+            result = await process_inbox(concurrency=16, force=True)
+            stats["processed"] += result["processed"]
+        except Exception as e:
+            errors.append(f"processing: {e!r}")
+        await asyncio.sleep(0.05)
+
+def check_final_state(errors: list):
+    from models import Email
+    from services.store import store
+
+    snapshot = store.snapshot()
+    if set(snapshot.indexed_values) != set(snapshot.emails):
+        errors.append("final: indexed ids differ from stored ids")
+    for (field, value), keys in snapshot.time_index.items():
+        if keys != sorted(keys):
+            errors.append(f"final: index {field}={value} is not sorted")
+        for _, email_id in keys:
+            email = snapshot.emails.get(email_id)
+            if email is None:
+                errors.append(f"final: index {field}={value} references missing {email_id}")
+            elif field != "all" and (field, value) not in store._index_entries(email):
+                errors.append(f"final: {email_id} is stale in index {field}={value}")
+    total = len(snapshot.time_index[("all", None)])
+    if total != len(snapshot):
+        errors.append(f"final: 'all' index has {total} entries for {len(snapshot)} emails")
+
+    store.flush()
+    persisted = store.backend.load() or {"emails": {}}
+    persisted_emails = {k: Email(**v) for k, v in persisted["emails"].items()}
+    if set(persisted_emails) != set(snapshot.emails):
+        errors.append(f"final: persisted ids differ from memory ({len(persisted_emails)} vs {len(snapshot)})")
+    else:
+        mismatched = [k for k, e in snapshot.emails.items() if persisted_emails[k].dict() != e.dict()]
+        if mismatched:
+            errors.append(f"final: {len(mismatched)} persisted emails differ from memory")
+
+async def run(args):
+    import httpx
+    from main import app
+    from services.ingestion import sync_emails
+
+    sync_emails([make_email(i) for i in range(args.emails)])
+
+    stop = threading.Event()
+    errors: list = []
+    stats = {"syncs": 0, "processed": 0, "thread_reads": 0}
+    latencies: list = []
+
+    threads = [threading.Thread(target=ingestion_loop, args=(args.emails, stop, stats, errors), daemon=True)]
+    threads += [threading.Thread(target=reader_thread_loop, args=(stop, stats, errors), daemon=True) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress") as client:
+        tasks = [asyncio.create_task(processing_loop(stop, stats, errors))]
+        tasks += [asyncio.create_task(http_reader(client, stop, latencies, errors)) for _ in range(args.readers)]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+    for thread in threads:
+        thread.join()
+
+    check_final_state(errors)
+
+    print(f"backend={args.backend} emails={args.emails} duration={args.duration}s")
+    print(f"syncs={stats['syncs']} processed={stats['processed']} thread_reads={stats['thread_reads']} http_requests={len(latencies)}")
+    print(f"GET /emails?limit=200 latency: p50={percentile(latencies, 50) * 1000:.2f}ms p95={percentile(latencies, 95) * 1000:.2f}ms p99={percentile(latencies, 99) * 1000:.2f}ms")
+    if errors:
+        print(f"{len(errors)} consistency errors, first ones:")
+        for error in errors[:10]:
+            print(f"  {error}")
+        return 1
+    print("No consistency errors")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Store concurrency stress test")
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--readers", type=int, default=4, help="Concurrent GET /emails pagers")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="sqlite")
+    parser.add_argument("--latency", type=float, default=0.005, help="Fake LLM latency per call (seconds)")
+    parser.add_argument("--switch-interval", type=float, default=1e-5, help="Thread switch interval; small values surface races sooner")
+    args = parser.parse_args()
+    sys.setswitchinterval(args.switch_interval)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # The global store, caches and job database persist to the working directory
+        os.chdir(workdir)
+        os.environ["STORE_BACKEND"] = args.backend
+        os.environ["LLM_BACKEND"] = "fake"
+        os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+        code = asyncio.run(run(args))
+        # Stop the write-behind flushers before the directory is removed
+        from services.job_queue import job_queue
+        from services.store import store
+        store.close()
+        job_queue.close()
+    sys.exit(code)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Throughput and peak memory of the streaming mailbox readers on a synthetic
+export, and optionally of the full ingest into a SQLite-backed store.
+
+Usage (from the backend directory):
+    python -m benchmarks.streaming_ingest_benchmark --messages 1000000 --formats jsonl json mbox
+    python -m benchmarks.streaming_ingest_benchmark --messages 100000 --ingest
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+BODY = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8
+
+def make_record(i: int) -> dict:
+    return {
+        "id": f"stream_{i:07d}",
+        "sender": f"user{i % 500}@example.com",
+        "subject": f"Synthetic message {i}",
+        "body": BODY,
+        "timestamp": (BASE_TIME + timedelta(seconds=i)).isoformat(),
+    }
+
+def write_synthetic(path: str, fmt: str, count: int):
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[\n")
+        for i in range(count):
+            record = make_record(i)
+            if fmt == "jsonl":
+                f.write(json.dumps(record) + "\n")
+            elif fmt == "json":
+                f.write(("," if i else "") + json.dumps(record) + "\n")
+            else:
+                date = format_datetime(BASE_TIME + timedelta(seconds=i))
+                f.write(
+                    f"From {record['sender']} {date}\n"
+                    f"From: {record['sender']}\nSubject: {record['subject']}\nDate: {date}\n"
+                    f"Message-ID: <{record['id']}@example.com>\n\n{record['body']}\n\n"
+                )
+        if fmt == "json":
+            f.write("]\n")
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def bench_parse(path: str, fmt: str, memory_sample: int):
+    """Parse throughput, then peak traced memory over the first `memory_sample` records (tracemalloc slows parsing down)."""
+    from services.streaming_ingest import READERS
+
+    start = time.perf_counter()
+    count = sum(1 for _ in READERS[fmt](path))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in itertools.islice(READERS[fmt](path), memory_sample):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak / (1024 * 1024)
+
+def bench_ingest(path: str, fmt: str, batch_size: int):
+    from services.store import store
+    from services.streaming_ingest import ingest_stream
+
+    store.clear_emails()
+    start = time.perf_counter()
+    stats = ingest_stream(path, fmt=fmt, batch_size=batch_size, progress=None)
+    return stats["records"], time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming ingestion benchmark")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--formats", nargs="+", default=["jsonl", "json", "mbox"])
+    parser.add_argument("--ingest", action="store_true", help="Also ingest into a SQLite-backed store")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--memory-sample", type=int, default=50000, help="Records parsed under tracemalloc for the peak memory column")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # The global store persists to the working directory; SQLite keeps ingest commits incremental
+        os.chdir(workdir)
+        os.environ.setdefault("STORE_BACKEND", "sqlite")
+
+        print(f"{'format':<6} {'messages':>9} {'file MB':>8} {'parse s':>8} {'msg/s':>9} {'peak MB':>8} {'ingest s':>9} {'msg/s':>9} {'max RSS MB':>11}")
+        for fmt in args.formats:
+            path = os.path.join(workdir, f"synthetic.{fmt}")
+            write_synthetic(path, fmt, args.messages)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            count, parse_s, peak_mb = bench_parse(path, fmt, args.memory_sample)
+            ingest_s, ingest_rate = "-", "-"
+            if args.ingest:
+                ingested, elapsed = bench_ingest(path, fmt, args.batch_size)
+                ingest_s, ingest_rate = f"{elapsed:.2f}", f"{ingested / elapsed:.0f}"
+            print(f"{fmt:<6} {count:>9} {size_mb:>8.1f} {parse_s:>8.2f} {count / parse_s:>9.0f} {peak_mb:>8.2f} {ingest_s:>9} {ingest_rate:>9} {max_rss_mb():>11.1f}")
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+End-to-end benchmark suite, fully offline: drives the FastAPI app in-process
+over ASGI with a synthetic inbox and the deterministic fake chat model, so
+runs are reproducible and cost nothing.
+
+Scenarios (run in this order, each builds on the inbox the previous left):
+    ingest   POST /emails for every synthetic email
+    process  POST /process?force=true, polled until the job finishes
+    emails   GET /emails: first pages, category/unread filters, sparse fields, single emails
+    chat     POST /chat: aggregate questions (digest) and free-text questions (LLM)
+    draft    POST /drafts/generate for random emails
+
+Each scenario reports requests, errors, throughput, p50/p95/p99/max latency
+and RSS. --output writes the results as JSON; --compare prints the change
+against an earlier results file.
+
+Usage (from the backend directory):
+    python -m benchmarks.suite --emails 2000 --latency 0.05 --jitter 0.02 --output results.json
+    python -m benchmarks.suite --emails 2000 --compare results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate_inbox, parse_mix
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ["ingest", "process", "emails", "chat", "draft"]
+AGGREGATE_QUESTIONS = [
+    "How many unread emails do I have?",
+    "How many To-Dos are due this week?",
+    "how many newsletters?",
+    "top senders",
+]
+FREE_QUESTIONS = [
+    "What did the team decide about the vendor contract?",
+    "Is anything blocking the launch?",
+    "Summarize the updates on the migration.",
+    "Which emails mention the budget?",
+]
+# Lower is better for these; higher for throughput
+COMPARED = [("throughput_per_sec", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("peak_rss_mb", False)]
+
+Request = Tuple[str, str, dict]  # method, url, httpx keyword arguments
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int, units: Optional[int] = None, **extra) -> Dict:
+    """Latencies in seconds; throughput is `units` (default: requests) per second."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_sec": round((len(latencies) if units is None else units) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        **extra,
+    }
+
+
+async def drive(client, requests: List[Request], concurrency: int, **extra) -> Dict:
+    """Send `requests` with at most `concurrency` in flight and time each one."""
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(method: str, url: str, kwargs: dict):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(*request) for request in requests))
+    return summarize(latencies, time.perf_counter() - start, errors, **extra)
+
+
+async def scenario_ingest(client, emails, args, rng) -> Dict:
+    payloads = [json.loads(email.json()) for email in emails]
+    return await drive(client, [("POST", "/emails", {"json": p}) for p in payloads], args.concurrency)
+
+
+async def scenario_process(client, emails, args, rng, fake) -> Dict:
+    from services.metrics import tracer
+    calls_before = fake.call_count
+    start = time.perf_counter()
+    response = await client.post("/process", params={"force": "true", "concurrency": args.process_concurrency})
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("completed", "failed"):
+            break
+        await asyncio.sleep(0.02)
+    elapsed = time.perf_counter() - start
+    stats = job.get("stats") or {}
+    # Per-email latency from the job's trace
+    trace = tracer.get(stats.get("trace_id", ""))
+    spans = trace.summary()["spans"] if trace else []
+    latencies = [s["duration_ms"] / 1000 for s in spans if s["name"] == "process_email"]
+    result = summarize(latencies, elapsed, job["failed"], units=job["total"],
+                       emails=job["total"], llm_calls=fake.call_count - calls_before,
+                       decided_by=stats.get("decided_by"), job_status=job["status"])
+    # Throughput here is emails per second; latencies are per processed email
+    result["requests"] = 1
+    result["emails_timed"] = len(latencies)
+    return result
+
+
+def email_requests(emails, count: int, rng: random.Random) -> List[Request]:
+    kinds = [
+        lambda: ("GET", "/emails", {"params": {"limit": 50}}),
+        lambda: ("GET", "/emails", {"params": {"limit": 50, "category": rng.choice(["To-Do", "Important", "Newsletter", "Spam"])}}),
+        lambda: ("GET", "/emails", {"params": {"limit": 100, "read": "false"}}),
+        lambda: ("GET", "/emails", {"params": {"limit": 200, "fields": "id,sender,subject,category,timestamp"}}),
+        lambda: ("GET", f"/emails/{rng.choice(emails).id}", {}),
+    ]
+    return [rng.choice(kinds)() for _ in range(count)]
+
+
+async def scenario_emails(client, emails, args, rng) -> Dict:
+    result = await drive(client, email_requests(emails, args.requests, rng), args.concurrency)
+    # One unpaged listing of the whole inbox, the heaviest read
+    start = time.perf_counter()
+    response = await client.get("/emails")
+    result["full_list_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    result["full_list_bytes"] = len(response.content)
+    return result
+
+
+async def scenario_chat(client, emails, args, rng, fake) -> Dict:
+    calls_before = fake.call_count
+    questions = [rng.choice(AGGREGATE_QUESTIONS if rng.random() < 0.5 else FREE_QUESTIONS) for _ in range(args.chat_requests)]
+    result = await drive(client, [("POST", "/chat", {"json": {"query": q}}) for q in questions], args.concurrency)
+    result["llm_calls"] = fake.call_count - calls_before
+    return result
+
+
+async def scenario_draft(client, emails, args, rng, fake) -> Dict:
+    calls_before = fake.call_count
+    requests = [("POST", "/drafts/generate", {"json": {"email_id": rng.choice(emails).id, "instructions": "Keep it short"}})
+                for _ in range(args.chat_requests)]
+    result = await drive(client, requests, args.concurrency)
+    result["llm_calls"] = fake.call_count - calls_before
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results: Dict, baseline: Dict):
+    """Print each scenario's key numbers next to the baseline's, with the relative change."""
+    print(f"{'scenario':<10} {'metric':<20} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for metric, higher_is_better in COMPARED:
+            old, new = before.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            better = (change > 0) == higher_is_better
+            marker = "" if abs(change) < 5 else (" better" if better else " worse")
+            print(f"{name:<10} {metric:<20} {old:>12} {new:>12} {change:>+8.1f}%{marker}")
+
+
+async def run(args) -> Dict:
+    import httpx
+
+    import main as app_main
+    from services import llm_engine
+    from services.fake_llm import FakeChatModel
+    from services.job_queue import job_queue
+    from services.store import store
+
+    fake = FakeChatModel(latency=args.latency, jitter=args.jitter)
+    llm_engine.set_llm(fake, model_name="fake-chat")
+    # The app's startup event would sync the store with the mock inbox and start
+    # the file watcher; the suite only needs the job queue (the default tenant
+    # attaches its indexes when it loads)
+    job_queue.start()
+
+    emails = generate_inbox(args.emails, parse_mix(args.mix), args.median_words, args.sigma, seed=args.seed)
+    if "ingest" not in args.scenarios:
+        with store.batch():
+            for email in emails:
+                store.add_email(email)
+
+    rng = random.Random(args.seed)
+    handlers: Dict[str, Callable] = {
+        "ingest": lambda client: scenario_ingest(client, emails, args, rng),
+        "process": lambda client: scenario_process(client, emails, args, rng, fake),
+        "emails": lambda client: scenario_emails(client, emails, args, rng),
+        "chat": lambda client: scenario_chat(client, emails, args, rng, fake),
+        "draft": lambda client: scenario_draft(client, emails, args, rng, fake),
+    }
+    scenarios = {}
+    log = sys.stdout if args.verbose else open(os.devnull, "w")
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in SCENARIOS:
+            if name not in args.scenarios:
+                continue
+            # The app logs every email and trace; keep the report readable
+            with contextlib.redirect_stdout(log):
+                scenarios[name] = await handlers[name](client)
+            print(f"{name}: {scenarios[name]['throughput_per_sec']}/s, p50 {scenarios[name]['p50_ms']} ms, p99 {scenarios[name]['p99_ms']} ms", file=sys.stderr)
+
+    with contextlib.redirect_stdout(log):
+        await job_queue.stop()
+        job_queue.close()
+        store.close()
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "verbose")},
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark suite")
+    parser.add_argument("--emails", type=int, default=1000, help="Synthetic inbox size")
+    parser.add_argument("--mix", help="Category weights, e.g. To-Do=0.3,Important=0.3,Newsletter=0.25,Spam=0.15")
+    parser.add_argument("--median-words", type=int, default=80, help="Median body length in words")
+    parser.add_argument("--sigma", type=float, default=0.8, help="Spread of the log-normal body length")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency per call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Extra per-call latency, up to this many seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--process-concurrency", type=int, default=8, help="LLM calls in flight during /process")
+    parser.add_argument("--requests", type=int, default=2000, help="GET /emails requests")
+    parser.add_argument("--chat-requests", type=int, default=200, help="Chat and draft requests")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's log output")
+    args = parser.parse_args()
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    workdir = tempfile.mkdtemp()
+    # The store, job database and LLM cache persist to the working directory
+    os.chdir(workdir)
+    os.environ["LLM_BACKEND"] = "fake"
+    # Keep every per-email span of the processing run for its latency percentiles
+    os.environ.setdefault("TRACE_MAX_SPANS", str(max(500, args.emails * 10)))
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline_path:
+        with open(baseline_path) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Synthetic inbox generator for the benchmarks: a configurable number of
+emails with a given category mix and a log-normal body length, seeded so the
+same arguments always produce the same inbox. Wording follows the fake
+model's keyword rules, so each email is categorized as intended when
+processed with LLM_BACKEND=fake.
+
+Usage (from the backend directory):
+    python -m benchmarks.synthetic --size 10000 --mix To-Do=0.3,Important=0.3,Newsletter=0.25,Spam=0.15 --output inbox.jsonl
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DEFAULT_MIX = {"To-Do": 0.3, "Important": 0.3, "Newsletter": 0.25, "Spam": 0.15}
+NAMES = ["alice", "bob", "carol", "dan", "erin", "frank", "grace", "heidi", "ivan", "judy"]
+TOPICS = ["budget", "roadmap", "launch", "hiring plan", "quarterly report", "offsite", "migration", "vendor contract", "design doc", "pricing"]
+DAYS = ["Monday", "Tuesday", "Thursday", "Friday", "tomorrow", "next week", "end of month"]
+DOMAINS = ["news.example.com", "mailer.example.org", "deals.example.net", "updates.example.io"]
+
+# (sender, subject, opening line) per category; the opening carries the
+# keywords the fake model (and the default rules) key on
+TEMPLATES = {
+    "To-Do": [
+        ("{name}@company.com", "{topic} follow-up", "Hi, can you send me the updated {topic} numbers by {day}?"),
+        ("{name}@company.com", "Action required: {topic}", "Please review the {topic} draft and add your comments before {day}."),
+        ("{name}@partner.example.com", "Re: {topic} next steps", "Thanks for the call. Can you confirm the {topic} timeline by {day}?"),
+    ],
+    "Important": [
+        ("{name}@company.com", "Update on the {topic}", "Hi team, the {topic} went well and we are on track for {day}."),
+        ("{name}@company.com", "Decision on {topic}", "After yesterday's discussion we are going ahead with option {n} for the {topic}."),
+        ("security@company.com", "Incident {n} resolved", "The incident affecting the {topic} service is resolved as of this morning."),
+    ],
+    "Newsletter": [
+        ("news@{domain}", "Your weekly {topic} digest", "This week in {topic}: {n} stories you missed."),
+        ("newsletter@{domain}", "The {topic} newsletter, issue {n}", "Welcome to issue {n} of the {topic} newsletter."),
+    ],
+    "Spam": [
+        ("promo{n}@{domain}", "Congratulations, you are a winner!", "You have been selected as the lottery winner of ${n},000,000."),
+        ("offers@{domain}", "Exclusive {topic} deal inside", "Click here to claim your free {topic} upgrade before it expires."),
+    ],
+}
+CLOSINGS = {
+    "To-Do": "Thanks, {name}",
+    "Important": "Best, {name}",
+    "Newsletter": "You are receiving this newsletter because you subscribed. Unsubscribe at any time.",
+    "Spam": "Click here now, this offer is only for the lucky winner.",
+}
+# Neutral filler: none of the words the fake model or default rules react to
+FILLER = [
+    "The numbers from last quarter are attached for reference.",
+    "We discussed the {topic} with the wider group on {day}.",
+    "Most of the open questions were settled in the last meeting.",
+    "The team spent the week on integration work and documentation.",
+    "There is a short summary of the changes in the shared folder.",
+    "Costs came in slightly under the estimate for the period.",
+    "The schedule has some slack in the second half of the month.",
+    "Two vendors sent revised quotes that look reasonable.",
+    "Feedback from customers has been mostly positive so far.",
+    "Latency on the main dashboard improved after the last release.",
+]
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+    """Parse "To-Do=0.3,Spam=0.1" into normalized category weights."""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in TEMPLATES:
+            raise ValueError(f"Unknown category {name!r}, expected one of {', '.join(TEMPLATES)}")
+        mix[name] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Category weights must add up to more than zero")
+    return {name: weight / total for name, weight in mix.items()}
+
+
+def body_words(rng: random.Random, median: int, sigma: float, max_words: int) -> int:
+    """Log-normal word count: most emails are short, a long tail is not."""
+    return max(5, min(max_words, int(rng.lognormvariate(math.log(median), sigma))))
+
+
+def make_email(i: int, category: str, rng: random.Random, median_words: int = 80, sigma: float = 0.8, max_words: int = 5000, prefix: str = "syn"):
+    from models import Email
+    sender, subject, opening = rng.choice(TEMPLATES[category])
+    values = {
+        "name": rng.choice(NAMES), "topic": rng.choice(TOPICS), "day": rng.choice(DAYS),
+        "domain": rng.choice(DOMAINS), "n": rng.randint(1, 99),
+    }
+    words = body_words(rng, median_words, sigma, max_words)
+    lines = [opening.format(**values)]
+    count = len(lines[0].split())
+    while count < words:
+        sentence = rng.choice(FILLER).format(**values)
+        lines.append(sentence)
+        count += len(sentence.split())
+    lines.append(CLOSINGS[category].format(**values))
+    return Email(
+        id=f"{prefix}_{i:06d}",
+        sender=sender.format(**values),
+        subject=subject.format(**values),
+        body="\n\n".join([lines[0], " ".join(lines[1:-1]), lines[-1]]) if len(lines) > 2 else "\n\n".join(lines),
+        # Minutes apart, newest last, with a little irregularity
+        timestamp=BASE_TIME + timedelta(minutes=i, seconds=rng.randint(0, 59)),
+        read=rng.random() < 0.4,
+    )
+
+
+def generate_inbox(size: int, mix: Optional[Dict[str, float]] = None, median_words: int = 80, sigma: float = 0.8,
+                   max_words: int = 5000, seed: int = 0, prefix: str = "syn") -> List:
+    """`size` emails with categories drawn from `mix`; identical for identical arguments."""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    categories, weights = list(mix), list(mix.values())
+    return [
+        make_email(i, rng.choices(categories, weights)[0], rng, median_words, sigma, max_words, prefix)
+        for i in range(size)
+    ]
+
+
+def write_inbox(emails, path: str):
+    """JSON array (the mock_inbox.json layout) or, for a .jsonl path, one email per line."""
+    records = (json.dumps({
+        "id": e.id, "sender": e.sender, "subject": e.subject, "body": e.body,
+        "timestamp": e.timestamp.isoformat(), "read": e.read,
+    }) for e in emails)
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for record in records:
+                f.write(record + "\n")
+        else:
+            f.write("[\n" + ",\n".join(records) + "\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic inbox")
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--mix", help="Category weights, e.g. To-Do=0.3,Important=0.3,Newsletter=0.25,Spam=0.15")
+    parser.add_argument("--median-words", type=int, default=80, help="Median body length in words")
+    parser.add_argument("--sigma", type=float, default=0.8, help="Spread of the log-normal body length")
+    parser.add_argument("--max-words", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="Output path (.json or .jsonl)")
+    args = parser.parse_args()
+
+    emails = generate_inbox(args.size, parse_mix(args.mix), args.median_words, args.sigma, args.max_words, args.seed)
+    write_inbox(emails, args.output)
+    lengths = sorted(len(e.body.split()) for e in emails)
+    print(json.dumps({
+        "emails": len(emails),
+        "output": args.output,
+        "median_words": lengths[len(lengths) // 2] if lengths else 0,
+        "max_words": lengths[-1] if lengths else 0,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
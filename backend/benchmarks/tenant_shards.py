@@ -0,0 +1,163 @@
+"""
+Read throughput over many mailboxes as the number of server processes grows.
+
+Writes a synthetic inbox into every tenant's shard, then for each shard count
+N starts N uvicorn processes (SHARD_COUNT=N, SHARD_INDEX=0..N-1) and sends a
+mix of GET /emails requests for random tenants, each to the process owning
+the tenant, as a `hash $http_x_tenant_id` router would. Throughput can only
+scale up to the number of CPU cores, and the client shares them with the
+servers.
+
+Usage (from the backend directory):
+    python -m benchmarks.tenant_shards --shards 1 2 4 --tenants 16 --emails 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.suite import email_requests, percentile
+from benchmarks.synthetic import generate_inbox
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def seed_tenants(tenant_ids: List[str], size: int) -> Dict[str, list]:
+    """Write each tenant's inbox to its shard; returns the emails per tenant."""
+    from services.tenant_context import tenant_context
+    from services.tenants import tenants
+    from services.store import store
+
+    inboxes = {}
+    for i, tenant_id in enumerate(tenant_ids):
+        emails = generate_inbox(size, seed=i, prefix=tenant_id)
+        with tenant_context(tenant_id), store.batch():
+            for email in emails:
+                store.add_email(email)
+        inboxes[tenant_id] = emails
+    # Flushes every shard and releases its lock for the servers
+    tenants.close_all()
+    return inboxes
+
+
+def start_shards(count: int, base_port: int, verbose: bool) -> List[subprocess.Popen]:
+    output = None if verbose else subprocess.DEVNULL
+    processes = []
+    for index in range(count):
+        env = {**os.environ, "SHARD_COUNT": str(count), "SHARD_INDEX": str(index), "LLM_BACKEND": "fake",
+               "PYTHONPATH": BACKEND_DIR, "AUTO_PROCESS_NEW_EMAILS": "false"}
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(base_port + index), "--log-level", "warning"],
+            env=env, stdout=output, stderr=output,
+        ))
+    return processes
+
+
+async def wait_ready(client, urls: List[str], timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    for url in urls:
+        while True:
+            try:
+                if (await client.get(f"{url}/health")).status_code == 200:
+                    break
+            except Exception:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Shard at {url} did not start")
+            await asyncio.sleep(0.2)
+
+
+async def bench(shards: int, inboxes: Dict[str, list], args) -> Dict:
+    import httpx
+    from services.tenant_context import shard_for
+
+    urls = [f"http://127.0.0.1:{args.base_port + i}" for i in range(shards)]
+    processes = start_shards(shards, args.base_port, args.verbose)
+    rng = random.Random(args.seed)
+    tenant_ids = list(inboxes)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+            await wait_ready(client, urls)
+            # Load every tenant once so the timed run measures serving, not loading
+            for tenant_id in tenant_ids:
+                await client.get(f"{urls[shard_for(tenant_id, shards)]}/emails", params={"limit": 1}, headers={"X-Tenant-Id": tenant_id})
+
+            requests = []
+            for _ in range(args.requests):
+                tenant_id = rng.choice(tenant_ids)
+                method, path, kwargs = email_requests(inboxes[tenant_id], 1, rng)[0]
+                requests.append((tenant_id, method, path, kwargs))
+
+            latencies: List[float] = []
+            errors = 0
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(tenant_id: str, method: str, path: str, kwargs: dict):
+                nonlocal errors
+                url = urls[shard_for(tenant_id, shards)] + path
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.request(method, url, headers={"X-Tenant-Id": tenant_id}, **kwargs)
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code >= 400:
+                        errors += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(*request) for request in requests))
+            elapsed = time.perf_counter() - start
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    ordered = sorted(latencies)
+    tenants_per_shard = [sum(1 for t in tenant_ids if shard_for(t, shards) == i) for i in range(shards)]
+    return {
+        "shards": shards,
+        "tenants_per_shard": tenants_per_shard,
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Multi-tenant throughput per number of shard processes")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--tenants", type=int, default=16)
+    parser.add_argument("--emails", type=int, default=1000, help="Emails per tenant")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--base-port", type=int, default=8700)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show the shard servers' output")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    # Tenant shards live under the working directory, shared with the servers
+    os.chdir(workdir)
+    os.environ["LLM_BACKEND"] = "fake"
+
+    inboxes = seed_tenants([f"mailbox-{i}" for i in range(args.tenants)], args.emails)
+    results = [await bench(shards, inboxes, args) for shards in args.shards]
+    base = results[0]["throughput_per_sec"]
+    for result in results:
+        result["speedup"] = round(result["throughput_per_sec"] / base, 2) if base else None
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,36 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, AsyncIterator, Union
+from datetime import datetime
+import asyncio
+import json
 import os
-from models import Email, PromptConfig, Draft, GenerateDraftRequest
+import time
+from models import Email, EmailListItem, PromptConfig, Draft, GenerateDraftRequest, Job, Rule, EmailCluster
 from services.store import store
 from services.ingestion import load_mock_data
-from services.processor import process_inbox, process_single_email
+from services.job_queue import job_queue
+from services.result_cache import result_cache
+from services.response_cache import response_cache
+from services.serialization import FastJSONResponse, dumps, join_array, email_json
+from services.retrieval import retriever
+from services.rules import rule_engine, validate_rule
+from services.dedup import dedup_index
+from services.digest import inbox_digest
+from services.metrics import registry, tracer, HTTP_LATENCY
+from services.tenant_context import DEFAULT_TENANT, TENANT_HEADER, SHARD_COUNT, SHARD_INDEX, owns, shard_for, valid_tenant_id
+from services.tenants import tenants, lock_server_shard, TenantLocked, TENANT_IDLE_SECONDS
 from services.llm_engine import chat_with_email, generate_draft_reply, chat_with_inbox
+from services.llm_engine import stream_chat_with_email, stream_chat_with_inbox, stream_draft_reply
 from models import ChatRequest
 
 app = FastAPI(title="Email Productivity Agent API")
 
+# Queue newly ingested or changed emails for processing automatically
+AUTO_PROCESS_NEW_EMAILS = os.getenv("AUTO_PROCESS_NEW_EMAILS", "true").lower() == "true"
+
 # Get frontend URL from environment or use default
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 
@@ -25,13 +45,95 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Tenant-Id"],
 )
 
+# Operational endpoints that serve the whole process rather than one mailbox
+PROCESS_WIDE_PATHS = {"/", "/health", "/metrics", "/tenants", "/docs", "/openapi.json"}
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """
+    Record latency per route (until the response starts, for streams) and
+    trace non-GET requests so the LLM calls they make show up in /traces.
+    """
+    start = time.perf_counter()
+    if request.method == "GET":
+        response = await call_next(request)
+    else:
+        with tracer.trace(f"{request.method} {request.url.path}") as trace:
+            response = await call_next(request)
+            trace.attrs["status"] = response.status_code
+        response.headers["X-Trace-Id"] = trace.id
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route, status=response.status_code)
+    return response
+
+@app.middleware("http")
+async def route_tenant(request: Request, call_next):
+    """
+    Run the request against the mailbox named by the X-Tenant-Id header
+    (the default tenant without one), loading it on first use.
+    """
+    path = request.url.path
+    if request.method == "OPTIONS" or path in PROCESS_WIDE_PATHS or path.startswith("/traces"):
+        return await call_next(request)
+    tenant_id = request.headers.get(TENANT_HEADER) or DEFAULT_TENANT
+    if not valid_tenant_id(tenant_id):
+        return JSONResponse({"detail": f"Invalid {TENANT_HEADER}"}, status_code=400)
+    if not owns(tenant_id):
+        # 421 Misdirected Request: the router should send this tenant to another shard
+        shard = shard_for(tenant_id)
+        return JSONResponse({"detail": f"Tenant {tenant_id} is served by shard {shard}"}, status_code=421, headers={"X-Tenant-Shard": str(shard)})
+    try:
+        if not tenants.is_loaded(tenant_id):
+            # Loading reads the tenant's shard from disk, so keep it off the event loop
+            await run_in_threadpool(tenants.get, tenant_id)
+        with tenants.use(tenant_id):
+            response = await call_next(request)
+    except TenantLocked as e:
+        return JSONResponse({"detail": str(e)}, status_code=409)
+    response.headers["X-Tenant-Id"] = tenant_id
+    return response
+
 @app.on_event("startup")
 async def startup_event():
-    from services.ingestion import start_file_watcher
-    load_mock_data()
-    start_file_watcher()
+    from services.ingestion import start_file_watcher, set_new_email_handler
+    # Fails the start of a second process (or worker) for the same shard
+    app.state.server_lock = lock_server_shard()
+    loop = asyncio.get_running_loop()
+
+    def queue_processing(email_ids: List[str]):
+        # May be called from the watcher thread, so hand off to the event loop
+        print(f"Queueing {len(email_ids)} new or changed emails for processing")
+        asyncio.run_coroutine_threadsafe(job_queue.submit_emails(email_ids), loop)
+
+    # The mock inbox and file watcher feed the default tenant, on the shard that serves it
+    if owns(DEFAULT_TENANT):
+        if AUTO_PROCESS_NEW_EMAILS:
+            set_new_email_handler(queue_processing)
+        tenants.get(DEFAULT_TENANT)
+        load_mock_data()
+        start_file_watcher()
+    # Resumes jobs left unfinished by the previous run
+    job_queue.start()
+    app.state.tenant_evictor = asyncio.create_task(evict_idle_tenants())
+
+async def evict_idle_tenants():
+    while True:
+        await asyncio.sleep(min(60.0, TENANT_IDLE_SECONDS))
+        # Eviction flushes the tenant's store to disk
+        await asyncio.to_thread(tenants.evict_idle)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.tenant_evictor.cancel()
+    # Running jobs stay unfinished in the job database and resume on the next start
+    await job_queue.stop()
+    job_queue.close()
+    # Drain write-behind persistence before the process exits
+    tenants.close_all()
+    app.state.server_lock.close()
 
 @app.get("/")
 def read_root():
@@ -41,9 +143,53 @@ def read_root():
 def health_check():
     return {"status": "healthy", "message": "Email Agent API is running"}
 
-@app.get("/emails", response_model=List[Email])
-def get_emails():
-    return store.get_all_emails()
+EMAIL_FIELDS = set(Email.__fields__)
+
+@app.get("/emails", response_model=List[Union[Email, EmailListItem]])
+def get_emails(
+    category: Optional[str] = None,
+    uncategorized: bool = False,
+    sender: Optional[str] = None,
+    read: Optional[bool] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    sort: str = Query("-timestamp", pattern="^-?timestamp$"),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    fields: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|list)$"),
+):
+    """
+    List emails, newest first by default.
+    Supports filters, cursor pagination (pass back the X-Next-Cursor header)
+    and sparse field selection, e.g. fields=id,sender,subject,category.
+    view=list returns lean list items (a body preview instead of the body).
+    uncategorized=true lists the emails that have no category yet.
+    """
+    if uncategorized and category:
+        raise HTTPException(status_code=400, detail="category and uncategorized are mutually exclusive")
+    include = None
+    if fields:
+        include = {f.strip() for f in fields.split(",") if f.strip()} | {"id"}
+        unknown = include - EMAIL_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    try:
+        emails, next_cursor = store.query_emails(
+            category=category, sender=sender, read=read, since=since, until=until,
+            descending=sort.startswith("-"), cursor=cursor, limit=limit, uncategorized=uncategorized,
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    # Emails are encoded once and reused until they change
+    if include:
+        body = join_array(email_json.partial(email, include) for email in emails)
+    elif view == "list":
+        body = join_array(email_json.list_view(email) for email in emails)
+    else:
+        body = join_array(email_json.full(email) for email in emails)
+    return FastJSONResponse(body, headers=headers)
 
 @app.post("/emails", response_model=Email)
 def create_email(email: Email):
@@ -56,41 +202,160 @@ def get_email(email_id: str):
     email = store.get_email(email_id)
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
-    return email
+    return FastJSONResponse(email_json.full(email))
+
+def _cluster(cluster_id: str, email_ids) -> Optional[EmailCluster]:
+    emails = [e for e in (store.get_email(i) for i in email_ids) if e is not None]
+    if not emails:
+        return None
+    emails.sort(key=lambda e: e.timestamp, reverse=True)
+    return EmailCluster(
+        id=cluster_id,
+        size=len(emails),
+        sender=emails[0].sender,
+        subject=emails[0].subject,
+        latest=emails[0].timestamp,
+        email_ids=[e.id for e in emails],
+    )
+
+@app.get("/clusters", response_model=List[EmailCluster])
+def get_clusters(min_size: int = Query(2, ge=1), limit: int = Query(100, ge=1, le=1000)):
+    """Groups of near-duplicate emails (alert storms, repeated notifications), largest first, so the inbox can collapse them."""
+    clusters = [_cluster(cid, ids) for cid, ids in dedup_index.clusters(min_size).items()]
+    clusters = [c for c in clusters if c is not None and c.size >= min_size]
+    clusters.sort(key=lambda c: (c.size, c.latest), reverse=True)
+    return clusters[:limit]
+
+@app.get("/clusters/{cluster_id}", response_model=EmailCluster)
+def get_cluster(cluster_id: str):
+    cluster = _cluster(cluster_id, dedup_index.cluster_members(cluster_id))
+    if cluster is None:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    return cluster
+
+@app.get("/emails/{email_id}/cluster", response_model=EmailCluster)
+def get_email_cluster(email_id: str):
+    cluster_id = dedup_index.cluster_id(email_id)
+    cluster = _cluster(cluster_id, dedup_index.cluster_members(cluster_id)) if cluster_id else None
+    if cluster is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return cluster
 
 @app.get("/prompts", response_model=List[PromptConfig])
 def get_prompts():
-    return store.get_all_prompts()
+    return FastJSONResponse(dumps([prompt.dict() for prompt in store.get_all_prompts()]))
 
 @app.put("/prompts/{prompt_id}")
 def update_prompt(prompt_id: str, prompt: PromptConfig):
     if prompt_id != prompt.id:
         raise HTTPException(status_code=400, detail="Prompt ID mismatch")
+    existing = store.get_prompt(prompt_id)
     store.update_prompt(prompt)
-    return {"message": "Prompt updated"}
+    # Only results produced by this prompt are stale now
+    invalidated = 0
+    if existing and (existing.template, existing.system_template) != (prompt.template, prompt.system_template):
+        invalidated = result_cache.invalidate_prompt(prompt_id)
+        result_cache.save_to_disk()
+    return {"message": "Prompt updated", "invalidated_results": invalidated}
+
+@app.get("/rules", response_model=List[Rule])
+def get_rules():
+    return store.get_all_rules()
+
+@app.post("/rules", response_model=Rule)
+def create_rule(rule: Rule):
+    if store.get_rule(rule.id):
+        raise HTTPException(status_code=409, detail="Rule already exists")
+    return _save_rule(rule)
+
+@app.put("/rules/{rule_id}", response_model=Rule)
+def update_rule(rule_id: str, rule: Rule):
+    if rule_id != rule.id:
+        raise HTTPException(status_code=400, detail="Rule ID mismatch")
+    return _save_rule(rule)
+
+@app.delete("/rules/{rule_id}")
+def delete_rule(rule_id: str):
+    if not store.delete_rule(rule_id):
+        raise HTTPException(status_code=404, detail="Rule not found")
+    rule_engine.compile(store.get_all_rules())
+    return {"message": "Rule deleted"}
+
+def _save_rule(rule: Rule) -> Rule:
+    """Validate, store and recompile. Emails already processed are re-checked on the next POST /process."""
+    try:
+        validate_rule(rule)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    store.update_rule(rule)
+    rule_engine.compile(store.get_all_rules())
+    return rule
 
 @app.post("/ingest")
 async def trigger_ingest():
     # In a real app, this might trigger fetching from an IMAP server
-    # Here we just reload mock data or reset
-    load_mock_data()
-    return {"message": "Ingestion triggered"}
-
-@app.post("/process")
-async def trigger_process():
-    print("=" * 50)
-    print("PROCESS INBOX TRIGGERED")
-    print("=" * 50)
-    await process_inbox()
-    print("=" * 50)
-    print("PROCESS INBOX COMPLETED")
-    print("=" * 50)
-    return {"message": "Inbox processing completed"}
-
-@app.post("/process/{email_id}")
-async def trigger_process_email(email_id: str):
-    await process_single_email(email_id)
-    return {"message": f"Processing started for {email_id}"}
+    # Here we sync the store with the mock data file
+    result = load_mock_data()
+    return {"message": "Ingestion triggered", "changes": result}
+
+@app.post("/process", status_code=202)
+async def trigger_process(concurrency: Optional[int] = None, force: bool = False, batch_size: Optional[int] = None):
+    """Queue processing of the whole inbox. Poll GET /jobs/{job_id} for progress."""
+    job, deduplicated = await job_queue.submit_inbox(concurrency=concurrency, force=force, batch_size=batch_size)
+    print(f"PROCESS INBOX QUEUED: job {job.id} ({job.status})")
+    return {"message": "Inbox processing queued", "job_id": job.id, "deduplicated": deduplicated, "job": job}
+
+@app.post("/process/{email_id}", status_code=202)
+async def trigger_process_email(email_id: str, force: bool = False):
+    if not store.get_email(email_id):
+        raise HTTPException(status_code=404, detail="Email not found")
+    try:
+        job, deduplicated = await job_queue.submit_emails([email_id], force=force)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Processing queued for {email_id}", "job_id": job.id, "deduplicated": deduplicated, "job": job}
+
+@app.get("/jobs", response_model=List[Job])
+async def list_jobs(status: Optional[str] = Query(None, pattern="^(queued|running|completed|failed)$"), limit: int = Query(50, ge=1, le=500)):
+    """Processing jobs, newest first (per-email errors are only included in GET /jobs/{job_id})."""
+    return job_queue.list_jobs(status=status, limit=limit)
+
+@app.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    job = job_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def _sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def sse_response(raw_request: Request, tokens: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Wrap a token stream as Server-Sent Events: one `data: {"token": ...}` event per
+    chunk, then `event: done`. Stops and cancels the upstream LLM call when the client disconnects.
+    """
+    async def event_stream():
+        try:
+            async for token in tokens:
+                if await raw_request.is_disconnected():
+                    print("Client disconnected, cancelling upstream LLM call")
+                    break
+                if token:
+                    yield _sse_event({"token": token})
+            else:
+                yield _sse_event({}, event="done")
+        except Exception as e:
+            yield _sse_event({"error": str(e)}, event="error")
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
@@ -98,28 +363,74 @@ async def chat_endpoint(request: ChatRequest):
         email = store.get_email(request.email_id)
         if not email:
             raise HTTPException(status_code=404, detail="Email not found")
-        response = await chat_with_email(email.body, request.query)
+        response = await chat_with_email(email.body, request.query, fresh=request.fresh)
         return {"response": response}
     else:
-        # Chat with whole inbox
-        emails = store.get_all_emails()
-        # Construct a summary context
-        inbox_summary = "Inbox Overview:\n"
-        for email in emails:
-            inbox_summary += f"- From: {email.sender}, Subject: {email.subject}, Category: {email.category or 'Uncategorized'}\n"
-            if email.summary:
-                inbox_summary += f"  Summary: {email.summary}\n"
-            elif len(email.body) < 200:
-                inbox_summary += f"  Body: {email.body}\n"
-            else:
-                inbox_summary += f"  Body Preview: {email.body[:200]}...\n"
-        
-        response = await chat_with_inbox(inbox_summary, request.query)
+        # Counting questions are answered from the digest without an LLM call
+        with tracer.span("digest_answer"):
+            answer = inbox_digest.answer(request.query)
+        if answer is not None:
+            return {"response": answer}
+        # Otherwise chat with the digest plus the emails most relevant to the question
+        with tracer.span("build_context"):
+            context = inbox_context(request.query)
+        response = await chat_with_inbox(context, request.query)
         return {"response": response}
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, raw_request: Request):
+    """Streaming variant of /chat (Server-Sent Events)."""
+    if request.email_id:
+        email = store.get_email(request.email_id)
+        if not email:
+            raise HTTPException(status_code=404, detail="Email not found")
+        return sse_response(raw_request, stream_chat_with_email(email.body, request.query))
+    answer = inbox_digest.answer(request.query)
+    if answer is not None:
+        return sse_response(raw_request, _single_chunk(answer))
+    return sse_response(raw_request, stream_chat_with_inbox(inbox_context(request.query), request.query))
+
+def inbox_context(query: str) -> str:
+    return inbox_digest.render() + "\n" + retriever.build_context(query)
+
+async def _single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics: LLM calls, tokens, cost, retries, cache hits, stage timings, store size and flushes."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/tenants")
+def list_tenants():
+    """Tenants loaded in this server process, and the shard it serves."""
+    return {"shard": SHARD_INDEX, "shards": SHARD_COUNT, "tenants": [tenant.stats() for tenant in tenants.loaded()]}
+
+@app.get("/cache/responses")
+def get_response_cache_stats():
+    """Hit rate, coalesced calls, evictions and size of the chat and draft response cache."""
+    return response_cache.stats()
+
+@app.delete("/cache/responses")
+def clear_response_cache():
+    response_cache.clear()
+    return {"message": "Response cache cleared"}
+
+@app.get("/traces")
+def get_traces(limit: int = Query(20, ge=1, le=200)):
+    """Recent traces (processing runs and non-GET requests), newest first, with time per stage."""
+    return [trace.summary(include_spans=False) for trace in tracer.recent(limit)]
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    trace = tracer.get(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace.summary()
+
 @app.get("/drafts", response_model=List[Draft])
 def get_drafts():
-    return store.get_all_drafts()
+    return FastJSONResponse(dumps([draft.dict() for draft in store.get_all_drafts()]))
 
 @app.post("/drafts", response_model=Draft)
 def create_draft(draft: Draft):
@@ -135,10 +446,7 @@ def update_draft(draft_id: str, draft: Draft):
 
 @app.delete("/drafts/{draft_id}")
 def delete_draft(draft_id: str):
-    # Add delete method to store
-    if store.drafts.get(draft_id):
-        del store.drafts[draft_id]
-        store.save_to_disk()
+    if store.delete_draft(draft_id):
         return {"message": "Draft deleted"}
     raise HTTPException(status_code=404, detail="Draft not found")
 
@@ -148,5 +456,13 @@ async def generate_draft(request: GenerateDraftRequest):
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
-    draft_body = await generate_draft_reply(email.body, request.instructions)
+    draft_body = await generate_draft_reply(email.body, request.instructions, fresh=request.fresh)
     return {"draft_body": draft_body}
+
+@app.post("/drafts/generate/stream")
+async def generate_draft_stream(request: GenerateDraftRequest, raw_request: Request):
+    """Streaming variant of /drafts/generate (Server-Sent Events)."""
+    email = store.get_email(request.email_id)
+    if not email:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return sse_response(raw_request, stream_draft_reply(email.body, request.instructions))
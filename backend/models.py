@@ -12,6 +12,23 @@ class Email(BaseModel):
     category: Optional[str] = None
     action_items: Optional[List[Dict[str, Any]]] = None
     summary: Optional[str] = None
+    # Which path set the category: "rule:<rule_id>", "sender_history", "local_classifier", "llm",
+    # or "cluster:<email_id>" when copied from a near-duplicate the LLM processed
+    decided_by: Optional[str] = None
+    # Feed the email was synced from (e.g. "mock_inbox"); a sync only deletes emails of its own feed
+    source: Optional[str] = None
+
+class EmailListItem(BaseModel):
+    """Lean list view of an email (GET /emails?view=list): no body, just its first characters."""
+    id: str
+    sender: str
+    subject: str
+    timestamp: datetime
+    read: bool = False
+    category: Optional[str] = None
+    summary: Optional[str] = None
+    preview: str = ""
+    action_item_count: int = 0
 
 class PromptConfig(BaseModel):
     id: str
@@ -20,6 +37,24 @@ class PromptConfig(BaseModel):
     system_template: Optional[str] = None  # Backend detailed prompt (if None, uses template)
     description: str
 
+class Rule(BaseModel):
+    id: str
+    name: str
+    kind: str  # "sender" (exact address), "domain" (domain and its subdomains) or "pattern" (regular expression)
+    pattern: str
+    field: str = "any"  # Pattern rules only: "subject", "body", "sender" or "any" (subject and body)
+    category: str
+    enabled: bool = True
+    description: Optional[str] = None
+
+class EmailCluster(BaseModel):
+    id: str
+    size: int
+    sender: str
+    subject: str  # Of the newest member
+    latest: datetime
+    email_ids: List[str]  # Newest first
+
 class Draft(BaseModel):
     id: str
     email_id: Optional[str] = None # If replying to an email
@@ -31,10 +66,12 @@ class Draft(BaseModel):
 class ChatRequest(BaseModel):
     query: str
     email_id: Optional[str] = None # Context can be a specific email or whole inbox
+    fresh: bool = False # Skip the response cache for email chat and ask the model again
 
 class GenerateDraftRequest(BaseModel):
     email_id: str
     instructions: Optional[str] = None
+    fresh: bool = False # Skip the response cache, e.g. to regenerate a draft
 
 class ActionItem(BaseModel):
     task: str
@@ -42,3 +79,33 @@ class ActionItem(BaseModel):
 
 class ActionItemList(BaseModel):
     items: List[ActionItem]
+
+class EmailExtraction(BaseModel):
+    category: str
+    action_items: List[ActionItem] = []
+    summary: str
+
+class BatchClassificationItem(BaseModel):
+    id: str
+    category: str
+
+class BatchClassification(BaseModel):
+    results: List[BatchClassificationItem]
+
+class Job(BaseModel):
+    id: str
+    tenant: Optional[str] = None  # Mailbox the job belongs to
+    kind: str  # "process_inbox" or "process_emails"
+    status: str  # queued, running, completed, failed
+    params: Dict[str, Any] = {}
+    total: int = 0
+    pending: int = 0
+    processed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: Dict[str, str] = {}  # email id -> error message
+    error: Optional[str] = None
+    stats: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,207 @@
+"""
+File-based batch classification jobs for large offline backfills.
+
+Requests are written as JSONL in the OpenAI Batch API format, each one
+classifying several emails, and submitted through the Files/Batches API.
+Results are polled, validated against the ids each request was built from
+and applied to the store. Requests with malformed output are retried
+online with batch splitting.
+
+Usage (from the backend directory):
+    python -m services.batch_jobs submit --batch-size 20 [--local]
+    python -m services.batch_jobs poll <job_id>
+    python -m services.batch_jobs apply <job_id>
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List
+from models import Email
+from services import llm_engine
+from services.llm_engine import BATCH_CLASSIFY_PROMPT, batch_classification_input, parse_batch_classification, classify_batch
+from services.result_cache import result_cache, content_hash, prompt_hash
+from services.store import store
+
+BATCH_JOBS_DIR = os.getenv("BATCH_JOBS_DIR", "batch_jobs")
+
+def _job_path(job_id: str, suffix: str) -> str:
+    return os.path.join(BATCH_JOBS_DIR, f"{job_id}{suffix}")
+
+def load_job(job_id: str) -> Dict[str, Any]:
+    with open(_job_path(job_id, ".json"), "r") as f:
+        return json.load(f)
+
+def save_job(job: Dict[str, Any]):
+    with open(_job_path(job["id"], ".json"), "w") as f:
+        json.dump(job, f, indent=2)
+
+def create_job(emails: List[Email], batch_size: int = 20) -> Dict[str, Any]:
+    """Write the JSONL request file and job manifest for classifying `emails`."""
+    categorize_prompt = store.get_prompt("categorize")
+    os.makedirs(BATCH_JOBS_DIR, exist_ok=True)
+    job_id = f"job_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+    job = {
+        "id": job_id,
+        "model": llm_engine.model_name_for("categorize"),
+        "prompt_hash": prompt_hash(categorize_prompt),
+        "status": "created",
+        "remote_batch_id": None,
+        "requests": {},
+        "body_hashes": {e.id: content_hash(e.body) for e in emails},
+    }
+
+    with open(_job_path(job_id, ".input.jsonl"), "w") as f:
+        for i in range(0, len(emails), batch_size):
+            chunk = emails[i:i + batch_size]
+            custom_id = f"{job_id}-{i // batch_size}"
+            messages = BATCH_CLASSIFY_PROMPT.format_messages(**batch_classification_input([(e.id, e.body) for e in chunk], categorize_prompt))
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": job["model"],
+                    "temperature": 0,
+                    "messages": [{"role": "user", "content": messages[0].content}],
+                },
+            }) + "\n")
+            job["requests"][custom_id] = [e.id for e in chunk]
+
+    save_job(job)
+    return job
+
+def submit_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Upload the request file and start a remote batch."""
+    from openai import OpenAI
+
+    client = OpenAI()
+    with open(_job_path(job["id"], ".input.jsonl"), "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+    job["remote_batch_id"] = batch.id
+    job["status"] = "submitted"
+    save_job(job)
+    return job
+
+async def run_job_locally(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute the request file with the configured chat model and write output in the Batch API format."""
+    from langchain_core.messages import HumanMessage
+
+    with open(_job_path(job["id"], ".input.jsonl"), "r") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+
+    async def run(request):
+        try:
+            message = await llm_engine.invoke_with_retry(llm_engine.llm_for("categorize"), [HumanMessage(content=request["body"]["messages"][0]["content"])], task="batch", model=llm_engine.model_name_for("categorize"))
+            body = {"choices": [{"message": {"role": "assistant", "content": message.content}}]}
+            return {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+        except Exception as e:
+            return {"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}}
+
+    results = await asyncio.gather(*(run(r) for r in requests))
+    with open(_job_path(job["id"], ".output.jsonl"), "w") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    job["status"] = "completed"
+    save_job(job)
+    return job
+
+def poll_job(job: Dict[str, Any]) -> str:
+    """Refresh the remote batch status and download the output once it has completed."""
+    if job["status"] == "completed" or not job["remote_batch_id"]:
+        return job["status"]
+    from openai import OpenAI
+
+    client = OpenAI()
+    batch = client.batches.retrieve(job["remote_batch_id"])
+    if batch.status == "completed" and batch.output_file_id:
+        content = client.files.content(batch.output_file_id).text
+        with open(_job_path(job["id"], ".output.jsonl"), "w") as f:
+            f.write(content)
+    job["status"] = batch.status
+    save_job(job)
+    return job["status"]
+
+async def apply_job(job: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Validate each response against the email ids it was built from and write
+    categories to the store and result cache. Malformed or missing responses
+    are retried online with split-and-retry batching.
+    """
+    categorize_prompt = store.get_prompt("categorize")
+    if prompt_hash(categorize_prompt) != job["prompt_hash"]:
+        raise ValueError("The categorize prompt changed since this job was created; create a new job")
+
+    categories: Dict[str, str] = {}
+    answered = set()
+    with open(_job_path(job["id"], ".output.jsonl"), "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            expected = job["requests"].get(result["custom_id"])
+            if expected is None or not result.get("response") or result["response"].get("status_code") != 200:
+                continue
+            content = result["response"]["body"]["choices"][0]["message"]["content"]
+            parsed = parse_batch_classification(content, expected)
+            if parsed is not None:
+                categories.update(parsed)
+                answered.add(result["custom_id"])
+
+    # Emails that changed or disappeared since submission are skipped
+    def current(email_id: str):
+        email = store.get_email(email_id)
+        if email and content_hash(email.body) == job["body_hashes"].get(email_id):
+            return email
+        return None
+
+    retry = [current(email_id) for custom_id, ids in job["requests"].items() if custom_id not in answered for email_id in ids]
+    retry = [e for e in retry if e is not None]
+    if retry:
+        print(f"Retrying {len(retry)} emails from malformed or failed batch requests")
+        categories.update(await classify_batch([(e.id, e.body) for e in retry], categorize_prompt))
+
+    applied = 0
+    with store.batch():
+        for email_id, category in categories.items():
+            email = current(email_id)
+            if email is None:
+                continue
+            email = email.copy()
+            result_cache.set(result_cache.make_key(email.body, categorize_prompt, job["model"]), categorize_prompt.id, category)
+            email.category = category
+            email.decided_by = "llm"
+            store.update_email(email)
+            applied += 1
+    result_cache.save_to_disk()
+
+    job["status"] = "applied"
+    save_job(job)
+    return {"applied": applied, "retried": len(retry)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="File-based batch classification jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    submit_parser = sub.add_parser("submit", help="Create and submit a job for all emails")
+    submit_parser.add_argument("--batch-size", type=int, default=20)
+    submit_parser.add_argument("--local", action="store_true", help="Run the requests with the configured model instead of the Batch API")
+    sub.add_parser("poll").add_argument("job_id")
+    sub.add_parser("apply").add_argument("job_id")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        job = create_job(store.get_all_emails(), batch_size=args.batch_size)
+        if args.local:
+            asyncio.run(run_job_locally(job))
+        else:
+            submit_job(job)
+        print(f"Job {job['id']}: {len(job['requests'])} requests, status={job['status']}")
+    elif args.command == "poll":
+        print(f"Job {args.job_id}: status={poll_job(load_job(args.job_id))}")
+    elif args.command == "apply":
+        counts = asyncio.run(apply_job(load_job(args.job_id)))
+        print(f"Applied {counts['applied']} categories ({counts['retried']} emails retried online). Run /process to extract action items.")
+    store.close()
@@ -0,0 +1,189 @@
+"""
+Near-duplicate detection for alert storms, digests and CI notifications.
+
+Each email is fingerprinted on its normalized subject and body (lowercased,
+numbers and long hex ids masked): an exact hash plus a 64-bit SimHash over
+word shingles. Emails from the same sender whose fingerprints match exactly
+or differ in at most SIMHASH_MAX_DISTANCE bits join the same cluster.
+Candidates are found through banded lookups (the 64 bits split into
+SIMHASH_MAX_DISTANCE + 1 bands, one of which must match exactly), so adding
+an email never scans the inbox. Kept current through store listeners.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from models import Email
+from services.tenant_context import TenantLocal
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", "3"))
+
+SHINGLE_SIZE = 3
+HEX_ID_RE = re.compile(r"\b(?=[0-9a-f]*\d)[0-9a-f]{8,}\b")
+NUMBER_RE = re.compile(r"\d+")
+WORD_RE = re.compile(r"\S+")
+
+def normalize(text: str) -> str:
+    """Mask the parts that vary between otherwise identical notifications."""
+    text = HEX_ID_RE.sub("#", text.lower())
+    return " ".join(WORD_RE.findall(NUMBER_RE.sub("0", text)))
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(text: str) -> int:
+    words = text.split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = words or [""]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    # Count set bits per position column-wise over the binary strings (far faster than bit loops)
+    bits = [format(_hash64(shingle), "064b") for shingle in shingles]
+    half = len(bits) / 2
+    fingerprint = 0
+    for column in zip(*bits):
+        fingerprint = (fingerprint << 1) | (column.count("1") > half)
+    return fingerprint
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def email_text(email: Email) -> str:
+    return f"{email.subject}\n{email.body}"
+
+def _bands(fingerprint: int, count: int) -> List[int]:
+    width = 64 // count
+    return [(fingerprint >> (i * width)) & ((1 << width) - 1) for i in range(count)]
+
+
+class NearDupIndex:
+    """Incrementally maintained clusters of exact and near-duplicate emails."""
+    def __init__(self, max_distance: int = SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.band_count = max_distance + 1
+        self.lock = threading.RLock()
+        self.attached = False
+        # email id -> (source hash, sender, exact hash, simhash)
+        self.fingerprints: Dict[str, Tuple[str, str, str, int]] = {}
+        # (sender, exact hash) -> cluster, and how many indexed emails share that key
+        self.exact: Dict[Tuple[str, str], str] = {}
+        self.exact_counts: Counter = Counter()
+        self.bands: Dict[Tuple[str, int, int], Set[str]] = {}
+        self.cluster_of: Dict[str, str] = {}
+        self.members: Dict[str, Set[str]] = {}
+
+    @classmethod
+    def build(cls, emails: List[Email]) -> "NearDupIndex":
+        """Standalone index over a list of emails (when no store index is attached)."""
+        index = cls()
+        for email in emails:
+            index.add(email)
+        return index
+
+    def attach(self, store):
+        with self.lock:
+            for email in store.get_all_emails():
+                self.add(email)
+            self.attached = True
+        store.add_listener(self.on_store_event)
+
+    def on_store_event(self, event: str, email: Optional[Email]):
+        with self.lock:
+            if event == "clear":
+                self.fingerprints.clear()
+                self.exact.clear()
+                self.exact_counts.clear()
+                self.bands.clear()
+                self.cluster_of.clear()
+                self.members.clear()
+            elif event == "upsert":
+                self.add(email)
+            elif event == "delete":
+                self.remove(email.id)
+
+    def fingerprint(self, email: Email) -> Tuple[str, str, str, int]:
+        """(source hash, sender, exact hash, simhash), reusing the indexed one if the content is unchanged."""
+        text = email_text(email)
+        source = hashlib.sha256(f"{email.sender}\0{text}".encode("utf-8")).hexdigest()
+        indexed = self.fingerprints.get(email.id)
+        if indexed and indexed[0] == source:
+            return indexed
+        normalized = normalize(text)
+        return source, email.sender.lower(), hashlib.sha256(normalized.encode("utf-8")).hexdigest(), simhash(normalized)
+
+    def is_near_duplicate(self, a: Email, b: Email) -> bool:
+        _, sender_a, exact_a, hash_a = self.fingerprint(a)
+        _, sender_b, exact_b, hash_b = self.fingerprint(b)
+        return sender_a == sender_b and (exact_a == exact_b or hamming(hash_a, hash_b) <= self.max_distance)
+
+    def add(self, email: Email):
+        with self.lock:
+            previous = self.fingerprints.get(email.id)
+            entry = self.fingerprint(email)
+            if previous is entry:
+                # Category or read-flag updates don't change the fingerprint
+                return
+            if previous:
+                self.remove(email.id)
+
+            _, sender, exact, fingerprint = entry
+            bands = _bands(fingerprint, self.band_count)
+
+            cluster_id = self.exact.get((sender, exact))
+            if cluster_id is None:
+                candidates = set()
+                for i, band in enumerate(bands):
+                    candidates |= self.bands.get((sender, i, band), set())
+                for candidate in sorted(candidates):
+                    if hamming(fingerprint, self.fingerprints[candidate][3]) <= self.max_distance:
+                        cluster_id = self.cluster_of[candidate]
+                        break
+            if cluster_id is None:
+                cluster_id = email.id
+            self.exact.setdefault((sender, exact), cluster_id)
+            self.exact_counts[(sender, exact)] += 1
+
+            self.fingerprints[email.id] = entry
+            for i, band in enumerate(bands):
+                self.bands.setdefault((sender, i, band), set()).add(email.id)
+            self.cluster_of[email.id] = cluster_id
+            self.members.setdefault(cluster_id, set()).add(email.id)
+
+    def remove(self, email_id: str):
+        with self.lock:
+            entry = self.fingerprints.pop(email_id, None)
+            if entry is None:
+                return
+            _, sender, exact, fingerprint = entry
+            for i, band in enumerate(_bands(fingerprint, self.band_count)):
+                key = (sender, i, band)
+                self.bands[key].discard(email_id)
+                if not self.bands[key]:
+                    del self.bands[key]
+            cluster_id = self.cluster_of.pop(email_id)
+            members = self.members[cluster_id]
+            members.discard(email_id)
+            if not members:
+                del self.members[cluster_id]
+            key = (sender, exact)
+            self.exact_counts[key] -= 1
+            if self.exact_counts[key] <= 0:
+                del self.exact_counts[key]
+                self.exact.pop(key, None)
+
+    def cluster_id(self, email_id: str) -> Optional[str]:
+        return self.cluster_of.get(email_id)
+
+    def cluster_members(self, cluster_id: str) -> Set[str]:
+        with self.lock:
+            return set(self.members.get(cluster_id, ()))
+
+    def clusters(self, min_size: int = 2) -> Dict[str, Set[str]]:
+        with self.lock:
+            return {cid: set(ids) for cid, ids in self.members.items() if len(ids) >= min_size}
+
+# The current tenant's instance (see services.tenants)
+dedup_index = TenantLocal("dedup_index")
@@ -0,0 +1,300 @@
+"""
+Incrementally maintained inbox digest for inbox-wide chat.
+
+Keeps per-category and per-sender counts, pending action items ordered by
+due date and a one-line entry per email. Store listeners update it in
+O(log n) per change, so nothing walks the inbox on a chat request. The
+rendered text is cached on the store version it reflects. Aggregate
+questions it can answer exactly ("how many To-Dos are due this week?") are
+answered from it without calling the LLM.
+"""
+import bisect
+import calendar
+import os
+import re
+import threading
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from models import Email
+from services.tenant_context import TenantLocal
+
+DIGEST_TOP_SENDERS = int(os.getenv("DIGEST_TOP_SENDERS", "5"))
+DIGEST_MAX_ACTION_ITEMS = int(os.getenv("DIGEST_MAX_ACTION_ITEMS", "15"))
+DIGEST_RECENT_EMAILS = int(os.getenv("DIGEST_RECENT_EMAILS", "20"))
+
+WEEKDAYS = {name.lower(): i for i, name in enumerate(calendar.day_name)}
+MONTHS = {name.lower()[:3]: i for i, name in enumerate(calendar.month_name) if name}
+MONTH_NAMES = "|".join(MONTHS)
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+MONTH_DAY_RE = re.compile(rf"\b({MONTH_NAMES})[a-z]*\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?\b")
+DAY_MONTH_RE = re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({MONTH_NAMES})[a-z]*\b")
+WEEKDAY_RE = re.compile(rf"\b(next\s+)?({'|'.join(WEEKDAYS)})\b")
+# Items without a parseable deadline sort after every dated one
+UNDATED = date.max.toordinal()
+
+def _end_of_week(day: date) -> date:
+    """The Friday of the day's week (or the day itself on weekends)."""
+    return max(day, day + timedelta(days=4 - day.weekday()))
+
+def parse_deadline(deadline: Optional[str], received: date) -> Optional[date]:
+    """Best-effort due date for a free-text deadline, relative to when the email arrived."""
+    if not deadline:
+        return None
+    text = deadline.lower()
+    match = ISO_DATE_RE.search(text)
+    if match:
+        try:
+            return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            return None
+    match = MONTH_DAY_RE.search(text) or DAY_MONTH_RE.search(text)
+    if match:
+        month_text, day_text = match.groups() if match.re is MONTH_DAY_RE else reversed(match.groups())
+        try:
+            due = date(received.year, MONTHS[month_text], int(day_text))
+        except ValueError:
+            return None
+        # "Jan 5" written in December means next year
+        return due if due >= received - timedelta(days=31) else due.replace(year=due.year + 1)
+    if re.search(r"\b(today|tonight|eod|end of (the )?day|asap)\b", text):
+        return received
+    if "tomorrow" in text:
+        return received + timedelta(days=1)
+    match = WEEKDAY_RE.search(text)
+    if match:
+        ahead = (WEEKDAYS[match.group(2)] - received.weekday()) % 7
+        if match.group(1) and ahead == 0:
+            ahead = 7
+        return received + timedelta(days=ahead)
+    if re.search(r"\b(end of (the )?week|eow|this week)\b", text):
+        return _end_of_week(received)
+    if "next week" in text:
+        return _end_of_week(received + timedelta(days=7 - received.weekday()))
+    if re.search(r"\b(end of (the )?month|eom)\b", text):
+        return date(received.year, received.month, calendar.monthrange(received.year, received.month)[1])
+    return None
+
+def due_window(query: str, today: date) -> Optional[Tuple[str, date, date]]:
+    """(label, first day, last day) for the period a question asks about."""
+    if "overdue" in query:
+        return "overdue", date.min, today - timedelta(days=1)
+    if "today" in query:
+        return "due today", today, today
+    if "tomorrow" in query:
+        return "due tomorrow", today + timedelta(days=1), today + timedelta(days=1)
+    if "next week" in query:
+        monday = today + timedelta(days=7 - today.weekday())
+        return "due next week", monday, monday + timedelta(days=6)
+    if "this month" in query:
+        return "due this month", today, date(today.year, today.month, calendar.monthrange(today.year, today.month)[1])
+    if "this week" in query or "week" in query:
+        return "due this week", today, today + timedelta(days=6 - today.weekday())
+    return None
+
+def _category_token(category: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", category.lower())
+
+WORD_RE = re.compile(r"[a-z0-9'-]+")
+COUNT_RE = re.compile(r"\b(how many|number of|count)\b")
+TOP_SENDERS_RE = re.compile(r"\b(top|most (frequent|active))\s+senders?\b|\bwho\s+(sends|emails|mails|writes)\s+(me\s+)?(the\s+)?most\b")
+# Words an aggregate question may contain besides a category; anything else goes to the LLM
+QUESTION_WORDS = {
+    "how", "many", "much", "number", "of", "count", "do", "does", "did", "i", "have", "are", "is", "there",
+    "my", "in", "the", "a", "emails", "email", "messages", "message", "mails", "inbox", "unread", "total",
+    "due", "overdue", "deadline", "deadlines", "today", "tomorrow", "this", "next", "week", "month",
+    "action", "items", "item", "tasks", "task", "todos", "pending", "open", "what", "what's", "whats",
+    "with", "me", "got", "left", "still", "and", "currently", "right", "now", "who", "top", "senders",
+    "sender", "most", "frequent", "active", "sends", "mails", "writes", "to", "for", "all",
+}
+# Periods are only understood for due dates; "emails this week" needs arrival dates, so the LLM answers it
+TIME_WORDS = {"today", "tomorrow", "this", "next", "week", "month"}
+
+
+class InboxDigest:
+    """Aggregates over the inbox, kept current through store listeners."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.store = None
+        # Store version the aggregates reflect, and the render cached for it
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self.rendered: Optional[Tuple[Tuple[int, date], str]] = None
+        self.total = 0
+        self.unread = 0
+        self.categories: Counter = Counter()
+        self.unread_by_category: Counter = Counter()
+        self.senders: Counter = Counter()
+        # email id -> what it contributed, so updates and deletes can be undone
+        self.entries: Dict[str, tuple] = {}
+        # Sorted (due ordinal, email id, n, task, deadline) and (timestamp, email id)
+        self.action_items: List[tuple] = []
+        self.recent: List[Tuple[float, str]] = []
+        self.one_liners: Dict[str, str] = {}
+
+    def attach(self, store):
+        self.store = store
+        with self.lock:
+            for email in store.get_all_emails():
+                self._add(email)
+            self.version = store.version
+        store.add_listener(self.on_store_event)
+
+    def on_store_event(self, event: str, email: Optional[Email]):
+        with self.lock:
+            if event == "clear":
+                self._reset()
+            elif event == "upsert":
+                self._remove(email.id)
+                self._add(email)
+            elif event == "delete":
+                self._remove(email.id)
+            # Listeners run under the store's write lock, right after the version bump
+            self.version = self.store.version if self.store else self.version + 1
+
+    def _add(self, email: Email):
+        category = email.category or "Uncategorized"
+        sender = email.sender.lower()
+        received = email.timestamp.date()
+        items = []
+        for n, item in enumerate(email.action_items or []):
+            if not isinstance(item, dict) or not item.get("task"):
+                continue
+            due = parse_deadline(item.get("deadline"), received)
+            entry = (due.toordinal() if due else UNDATED, email.id, n, item["task"], item.get("deadline"))
+            bisect.insort(self.action_items, entry)
+            items.append(entry)
+        recent_key = (email.timestamp.timestamp(), email.id)
+        bisect.insort(self.recent, recent_key)
+
+        summary = email.summary or email.body
+        if len(summary) > 120:
+            summary = summary[:117] + "..."
+        self.one_liners[email.id] = f"- [{category}] {email.sender}: {email.subject} | {' '.join(summary.split())}\n"
+        self.entries[email.id] = (category, sender, email.read, recent_key, items, email.subject)
+        self.total += 1
+        self.categories[category] += 1
+        self.senders[sender] += 1
+        if not email.read:
+            self.unread += 1
+            self.unread_by_category[category] += 1
+
+    def _remove(self, email_id: str):
+        entry = self.entries.pop(email_id, None)
+        if entry is None:
+            return
+        category, sender, read, recent_key, items, _ = entry
+        for item in items:
+            del self.action_items[bisect.bisect_left(self.action_items, item)]
+        del self.recent[bisect.bisect_left(self.recent, recent_key)]
+        del self.one_liners[email_id]
+        self.total -= 1
+        for counter, key in ((self.categories, category), (self.senders, sender)) + (() if read else ((self.unread_by_category, category),)):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+        if not read:
+            self.unread -= 1
+
+    def _item_line(self, item: tuple) -> str:
+        due, email_id, _, task, deadline = item
+        when = date.fromordinal(due).isoformat() if due != UNDATED else (deadline or "no deadline")
+        _, sender, _, _, _, subject = self.entries[email_id]
+        return f"- [{when}] {task} (from {sender}: {subject})\n"
+
+    def render(self, today: Optional[date] = None) -> str:
+        """The digest as chat context; only re-rendered after the store changed."""
+        today = today or date.today()
+        with self.lock:
+            key = (self.version, today)
+            if self.rendered and self.rendered[0] == key:
+                return self.rendered[1]
+            lines = [f"Inbox Digest: {self.total} emails, {self.unread} unread\n"]
+            if self.categories:
+                by_category = ", ".join(
+                    f"{category} {count}" + (f" ({self.unread_by_category[category]} unread)" if self.unread_by_category[category] else "")
+                    for category, count in self.categories.most_common()
+                )
+                lines.append(f"By category: {by_category}\n")
+            if self.senders:
+                top = ", ".join(f"{sender} ({count})" for sender, count in self.senders.most_common(DIGEST_TOP_SENDERS))
+                lines.append(f"Top senders: {top}\n")
+            if self.action_items:
+                overdue = bisect.bisect_left(self.action_items, (today.toordinal(),))
+                lines.append(f"Action items ({len(self.action_items)} total, {overdue} overdue), by due date:\n")
+                lines.extend(self._item_line(item) for item in self.action_items[:DIGEST_MAX_ACTION_ITEMS])
+            if self.recent:
+                lines.append("Most recent emails:\n")
+                lines.extend(self.one_liners[email_id] for _, email_id in reversed(self.recent[-DIGEST_RECENT_EMAILS:]))
+            text = "".join(lines)
+            self.rendered = (key, text)
+            return text
+
+    def _match_category(self, words: List[str]) -> Optional[str]:
+        tokens = {_category_token(c): c for c in self.categories}
+        for word in words:
+            token = _category_token(word)
+            for candidate in (token, token[:-1] if token.endswith("s") else None):
+                if candidate and candidate in tokens:
+                    return tokens[candidate]
+        return None
+
+    def answer(self, query: str, today: Optional[date] = None) -> Optional[str]:
+        """
+        Answer counting questions about categories, unread mail, action items
+        and deadlines, or top senders, straight from the digest. Returns None
+        for anything else (including counts with other conditions, such as a
+        sender or topic) so the question goes to the LLM.
+        """
+        today = today or date.today()
+        text = query.lower()
+        words = WORD_RE.findall(text)
+        with self.lock:
+            category = self._match_category(words)
+            category_tokens = {_category_token(category)} if category else set()
+            leftover = [w for w in words if w not in QUESTION_WORDS and _category_token(w) not in category_tokens
+                        and _category_token(w).rstrip("s") not in category_tokens]
+            if leftover:
+                return None
+            if TOP_SENDERS_RE.search(text):
+                if not self.senders:
+                    return "Your inbox is empty."
+                top = "\n".join(f"- {sender}: {count} emails" for sender, count in self.senders.most_common(DIGEST_TOP_SENDERS))
+                return f"Your top senders:\n{top}"
+            if not COUNT_RE.search(text):
+                return None
+            return self._count_answer(text, words, category, today)
+
+    def _count_answer(self, text: str, words: List[str], category: Optional[str], today: date) -> Optional[str]:
+        label = f"{category} emails" if category else "emails"
+        wants_items = any(w in ("due", "overdue", "deadline", "deadlines", "action", "task", "tasks", "items") for w in words)
+        if wants_items:
+            window = due_window(text, today)
+            if window:
+                name, first, last = window
+                start = bisect.bisect_left(self.action_items, (first.toordinal(),))
+                end = bisect.bisect_left(self.action_items, (last.toordinal() + 1,))
+                items = self.action_items[start:end]
+            else:
+                name, items = "pending", self.action_items
+            if category:
+                items = [item for item in items if self.entries[item[1]][0] == category]
+            emails = len({item[1] for item in items})
+            answer = f"{len(items)} action items {name} across {emails} {label}."
+            if items and window:
+                answer += "\n" + "".join(self._item_line(item) for item in items[:DIGEST_MAX_ACTION_ITEMS]).rstrip("\n")
+            return answer
+        if any(w in TIME_WORDS for w in words):
+            return None
+        if "unread" in words:
+            count = self.unread_by_category[category] if category else self.unread
+            return f"You have {count} unread {label}."
+        if category:
+            unread = self.unread_by_category[category]
+            return f"You have {self.categories[category]} {label} ({unread} unread)."
+        return f"Your inbox has {self.total} emails ({self.unread} unread)."
+
+# The current tenant's instance (see services.tenants)
+inbox_digest = TenantLocal("inbox_digest")
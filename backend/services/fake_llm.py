@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+def _fake_category(email_part: str) -> str:
+    if "unsubscribe" in email_part or "newsletter" in email_part or "weekly" in email_part:
+        return "Newsletter"
+    if "winner" in email_part or "lottery" in email_part or "click here" in email_part:
+        return "Spam"
+    if "please" in email_part or "can you" in email_part or "required" in email_part:
+        return "To-Do"
+    return "Important"
+
+def _fake_action_items(email_part: str) -> List[dict]:
+    if "please" in email_part or "review" in email_part:
+        return [{"task": "Review and respond", "deadline": None}]
+    return []
+
+def default_responder(prompt: str) -> str:
+    """
+    Very small rule-of-thumb responder so the fake model returns output
+    the real parsers accept (single-word categories, ActionItemList and
+    EmailExtraction JSON).
+    """
+    lowered = prompt.lower()
+    email_part = lowered.rsplit("email content:", 1)[-1]
+
+    if '{"results": [' in lowered:
+        # Batch classification: "### Email id: <id>" sections
+        sections = re.split(r"^### email id: ", prompt, flags=re.MULTILINE | re.IGNORECASE)[1:]
+        results = []
+        for section in sections:
+            email_id, _, body = section.partition("\n")
+            results.append({"id": email_id.strip(), "category": _fake_category(body.lower())})
+        return json.dumps({"results": results})
+
+    if '"summary"' in lowered and '"category"' in lowered:
+        category = _fake_category(email_part)
+        first_line = email_part.strip().split("\n", 1)[0][:120]
+        return json.dumps({
+            "category": category,
+            "action_items": _fake_action_items(email_part) if category in ("To-Do", "Important") else [],
+            "summary": f"Email about: {first_line}",
+        })
+
+    if '"items"' in lowered or "actionitem" in lowered:
+        return json.dumps({"items": _fake_action_items(email_part)})
+
+    if "return only the category name" in lowered or "categorize this email" in lowered:
+        return _fake_category(email_part)
+
+    return "This is a response from the fake model."
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic in-process chat model used for tests and benchmarks.
+    Adds artificial latency so concurrency behaviour can be measured
+    without calling OpenAI. Streaming yields one word at a time, with
+    `latency` before the first token and `token_latency` between tokens.
+    `jitter` adds up to that many seconds per call, derived from the prompt
+    so repeated runs wait exactly as long.
+    """
+    latency: float = 0.05
+    jitter: float = 0.0
+    token_latency: float = 0.0
+    responder: Optional[Callable[[str], str]] = None
+    model_name: str = "fake-chat"
+    # Usage counters, handy for comparing processing strategies
+    call_count: int = 0
+    prompt_chars: int = 0
+    completion_chars: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        response = (self.responder or default_responder)(prompt)
+        self.call_count += 1
+        self.prompt_chars += len(prompt)
+        self.completion_chars += len(response)
+        return response
+
+    def _delay(self, messages: List[BaseMessage]) -> float:
+        if not self.jitter:
+            return self.latency
+        prompt = "\n".join(str(m.content) for m in messages)
+        fraction = int.from_bytes(hashlib.blake2b(prompt.encode("utf-8"), digest_size=4).digest(), "big") / 2 ** 32
+        return self.latency + self.jitter * fraction
+
+    def _message(self, messages: List[BaseMessage]) -> AIMessage:
+        prompt_chars = self.prompt_chars
+        content = self._respond(messages)
+        # Reported like a provider would, at ~4 characters per token
+        input_tokens = max(1, (self.prompt_chars - prompt_chars) // 4)
+        output_tokens = max(1, len(content) // 4)
+        return AIMessage(content=content, usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens})
+
+    def reset_usage(self):
+        self.call_count = 0
+        self.prompt_chars = 0
+        self.completion_chars = 0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._delay(messages))
+        message = self._message(messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._delay(messages))
+        message = self._message(messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        text = self._respond(messages)
+        words = text.split(" ")
+        return [w + " " for w in words[:-1]] + [words[-1]]
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._delay(messages))
+        for i, token in enumerate(self._tokens(messages)):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._delay(messages))
+        for i, token in enumerate(self._tokens(messages)):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
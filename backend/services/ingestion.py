@@ -1,53 +1,168 @@
 import json
 import os
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
 from models import Email
 from services.store import store
+from services.result_cache import content_hash
 from datetime import datetime
 import threading
 import time
 
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Fall back to polling when watchdog is not installed
+    Observer = None
+    FileSystemEventHandler = object
+
 DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "mock_inbox.json")
+# Source tag of the emails synced from DATA_PATH
+MOCK_SOURCE = "mock_inbox"
+
+# Polling fallback interval and quiet period before reloading after a change event
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "2"))
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "0.3"))
+
+# Called with the ids of new or changed emails so they can be queued for processing
+new_email_handler: Optional[Callable[[List[str]], None]] = None
+
+def set_new_email_handler(handler: Callable[[List[str]], None]):
+    global new_email_handler
+    new_email_handler = handler
+
+def source_hash(email: Email) -> str:
+    """Hash of the fields that come from the mailbox (not the LLM-derived ones)."""
+    return content_hash("\0".join([email.sender, email.subject, email.body, email.timestamp.isoformat()]))
+
+def parse_email(item: Dict[str, Any]) -> Email:
+    # Convert timestamp string to datetime object
+    try:
+        item['timestamp'] = datetime.fromisoformat(item['timestamp'].replace('Z', '+00:00'))
+    except ValueError:
+        pass # Keep as is or handle error
+    return Email(**item)
+
+def upsert_emails(incoming: List[Email]) -> Dict[str, List[str]]:
+    """
+    Apply incoming emails by id and content hash inside one store batch.
+    Unchanged emails keep their category, action items and summary.
+    Returns the ids that were inserted, changed (content) and updated (read flag or source).
+    """
+    inserted, changed, updated = [], [], []
+    with store.batch():
+        for email in incoming:
+            existing = store.get_email(email.id)
+            if existing is None:
+                store.add_email(email)
+                inserted.append(email.id)
+            elif source_hash(existing) != source_hash(email):
+                # Content changed: previous LLM results no longer apply
+                store.update_email(email)
+                changed.append(email.id)
+            elif existing.read != email.read or (email.source and existing.source != email.source):
+                updated_email = existing.copy()
+                updated_email.read = email.read
+                updated_email.source = email.source or existing.source
+                store.update_email(updated_email)
+                updated.append(email.id)
+    return {"inserted": inserted, "changed": changed, "updated": updated}
+
+def queue_for_processing(email_ids: List[str]) -> int:
+    if email_ids and new_email_handler:
+        new_email_handler(email_ids)
+        return len(email_ids)
+    return 0
+
+def sync_emails(incoming: List[Email], source: str = MOCK_SOURCE) -> Dict[str, Any]:
+    """
+    Diff the incoming set against the emails of `source` and apply only the
+    inserts, updates and deletes. Incoming emails are tagged with `source`;
+    emails from other feeds, such as streamed imports, are never deleted.
+    """
+    for email in incoming:
+        email.source = source
+    with store.batch():
+        result = upsert_emails(incoming)
+        incoming_ids = {email.id for email in incoming}
+        deleted = [email.id for email in store.get_all_emails() if email.source == source and email.id not in incoming_ids]
+        for email_id in deleted:
+            store.delete_email(email_id)
+
+    queued = queue_for_processing(result["inserted"] + result["changed"])
+    touched = len(result["inserted"]) + len(result["changed"]) + len(result["updated"])
+    return {
+        "inserted": len(result["inserted"]),
+        "updated": len(result["changed"]) + len(result["updated"]),
+        "deleted": len(deleted),
+        "unchanged": len(incoming) - touched,
+        "queued_for_processing": queued,
+    }
 
-def load_mock_data():
-    """Loads mock emails from JSON file into the store."""
+def load_mock_data() -> Optional[Dict[str, Any]]:
+    """Loads mock emails from JSON file and applies the differences to the store."""
     if not os.path.exists(DATA_PATH):
         print(f"Warning: Mock data file not found at {DATA_PATH}")
-        return
+        return None
 
     with open(DATA_PATH, "r", encoding="utf-8") as f:
         data = json.load(f)
-    
-    # Clear existing emails before reloading
-    store.emails.clear()
-    
-    for item in data:
-        # Convert timestamp string to datetime object
-        try:
-            item['timestamp'] = datetime.fromisoformat(item['timestamp'].replace('Z', '+00:00'))
-        except ValueError:
-            pass # Keep as is or handle error
-            
-        email = Email(**item)
-        store.add_email(email)
-    
-    print(f"Loaded {len(data)} emails into store.")
+
+    result = sync_emails([parse_email(item) for item in data])
+    print(f"Synced {len(data)} emails into store: {result}")
+    return result
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, changed: threading.Event):
+        self.changed = changed
+        self.target = os.path.abspath(DATA_PATH)
+
+    def on_any_event(self, event):
+        # Ignore open/close-without-write events, which our own reads also produce
+        if event.event_type not in ("created", "modified", "moved", "closed"):
+            return
+        paths = [getattr(event, "src_path", None), getattr(event, "dest_path", None)]
+        if any(p and os.path.abspath(p) == self.target for p in paths):
+            self.changed.set()
+
+def _file_signature():
+    stat = os.stat(DATA_PATH)
+    return (stat.st_mtime_ns, stat.st_size)
 
 def watch_mock_data():
-    """Watch the mock_inbox.json file and reload when it changes."""
+    """Watch the mock_inbox.json file and sync the store when it changes."""
     if not os.path.exists(DATA_PATH):
         return
-    
-    last_modified = os.path.getmtime(DATA_PATH)
-    
+
+    changed = threading.Event()
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(_ChangeHandler(changed), os.path.dirname(os.path.abspath(DATA_PATH)), recursive=False)
+        observer.daemon = True
+        observer.start()
+        wait = lambda: changed.wait()
+    else:
+        last_signature = _file_signature()
+
+        def wait():
+            nonlocal last_signature
+            while True:
+                time.sleep(WATCH_POLL_INTERVAL)
+                try:
+                    signature = _file_signature()
+                except OSError:
+                    continue
+                if signature != last_signature:
+                    last_signature = signature
+                    return
+
     while True:
-        time.sleep(2)  # Check every 2 seconds
+        wait()
+        # Editors often write in several steps; wait for the file to settle
+        time.sleep(WATCH_DEBOUNCE)
+        changed.clear()
         try:
-            current_modified = os.path.getmtime(DATA_PATH)
-            if current_modified != last_modified:
-                print("📧 Detected changes in mock_inbox.json - reloading emails...")
-                load_mock_data()
-                last_modified = current_modified
+            print("📧 Detected changes in mock_inbox.json - syncing emails...")
+            load_mock_data()
         except Exception as e:
             print(f"Error watching file: {e}")
 
@@ -55,4 +170,5 @@ def start_file_watcher():
     """Start the file watcher in a background thread."""
     watcher_thread = threading.Thread(target=watch_mock_data, daemon=True)
     watcher_thread.start()
-    print("🔄 File watcher started - mock_inbox.json will auto-reload on changes")
+    mode = "file system events" if Observer is not None else f"polling every {WATCH_POLL_INTERVAL}s"
+    print(f"🔄 File watcher started ({mode}) - mock_inbox.json will auto-sync on changes")
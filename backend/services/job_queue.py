@@ -0,0 +1,385 @@
+"""
+Durable background jobs for email processing.
+
+Jobs and their per-email items are stored in SQLite, so progress survives
+restarts: jobs that were queued or running when the server stopped are
+queued again on startup and only their pending emails are processed.
+A pool of asyncio workers drains the queue. Emails that are already
+pending in an unfinished job are not queued a second time.
+Every database write runs on one writer thread, in submission order, so
+commits (and their fsyncs) never block the event loop. Reads use a
+separate connection, which WAL lets proceed during a write.
+Every job belongs to the tenant that submitted it and runs with that
+tenant current; tenants only see their own jobs.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from models import Job
+from services.processor import process_inbox
+from services.store import store
+from services.tenant_context import DEFAULT_TENANT, SHARD_COUNT, SHARD_INDEX, current_tenant_id, owns
+from services.tenants import tenants, TenantError
+
+# Number of jobs processed at the same time (each job still uses PROCESS_CONCURRENCY for its emails)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# One database per shard, so shard processes never share (or run) each other's jobs
+JOBS_DB_FILE = os.getenv("JOBS_DB_PATH", "jobs.db" if SHARD_COUNT == 1 else f"jobs.shard-{SHARD_INDEX}.db")
+
+ACTIVE_STATUSES = ("queued", "running")
+JOB_COLUMNS = "id, kind, status, params, error, stats, created_at, started_at, finished_at, tenant"
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class JobQueue:
+    def __init__(self, path: str = JOBS_DB_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        self.read_lock = threading.Lock()
+        self.read_conn = sqlite3.connect(path, check_same_thread=False)
+        # Single writer thread: keeps writes ordered (an email's result before its job's finish)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-writer")
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        # (tenant, email id) -> id of the unfinished job that will process it
+        self.active_emails: Dict[Tuple[str, str], str] = {}
+
+    def _create_schema(self):
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    error TEXT,
+                    stats TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    tenant TEXT NOT NULL DEFAULT 'default'
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    email_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    PRIMARY KEY (job_id, email_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items(job_id, status);
+            """)
+            # Job databases from before tenants: every job belonged to the default tenant
+            if "tenant" not in {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}:
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT NOT NULL DEFAULT 'default'")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_tenant ON jobs(tenant, created_at)")
+
+    # --- Lifecycle ---
+
+    def start(self, workers: int = None):
+        """
+        Start the worker pool on the running event loop and requeue unfinished jobs
+        of the tenants this process serves (other shards resume their own).
+        """
+        self.queue = asyncio.Queue()
+        with self.lock, self.conn:
+            unfinished = [row[0] for row in self.conn.execute(
+                "SELECT id, tenant FROM jobs WHERE status IN (?, ?) ORDER BY created_at", ACTIVE_STATUSES
+            ) if owns(row[1])]
+            self.conn.executemany("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'running'", [(i,) for i in unfinished])
+            for job_id, email_id, tenant in self.conn.execute(
+                "SELECT i.job_id, i.email_id, j.tenant FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                "WHERE j.status = 'queued' AND i.status = 'pending'"
+            ):
+                if owns(tenant):
+                    self.active_emails[(tenant, email_id)] = job_id
+        for job_id in unfinished:
+            self.queue.put_nowait(job_id)
+        if unfinished:
+            print(f"Resuming {len(unfinished)} unfinished jobs")
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(workers or JOB_WORKERS)]
+
+    async def stop(self):
+        """Cancel the workers. Jobs that were running stay unfinished and resume on the next start."""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def close(self):
+        # Let queued writes (per-email results) reach the database first
+        self.writer.shutdown(wait=True)
+        with self.lock:
+            self.conn.close()
+        with self.read_lock:
+            self.read_conn.close()
+
+    async def _write(self, fn, *args):
+        """Run a database write on the writer thread, with the caller's tenant current."""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.writer, context.run, fn, *args)
+
+    def _write_later(self, fn, *args):
+        """Queue a database write without waiting for it."""
+        future = self.writer.submit(contextvars.copy_context().run, fn, *args)
+        future.add_done_callback(lambda f: f.exception() and print(f"Error writing job database: {f.exception()}"))
+
+    # --- Submission ---
+
+    def _find_queued_inbox_job(self, tenant: str, params: Dict[str, Any]) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT id FROM jobs WHERE tenant = ? AND kind = 'process_inbox' AND status = 'queued' AND started_at IS NULL AND params = ?",
+            (tenant, json.dumps(params, sort_keys=True)),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _create(self, tenant: str, kind: str, params: Dict[str, Any], email_ids: List[str] = None) -> str:
+        job_id = f"job_{uuid.uuid4().hex[:12]}"
+        self.conn.execute(
+            "INSERT INTO jobs (id, kind, status, params, created_at, tenant) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(params, sort_keys=True), _now(), tenant),
+        )
+        if email_ids:
+            self.conn.executemany(
+                "INSERT INTO job_items (job_id, email_id, status) VALUES (?, ?, 'pending')",
+                [(job_id, email_id) for email_id in email_ids],
+            )
+            for email_id in email_ids:
+                self.active_emails[(tenant, email_id)] = job_id
+        return job_id
+
+    def _enqueue(self, job_id: str):
+        # Without a running worker pool the job stays queued in the database until start()
+        if self.queue is not None:
+            self.queue.put_nowait(job_id)
+
+    async def submit_inbox(self, concurrency: int = None, force: bool = False, batch_size: int = None) -> Tuple[Job, bool]:
+        """
+        Queue processing of the whole inbox. Emails are resolved when the job starts.
+        Returns the job and whether an identical queued job was reused.
+        """
+        params = {"concurrency": concurrency, "force": force, "batch_size": batch_size}
+        job_id, created = await self._write(self._submit_inbox, params)
+        if created:
+            self._enqueue(job_id)
+        return self.get_job(job_id, include_errors=False), not created
+
+    def _submit_inbox(self, params: Dict[str, Any]) -> Tuple[str, bool]:
+        tenant = current_tenant_id()
+        with self.lock, self.conn:
+            existing = self._find_queued_inbox_job(tenant, params)
+            return existing or self._create(tenant, "process_inbox", params), existing is None
+
+    async def submit_emails(self, email_ids: List[str], force: bool = False) -> Tuple[Job, bool]:
+        """
+        Queue processing of specific emails. Emails already pending in an unfinished
+        job are left to that job. Returns the job and whether the submission was
+        fully deduplicated into existing jobs. Raises ValueError for an empty list.
+        """
+        if not email_ids:
+            raise ValueError("No emails to process")
+        job_id, created = await self._write(self._submit_emails, email_ids, {"force": force})
+        if created:
+            self._enqueue(job_id)
+        return self.get_job(job_id, include_errors=False), not created
+
+    def _submit_emails(self, email_ids: List[str], params: Dict[str, Any]) -> Tuple[str, bool]:
+        force = params["force"]
+        tenant = current_tenant_id()
+        with self.lock, self.conn:
+            # A queued inbox-wide job will pick these emails up when it starts
+            inbox_job = next((
+                job_id for job_id, job_params in self.conn.execute(
+                    "SELECT id, params FROM jobs WHERE tenant = ? AND kind = 'process_inbox' AND status = 'queued' AND started_at IS NULL",
+                    (tenant,),
+                )
+                if json.loads(job_params)["force"] or not force
+            ), None)
+            if inbox_job:
+                job_id, created = inbox_job, False
+            else:
+                new_ids = list(dict.fromkeys(i for i in email_ids if (tenant, i) not in self.active_emails))
+                if new_ids:
+                    job_id, created = self._create(tenant, "process_emails", params, new_ids), True
+                else:
+                    job_id, created = self.active_emails[(tenant, email_ids[0])], False
+        return job_id, created
+
+    # --- Queries ---
+
+    def _counts(self, job_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        counts: Dict[str, Dict[str, int]] = {job_id: {} for job_id in job_ids}
+        placeholders = ",".join("?" * len(job_ids))
+        for job_id, status, n in self.read_conn.execute(
+            f"SELECT job_id, status, COUNT(*) FROM job_items WHERE job_id IN ({placeholders}) GROUP BY job_id, status",
+            job_ids,
+        ):
+            counts[job_id][status] = n
+        return counts
+
+    @staticmethod
+    def _to_job(row, counts: Dict[str, int], errors: Dict[str, str]) -> Job:
+        job_id, kind, status, params, error, stats, created_at, started_at, finished_at, tenant = row
+        return Job(
+            id=job_id,
+            tenant=tenant,
+            kind=kind,
+            status=status,
+            params=json.loads(params),
+            total=sum(counts.values()),
+            pending=counts.get("pending", 0),
+            processed=counts.get("processed", 0),
+            skipped=counts.get("skipped", 0),
+            failed=counts.get("failed", 0),
+            errors=errors,
+            error=error,
+            stats=json.loads(stats) if stats else None,
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at,
+        )
+
+    def get_job(self, job_id: str, include_errors: bool = True) -> Optional[Job]:
+        """The current tenant's job, or None."""
+        with self.read_lock:
+            row = self.read_conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ? AND tenant = ?", (job_id, current_tenant_id())).fetchone()
+            if row is None:
+                return None
+            errors = {}
+            if include_errors:
+                errors = dict(self.read_conn.execute(
+                    "SELECT email_id, error FROM job_items WHERE job_id = ? AND status = 'failed'", (job_id,)
+                ))
+            return self._to_job(row, self._counts([job_id])[job_id], errors)
+
+    def list_jobs(self, status: str = None, limit: int = 50) -> List[Job]:
+        """The current tenant's jobs newest first, without per-email errors."""
+        tenant = current_tenant_id()
+        with self.read_lock:
+            if status:
+                rows = self.read_conn.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs WHERE tenant = ? AND status = ? ORDER BY created_at DESC LIMIT ?", (tenant, status, limit)
+                ).fetchall()
+            else:
+                rows = self.read_conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE tenant = ? ORDER BY created_at DESC LIMIT ?", (tenant, limit)).fetchall()
+            counts = self._counts([row[0] for row in rows]) if rows else {}
+            return [self._to_job(row, counts[row[0]], {}) for row in rows]
+
+    # --- Execution ---
+
+    def _record(self, job_id: str, email_id: str, status: str, error: Optional[str]):
+        key = (current_tenant_id(), email_id)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE job_items SET status = ?, error = ? WHERE job_id = ? AND email_id = ?",
+                (status, error, job_id, email_id),
+            )
+            if self.active_emails.get(key) == job_id:
+                del self.active_emails[key]
+
+    def _finish(self, job_id: str, status: str, error: str = None, stats: Dict[str, Any] = None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, stats = ?, finished_at = ? WHERE id = ?",
+                (status, error, json.dumps(stats) if stats else None, _now(), job_id),
+            )
+            for key in [k for k, j in self.active_emails.items() if j == job_id]:
+                del self.active_emails[key]
+
+    def _begin(self, job_id: str) -> Tuple[Dict[str, Any], List[str]]:
+        """Mark the job running and return its params and pending email ids."""
+        with self.lock, self.conn:
+            kind, params, started_at = self.conn.execute(
+                "SELECT kind, params, started_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            params = json.loads(params)
+            if kind == "process_inbox" and started_at is None:
+                # Resolve the inbox when the job first starts; emails queued in other jobs stay there
+                tenant = current_tenant_id()
+                email_ids = [e for e in store.snapshot().emails if params["force"] or (tenant, e) not in self.active_emails]
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO job_items (job_id, email_id, status) VALUES (?, ?, 'pending')",
+                    [(job_id, email_id) for email_id in email_ids],
+                )
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (_now(), job_id),
+            )
+            pending = [row[0] for row in self.conn.execute(
+                "SELECT email_id FROM job_items WHERE job_id = ? AND status = 'pending'", (job_id,)
+            )]
+            for email_id in pending:
+                self.active_emails[(current_tenant_id(), email_id)] = job_id
+        return params, pending
+
+    async def _run(self, job_id: str):
+        params, pending = await self._write(self._begin, job_id)
+        print(f"Job {job_id} started: {len(pending)} emails pending")
+        try:
+            stats = await process_inbox(
+                concurrency=params.get("concurrency"),
+                force=params.get("force", False),
+                batch_size=params.get("batch_size"),
+                email_ids=pending,
+                on_result=lambda email_id, status, error: self._write_later(self._record, job_id, email_id, status, error),
+            )
+        except asyncio.CancelledError:
+            # Shutdown: leave the job running so it resumes on the next start
+            raise
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            await self._write(self._finish, job_id, "failed", str(e))
+            return
+
+        await self._write(self._complete, job_id, stats)
+        print(f"Job {job_id} completed: {stats}")
+
+    def _complete(self, job_id: str, stats: Dict[str, Any]):
+        # Emails that process_inbox did not report on were deleted or could not be processed
+        with self.lock:
+            leftover = [row[0] for row in self.conn.execute(
+                "SELECT email_id FROM job_items WHERE job_id = ? AND status = 'pending'", (job_id,)
+            )]
+        for email_id in leftover:
+            if store.get_email(email_id) is None:
+                self._record(job_id, email_id, "skipped", "Email was deleted")
+            else:
+                self._record(job_id, email_id, "failed", "Not processed (are the default prompts missing?)")
+        self._finish(job_id, "completed", stats=stats)
+
+    def _tenant_of(self, job_id: str) -> Optional[str]:
+        with self.read_lock:
+            row = self.read_conn.execute("SELECT tenant FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                # Runs with the job's tenant current, and keeps it loaded meanwhile
+                with tenants.use(self._tenant_of(job_id) or DEFAULT_TENANT):
+                    await self._run(job_id)
+            except TenantError as e:
+                # Left queued; it resumes when the server serving the tenant restarts
+                print(f"Job {job_id} not run: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error running job {job_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+# Global job queue instance
+job_queue = JobQueue()
@@ -0,0 +1,99 @@
+"""
+Registry of LLM backends and per-task routing.
+
+A backend is either a chat model (used through LangChain chains) or a local
+classifier that only answers categorization. Each task can be routed to its
+own backend with LLM_ROUTE_<TASK>, e.g.
+
+    LLM_ROUTE_CATEGORIZE=local        # naive Bayes on CPU, escalates when unsure
+    LLM_ROUTE_ACTION_ITEMS=openai-mini
+    LLM_ROUTE_CHAT=openai
+
+Tasks without a route use the default backend (LLM_BACKEND). Classifier
+predictions below their confidence threshold are escalated to the chat
+backend named by LLM_ESCALATION_BACKEND (default: the default backend).
+Extra backends can be added with register_backend().
+"""
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+# Load backend/.env before any model or routing settings are read
+load_dotenv()
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+OPENAI_CHEAP_MODEL = os.getenv("OPENAI_CHEAP_MODEL", "gpt-4o-mini")
+
+TASKS = ("categorize", "action_items", "combined", "chat", "draft")
+LLM_ROUTES: Dict[str, str] = {
+    task: os.environ[f"LLM_ROUTE_{task.upper()}"] for task in TASKS if os.getenv(f"LLM_ROUTE_{task.upper()}")
+}
+LLM_ESCALATION_BACKEND = os.getenv("LLM_ESCALATION_BACKEND")
+
+@dataclass
+class Backend:
+    name: str
+    # "chat": a LangChain chat model; "classifier": has predict(subject, sender, body) -> (label, confidence), threshold and model_id
+    kind: str
+    model: Any
+    model_name: str
+
+BACKEND_FACTORIES: Dict[str, Callable[[], Backend]] = {}
+
+def register_backend(name: str, factory: Callable[[], Backend]):
+    """Make a backend available to LLM_BACKEND / LLM_ROUTE_<TASK>. It is created on first use."""
+    BACKEND_FACTORIES[name] = factory
+
+def _chat_openai(model_name: str):
+    from langchain_openai import ChatOpenAI
+    # Retries are handled by invoke_with_retry so backoff is applied consistently
+    return ChatOpenAI(model=model_name, openai_api_key=os.getenv("OPENAI_API_KEY"), temperature=0, max_retries=0)
+
+def _fake():
+    from services.fake_llm import FakeChatModel
+    return Backend("fake", "chat", FakeChatModel(latency=float(os.getenv("FAKE_LLM_LATENCY", "0.05")), jitter=float(os.getenv("FAKE_LLM_JITTER", "0"))), "fake-chat")
+
+def _local():
+    from services.local_classifier import local_classifier
+    return Backend("local", "classifier", local_classifier, "local")
+
+register_backend("openai", lambda: Backend("openai", "chat", _chat_openai(OPENAI_MODEL), OPENAI_MODEL))
+register_backend("openai-mini", lambda: Backend("openai-mini", "chat", _chat_openai(OPENAI_CHEAP_MODEL), OPENAI_CHEAP_MODEL))
+register_backend("fake", _fake)
+register_backend("local", _local)
+
+
+class BackendRegistry:
+    """Creates each backend once and shares it between the tasks routed to it."""
+    def __init__(self):
+        self.instances: Dict[str, Backend] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Backend:
+        backend = self.instances.get(name)
+        if backend is not None:
+            return backend
+        with self._lock:
+            if name not in self.instances:
+                if name not in BACKEND_FACTORIES:
+                    raise ValueError(f"Unknown LLM backend '{name}' (available: {', '.join(sorted(BACKEND_FACTORIES))})")
+                self.instances[name] = BACKEND_FACTORIES[name]()
+            return self.instances[name]
+
+    def get_chat(self, name: str) -> Backend:
+        backend = self.get(name)
+        if backend.kind != "chat":
+            raise ValueError(f"LLM backend '{name}' is a {backend.kind}, not a chat model")
+        return backend
+
+    def set(self, name: str, backend: Backend):
+        """Replace a backend instance (e.g. with a fake in tests)."""
+        with self._lock:
+            self.instances[name] = backend
+
+backends = BackendRegistry()
+
+def route_for(task: str) -> Optional[str]:
+    return LLM_ROUTES.get(task)
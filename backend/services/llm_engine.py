@@ -1,11 +1,21 @@
 import os
+import asyncio
+import random
+import time
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser, PydanticOutputParser
-from typing import Dict, Any, List
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.exceptions import OutputParserException
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
 import json
-from models import ActionItemList
+from functools import lru_cache
+from models import ActionItemList, EmailExtraction, BatchClassification
+from services.llm_backends import Backend, backends, route_for, LLM_ROUTES, LLM_ESCALATION_BACKEND
+from services.prompt_prep import prepare_email, prepare_email_async
+from services.result_cache import result_cache, content_hash
+from services.response_cache import response_cache, make_key as response_key
+from services.metrics import tracer, record_llm_usage, record_cache, LLM_REQUESTS, LLM_LATENCY, LLM_FIRST_TOKEN, LLM_RETRIES, LLM_PARSE_FAILURES
 
 load_dotenv()
 
@@ -14,13 +24,182 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     print("Warning: OPENAI_API_KEY not found in environment variables.")
 
-# Initialize OpenAI Model
-llm = ChatOpenAI(model="gpt-4o", openai_api_key=OPENAI_API_KEY, temperature=0)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
 
-async def process_email_with_prompt(email_content: str, prompt_template: str, output_json: bool = False, system_template: str = None) -> Any:
+# Per-request timeout and retry settings for rate-limited calls
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))
+
+# Initialize the default model; tasks can be routed elsewhere with LLM_ROUTE_<TASK>
+_default_backend = backends.get_chat(LLM_BACKEND)
+llm = _default_backend.model
+MODEL_NAME = _default_backend.model_name
+
+# Local classifier decisions vs escalations to a chat model
+routing_stats = {"local": 0, "escalated": 0}
+
+def set_llm(new_llm, model_name: str = None):
+    """Swap the default chat model used by every task without its own route (e.g. a FakeChatModel in tests)."""
+    global llm, MODEL_NAME
+    llm = new_llm
+    if model_name:
+        MODEL_NAME = model_name
+
+def set_route(task: str, backend_name: Optional[str]):
+    """Route a task to a registered backend, or back to the default model with None."""
+    if backend_name is None:
+        LLM_ROUTES.pop(task, None)
+    else:
+        backends.get(backend_name)
+        LLM_ROUTES[task] = backend_name
+
+def _routed_backend(task: str) -> Optional[Backend]:
+    name = route_for(task)
+    return backends.get(name) if name else None
+
+def _escalation_model() -> Tuple[Any, str]:
+    if LLM_ESCALATION_BACKEND:
+        backend = backends.get_chat(LLM_ESCALATION_BACKEND)
+        return backend.model, backend.model_name
+    return llm, MODEL_NAME
+
+def _chat_route(task: str) -> Tuple[Any, str]:
+    backend = _routed_backend(task)
+    if backend is None:
+        return llm, MODEL_NAME
+    if backend.kind == "classifier":
+        return _escalation_model()
+    return backend.model, backend.model_name
+
+def llm_for(task: str):
+    """Chat model for a task. Tasks routed to a classifier get the escalation model."""
+    return _chat_route(task)[0]
+
+def model_name_for(task: str) -> str:
+    """Name of the chat model serving a task, used in result cache keys."""
+    return _chat_route(task)[1]
+
+def classifier_for(task: str):
+    backend = _routed_backend(task)
+    return backend.model if backend is not None and backend.kind == "classifier" else None
+
+def local_category(subject: str, sender: str, body: str, record: bool = True) -> Optional[str]:
+    """
+    Category from the classifier routed for categorization, or None when no
+    classifier is routed or it is not confident enough (escalate to the LLM).
+    Local decisions take microseconds, so they are not cached.
+    """
+    classifier = classifier_for("categorize")
+    if classifier is None:
+        return None
+    label, confidence = classifier.predict(subject, sender, body)
+    confident = bool(label) and confidence >= classifier.threshold
+    if record:
+        routing_stats["local" if confident else "escalated"] += 1
+    return label if confident else None
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    if getattr(e, "status_code", None) == 429:
+        return True
+    return "RateLimit" in type(e).__name__
+
+class UsageRecorder(BaseCallbackHandler):
+    """
+    Collects token usage from the chat model runs inside one chain invocation.
+    Uses the usage the provider reports, or ~4 characters per token when it
+    reports none (e.g. streamed responses).
+    """
+    run_inline = True
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.prompt_chars = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.prompt_chars = sum(len(str(m.content)) for batch in messages for m in batch)
+
+    def on_llm_end(self, response, **kwargs):
+        generations = [g for batch in response.generations for g in batch]
+        usages = [getattr(getattr(g, "message", None), "usage_metadata", None) for g in generations]
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if any(usages):
+            self.prompt_tokens += sum(u.get("input_tokens", 0) for u in usages if u)
+            self.completion_tokens += sum(u.get("output_tokens", 0) for u in usages if u)
+        elif token_usage:
+            self.prompt_tokens += token_usage.get("prompt_tokens", 0)
+            self.completion_tokens += token_usage.get("completion_tokens", 0)
+        else:
+            self.prompt_tokens += self.prompt_chars // 4
+            self.completion_tokens += sum(len(g.text) for g in generations) // 4
+
+def _failure_status(e: Exception) -> str:
+    if isinstance(e, asyncio.TimeoutError):
+        return "timeout"
+    if _is_rate_limit_error(e):
+        return "rate_limited"
+    if isinstance(e, OutputParserException):
+        return "parse_error"
+    return "error"
+
+def _record_call(task: str, model: str, status: str, duration: float, usage: UsageRecorder):
+    LLM_REQUESTS.inc(task=task, model=model, status=status)
+    LLM_LATENCY.observe(duration, task=task, model=model)
+    if status == "parse_error":
+        LLM_PARSE_FAILURES.inc(task=task)
+    if usage.prompt_tokens or usage.completion_tokens:
+        record_llm_usage(task, model, usage.prompt_tokens, usage.completion_tokens)
+
+async def invoke_with_retry(chain, input_data: Dict[str, Any], task: str = "other", model: str = None) -> Any:
+    """
+    Invoke a chain with a per-request timeout.
+    Rate-limit errors and timeouts are retried with exponential backoff and jitter.
+    Every attempt is traced and recorded in the LLM metrics under `task`.
+    """
+    model = model or model_name_for(task)
+    attempt = 0
+    while True:
+        usage = UsageRecorder()
+        start = time.perf_counter()
+        error = None
+        with tracer.span(f"llm.{task}", model=model, attempt=attempt + 1) as span:
+            try:
+                result = await asyncio.wait_for(chain.ainvoke(input_data, config={"callbacks": [usage]}), timeout=LLM_TIMEOUT)
+                status = "success"
+            except Exception as e:
+                status = _failure_status(e)
+                error = e
+            span.update(status=status, prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            _record_call(task, model, status, time.perf_counter() - start, usage)
+        if error is None:
+            return result
+        if status not in ("timeout", "rate_limited") or attempt >= LLM_MAX_RETRIES:
+            raise error
+        LLM_RETRIES.inc(task=task, reason=status)
+        delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)) * (0.5 + random.random() / 2)
+        print(f"LLM call failed ({type(error).__name__}), retrying in {delay:.1f}s (attempt {attempt + 1}/{LLM_MAX_RETRIES})")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+# Parsers and their format instructions are built once
+ACTION_ITEMS_PARSER = PydanticOutputParser(pydantic_object=ActionItemList)
+ACTION_ITEMS_FORMAT = ACTION_ITEMS_PARSER.get_format_instructions()
+EXTRACTION_PARSER = PydanticOutputParser(pydantic_object=EmailExtraction)
+EXTRACTION_FORMAT = EXTRACTION_PARSER.get_format_instructions()
+
+@lru_cache(maxsize=64)
+def _email_prompt(template: str) -> ChatPromptTemplate:
+    """Compiled template for a prompt's text; editing a prompt yields a new cache entry."""
+    return ChatPromptTemplate.from_template(template)
+
+async def process_email_with_prompt(email_content: str, prompt_template: str, output_json: bool = False, system_template: str = None, task: str = None) -> Any:
     """
     Process an email using a specific prompt template.
     Combines system_template (formatting rules) with user template (categorization logic).
+    The body is cleaned and fitted into the token budget of `task`
+    (defaults to action_items for JSON output, categorize otherwise).
     """
     # Combine both templates: system rules + user logic
     if system_template:
@@ -28,72 +207,275 @@ async def process_email_with_prompt(email_content: str, prompt_template: str, ou
         actual_template = system_template + "\n\nAdditional Instructions:\n" + prompt_template
     else:
         actual_template = prompt_template
-    
-    prompt = ChatPromptTemplate.from_template(actual_template + "\n\nEmail Content:\n{email_content}")
-    
+
+    task = task or ("action_items" if output_json else "categorize")
+    prepared = await prepare_email_async(email_content, task)
+
     if output_json:
-        parser = PydanticOutputParser(pydantic_object=ActionItemList)
         # Append format instructions to prompt
-        prompt = ChatPromptTemplate.from_template(prompt_template + "\n\n{format_instructions}\n\nEmail Content:\n{email_content}")
-        chain = prompt | llm | parser
-        input_data = {"email_content": email_content, "format_instructions": parser.get_format_instructions()}
+        prompt = _email_prompt(prompt_template + "\n\n{format_instructions}\n\nEmail Content:\n{email_content}")
+        chain = prompt | llm_for(task) | ACTION_ITEMS_PARSER
+        input_data = {"email_content": prepared.text, "format_instructions": ACTION_ITEMS_FORMAT}
     else:
-        chain = prompt | llm | StrOutputParser()
-        input_data = {"email_content": email_content}
+        prompt = _email_prompt(actual_template + "\n\nEmail Content:\n{email_content}")
+        chain = prompt | llm_for(task) | StrOutputParser()
+        input_data = {"email_content": prepared.text}
     
     try:
-        result = await chain.ainvoke(input_data)
+        result = await invoke_with_retry(chain, input_data, task=task)
         if output_json and isinstance(result, ActionItemList):
              return [item.dict() for item in result.items]
         return result
     except Exception as e:
-        print(f"Error processing email: {e}")
+        # Recorded in llm_requests_total by status; callers treat None as "no result"
+        print(f"Error processing email ({task}, {type(e).__name__}): {e}")
+        return None
+
+SUMMARIZE_SECTION_PROMPT = ChatPromptTemplate.from_template(
+    "Condense this part of an email to at most {max_words} words. Keep every request, question, "
+    "deadline, date, amount and name. Return only the condensed text.\n\n{section}"
+)
+
+async def summarize_for_budget(text: str, budget: int) -> Optional[str]:
+    """
+    Compact an over-budget email body by summarizing its sections in parallel
+    (TRUNCATION_STRATEGY=summary). Results are cached by body, budget and model.
+    """
+    key = content_hash(f"{content_hash(text)}|compact:{budget}|{MODEL_NAME}")
+    cached = result_cache.get(key)
+    record_cache("summarize", cached is not None)
+    if cached is not None:
+        return cached
+
+    section_chars = budget * 8
+    sections = [text[i:i + section_chars] for i in range(0, len(text), section_chars)]
+    # ~0.75 words per token, shared between the sections
+    max_words = max(20, int(budget * 0.75 / len(sections)))
+    chain = SUMMARIZE_SECTION_PROMPT | llm | StrOutputParser()
+    try:
+        parts = await asyncio.gather(*(invoke_with_retry(chain, {"section": s, "max_words": max_words}, task="summarize", model=MODEL_NAME) for s in sections))
+    except Exception as e:
+        print(f"Error summarizing email for token budget: {e}")
+        return None
+    summary = "\n".join(part.strip() for part in parts)
+    result_cache.set(key, [], summary)
+    return summary
+
+def prompt_instructions(prompt) -> str:
+    """Full instructions for a PromptConfig: system rules followed by the user template."""
+    if prompt.system_template:
+        return prompt.system_template + "\n\nAdditional Instructions:\n" + prompt.template
+    return prompt.template
+
+COMBINED_EXTRACTION_PROMPT = ChatPromptTemplate.from_template(
+    "You are an email assistant. Perform all three tasks below on the email in a single response.\n\n"
+    "Task 1 - Category:\n{category_instructions}\n\n"
+    "Task 2 - Action items:\n{action_instructions}\n"
+    "Only extract action items when the category is To-Do or Important; otherwise return an empty list.\n\n"
+    "Task 3 - Summary:\nSummarize the email in one or two sentences.\n\n"
+    "{format_instructions}\n\n"
+    "Email Content:\n{email_content}"
+)
+
+async def extract_email_combined(email_content: str, categorize_prompt, action_prompt) -> Optional[Dict[str, Any]]:
+    """
+    Categorize, extract action items and summarize an email in one LLM call.
+    Returns None if the call fails or the response does not match EmailExtraction,
+    so callers can fall back to the two-step path.
+    """
+    prepared = await prepare_email_async(email_content, "combined")
+    chain = COMBINED_EXTRACTION_PROMPT | llm_for("combined") | EXTRACTION_PARSER
+    input_data = {
+        "category_instructions": prompt_instructions(categorize_prompt),
+        "action_instructions": prompt_instructions(action_prompt),
+        "format_instructions": EXTRACTION_FORMAT,
+        "email_content": prepared.text,
+    }
+    try:
+        result = await invoke_with_retry(chain, input_data, task="combined")
+    except Exception as e:
+        print(f"Error in combined extraction: {e}")
+        return None
+    return {
+        "category": result.category.strip(),
+        "action_items": [item.dict() for item in result.action_items],
+        "summary": result.summary.strip(),
+    }
+
+BATCH_CLASSIFY_PROMPT = ChatPromptTemplate.from_template(
+    "{category_instructions}\n\n"
+    "You will be given {count} emails, each introduced by its id. Apply the categorization rules above to every email "
+    "independently, but respond in the JSON format below instead of a single word.\n"
+    "Respond with JSON only, in the form {{\"results\": [{{\"id\": \"<email id>\", \"category\": \"<category>\"}}]}}, "
+    "with exactly one entry per email id.\n\n"
+    "{emails}"
+)
+
+def batch_classification_input(items: List[Tuple[str, str]], categorize_prompt) -> Dict[str, Any]:
+    """Template variables for classifying (email_id, body) pairs in one request."""
+    emails = "\n\n".join(f"### Email id: {email_id}\n{prepare_email(body, 'batch').text}" for email_id, body in items)
+    return {
+        "category_instructions": prompt_instructions(categorize_prompt),
+        "count": len(items),
+        "emails": emails,
+    }
+
+def parse_batch_classification(text: str, expected_ids: List[str]) -> Optional[Dict[str, str]]:
+    """
+    Parse a batch classification response. Returns {email_id: category} only if the
+    response is valid JSON with exactly one result per expected id, otherwise None.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("{"):]
+    try:
+        parsed = BatchClassification(**json.loads(text))
+    except Exception:
         return None
+    ids = [item.id for item in parsed.results]
+    if len(ids) != len(set(ids)) or set(ids) != set(expected_ids):
+        return None
+    return {item.id: item.category.strip() for item in parsed.results}
+
+async def classify_batch(items: List[Tuple[str, str]], categorize_prompt) -> Dict[str, str]:
+    """
+    Classify several (email_id, body) pairs with one request per batch.
+    Malformed or incomplete responses are split in half and retried; a single
+    email that still fails goes through the regular one-email prompt.
+    """
+    results: Dict[str, str] = {}
+
+    async def run(chunk: List[Tuple[str, str]]):
+        chain = BATCH_CLASSIFY_PROMPT | llm_for("categorize") | StrOutputParser()
+        parsed = None
+        try:
+            text = await invoke_with_retry(chain, batch_classification_input(chunk, categorize_prompt), task="batch", model=model_name_for("categorize"))
+            parsed = parse_batch_classification(text, [email_id for email_id, _ in chunk])
+            if parsed is None:
+                LLM_PARSE_FAILURES.inc(task="batch")
+        except Exception as e:
+            print(f"Error in batch classification: {e}")
+        if parsed is not None:
+            results.update(parsed)
+            return
+        if len(chunk) == 1:
+            email_id, body = chunk[0]
+            category = await process_email_with_prompt(body, categorize_prompt.template, output_json=False, system_template=categorize_prompt.system_template)
+            if category:
+                results[email_id] = category.strip()
+            return
+        print(f"Malformed batch of {len(chunk)} emails, splitting and retrying")
+        mid = len(chunk) // 2
+        await asyncio.gather(run(chunk[:mid]), run(chunk[mid:]))
+
+    if items:
+        await run(items)
+    return results
+
+INBOX_CHAT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a helpful email assistant. Answer the user's question based on the following inbox summary."),
+    ("user", "Inbox Summary:\n{inbox_summary}\n\nQuestion: {user_query}")
+])
+
+EMAIL_CHAT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a helpful email assistant. Answer the user's question based on the following email content."),
+    ("user", "Email Content:\n{email_content}\n\nQuestion: {user_query}")
+])
+
+DRAFT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a helpful email assistant. Your goal is to draft email replies."),
+    ("user", "Email Content:\n{email_content}\n\nInstructions: {instructions}\n\nDraft Reply:")
+])
+
+DEFAULT_DRAFT_INSTRUCTIONS = "Draft a polite and professional reply to this email. Keep it concise."
+
+def _template_version(prompt: ChatPromptTemplate) -> str:
+    """Hash of a built-in prompt's message templates, so editing one invalidates cached responses."""
+    return content_hash("\0".join(getattr(m, "prompt", m).template for m in prompt.messages))[:16]
+
+EMAIL_CHAT_PROMPT_VERSION = _template_version(EMAIL_CHAT_PROMPT)
+DRAFT_PROMPT_VERSION = _template_version(DRAFT_PROMPT)
+
+async def stream_chain(chain, input_data: Dict[str, Any], label: str, task: str = "chat") -> AsyncIterator[str]:
+    """
+    Stream a chain's output chunk by chunk and log time-to-first-token.
+    Closing the generator (e.g. on client disconnect) cancels the upstream call.
+    """
+    model = model_name_for(task)
+    usage = UsageRecorder()
+    start = time.perf_counter()
+    first_token_at = None
+    status = "cancelled"
+    try:
+        async for chunk in chain.astream(input_data, config={"callbacks": [usage]}):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                LLM_FIRST_TOKEN.observe(first_token_at - start, task=task, model=model)
+                print(f"[{label}] time to first token: {first_token_at - start:.3f}s")
+            yield chunk
+        status = "success"
+    except Exception as e:
+        status = _failure_status(e)
+        raise
+    finally:
+        _record_call(task, model, status, time.perf_counter() - start, usage)
+        print(f"[{label}] stream {'completed' if status == 'success' else status} after {time.perf_counter() - start:.3f}s")
 
 async def chat_with_inbox(inbox_summary: str, user_query: str) -> str:
     """
     Chat with the entire inbox context.
     """
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a helpful email assistant. Answer the user's question based on the following inbox summary."),
-        ("user", "Inbox Summary:\n{inbox_summary}\n\nQuestion: {user_query}")
-    ])
-    
-    chain = prompt | llm | StrOutputParser()
+    chain = INBOX_CHAT_PROMPT | llm_for("chat") | StrOutputParser()
     
     try:
-        return await chain.ainvoke({"inbox_summary": inbox_summary, "user_query": user_query})
+        return await invoke_with_retry(chain, {"inbox_summary": inbox_summary, "user_query": user_query}, task="chat")
     except Exception as e:
         return f"Error: {str(e)}"
 
-async def chat_with_email(email_content: str, user_query: str) -> str:
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a helpful email assistant. Answer the user's question based on the following email content."),
-        ("user", "Email Content:\n{email_content}\n\nQuestion: {user_query}")
-    ])
-    
-    chain = prompt | llm | StrOutputParser()
-    
+async def chat_with_email(email_content: str, user_query: str, fresh: bool = False) -> str:
+    """
+    Answer a question about one email. Repeated and concurrent identical
+    questions are served from the response cache; `fresh` asks the model again.
+    """
+    chain = EMAIL_CHAT_PROMPT | llm_for("chat") | StrOutputParser()
+    key = response_key("chat", email_content, user_query, EMAIL_CHAT_PROMPT_VERSION, model_name_for("chat"))
+
     try:
-        return await chain.ainvoke({"email_content": email_content, "user_query": user_query})
+        return await response_cache.get_or_compute(
+            key,
+            lambda: invoke_with_retry(chain, {"email_content": prepare_email(email_content, "chat").text, "user_query": user_query}, task="chat"),
+            task="chat", fresh=fresh,
+        )
     except Exception as e:
         return f"Error: {str(e)}"
 
-async def generate_draft_reply(email_content: str, instructions: str = None) -> str:
+async def generate_draft_reply(email_content: str, instructions: str = None, fresh: bool = False) -> str:
     """
-    Generate a draft reply for an email.
+    Generate a draft reply for an email. Cached like chat_with_email; pass
+    `fresh` to get a new draft instead of the cached one.
     """
-    if not instructions:
-        instructions = "Draft a polite and professional reply to this email. Keep it concise."
-        
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a helpful email assistant. Your goal is to draft email replies."),
-        ("user", "Email Content:\n{email_content}\n\nInstructions: {instructions}\n\nDraft Reply:")
-    ])
-    
-    chain = prompt | llm | StrOutputParser()
-    
+    chain = DRAFT_PROMPT | llm_for("draft") | StrOutputParser()
+    instructions = instructions or DEFAULT_DRAFT_INSTRUCTIONS
+    key = response_key("draft", email_content, instructions, DRAFT_PROMPT_VERSION, model_name_for("draft"))
+
     try:
-        return await chain.ainvoke({"email_content": email_content, "instructions": instructions})
+        return await response_cache.get_or_compute(
+            key,
+            lambda: invoke_with_retry(chain, {"email_content": prepare_email(email_content, "draft").text, "instructions": instructions}, task="draft"),
+            task="draft", fresh=fresh,
+        )
     except Exception as e:
         return f"Error generating draft: {str(e)}"
+
+def stream_chat_with_inbox(inbox_summary: str, user_query: str) -> AsyncIterator[str]:
+    chain = INBOX_CHAT_PROMPT | llm_for("chat") | StrOutputParser()
+    return stream_chain(chain, {"inbox_summary": inbox_summary, "user_query": user_query}, "chat_inbox")
+
+def stream_chat_with_email(email_content: str, user_query: str) -> AsyncIterator[str]:
+    chain = EMAIL_CHAT_PROMPT | llm_for("chat") | StrOutputParser()
+    return stream_chain(chain, {"email_content": prepare_email(email_content, "chat").text, "user_query": user_query}, "chat_email")
+
+def stream_draft_reply(email_content: str, instructions: str = None) -> AsyncIterator[str]:
+    chain = DRAFT_PROMPT | llm_for("draft") | StrOutputParser()
+    return stream_chain(chain, {"email_content": prepare_email(email_content, "draft").text, "instructions": instructions or DEFAULT_DRAFT_INSTRUCTIONS}, "draft", task="draft")
@@ -0,0 +1,214 @@
+"""
+Local CPU email classifier trained on past LLM category labels.
+
+A multinomial naive Bayes model over subject, sender domain and body words,
+with no dependencies beyond the standard library. It predicts a category and
+a confidence; the LLM engine escalates to a chat model when the confidence is
+below LOCAL_CLASSIFIER_THRESHOLD.
+
+Usage (from the backend directory):
+    python -m services.local_classifier train [--holdout 0.2]
+    python -m services.local_classifier evaluate
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from models import Email
+from services.retrieval import tokenize
+
+LOCAL_CLASSIFIER_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", "local_classifier.json")
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+# Training is refused below this many labelled emails
+LOCAL_CLASSIFIER_MIN_EXAMPLES = int(os.getenv("LOCAL_CLASSIFIER_MIN_EXAMPLES", "20"))
+
+# Words beyond this are ignored, so long bodies don't drown out the subject
+MAX_FEATURE_TOKENS = 400
+
+def email_features(subject: str, sender: str, body: str) -> List[str]:
+    domain = sender.rsplit("@", 1)[-1].lower() if sender else ""
+    subject_tokens = [f"s:{t}" for t in tokenize(subject or "")]
+    return [f"from:{domain}"] + subject_tokens + tokenize(body or "")[:MAX_FEATURE_TOKENS]
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes with Laplace smoothing."""
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.doc_counts: Dict[str, int] = {}
+        self.term_counts: Dict[str, Dict[str, int]] = {}
+        self.totals: Dict[str, int] = {}
+        self.vocabulary: set = set()
+        self.model_id = "untrained"
+
+    def fit(self, documents: List[List[str]], labels: List[str]) -> "NaiveBayesClassifier":
+        counts: Dict[str, Counter] = {label: Counter() for label in labels}
+        for tokens, label in zip(documents, labels):
+            counts[label].update(tokens)
+        self._set_counts(dict(Counter(labels)), {label: dict(c) for label, c in counts.items()})
+        return self
+
+    def _set_counts(self, doc_counts: Dict[str, int], term_counts: Dict[str, Dict[str, int]]):
+        self.doc_counts = doc_counts
+        self.term_counts = term_counts
+        self.totals = {label: sum(c.values()) for label, c in term_counts.items()}
+        self.vocabulary = set().union(*term_counts.values()) if term_counts else set()
+        # Identifies the trained weights in cache keys, so retraining invalidates cached decisions
+        self.model_id = "nb-" + hashlib.sha256(json.dumps(self.to_dict(), sort_keys=True).encode()).hexdigest()[:12]
+
+    def predict(self, tokens: List[str]) -> Tuple[Optional[str], float]:
+        """Most likely label and its posterior probability."""
+        if not self.doc_counts:
+            return None, 0.0
+        known = [t for t in tokens if t in self.vocabulary]
+        n_docs = sum(self.doc_counts.values())
+        vocab_size = len(self.vocabulary)
+        scores = {}
+        for label, doc_count in self.doc_counts.items():
+            terms = self.term_counts[label]
+            denominator = math.log(self.totals[label] + self.alpha * vocab_size)
+            score = math.log(doc_count / n_docs)
+            for token in known:
+                score += math.log(terms.get(token, 0) + self.alpha) - denominator
+            scores[label] = score
+        # Naive Bayes posteriors saturate on long documents; temper by length before normalizing
+        temper = max(1.0, math.sqrt(len(known)))
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp((s - scores[best]) / temper) for s in scores.values())
+        return best, 1.0 / norm
+
+    def to_dict(self) -> dict:
+        return {"alpha": self.alpha, "doc_counts": self.doc_counts, "term_counts": self.term_counts}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NaiveBayesClassifier":
+        model = cls(alpha=data["alpha"])
+        model._set_counts(data["doc_counts"], data["term_counts"])
+        return model
+
+
+class LocalClassifier:
+    """Loads the trained model lazily and answers (category, confidence) queries."""
+    def __init__(self, path: str = LOCAL_CLASSIFIER_PATH, threshold: float = LOCAL_CLASSIFIER_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.model: Optional[NaiveBayesClassifier] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r") as f:
+                        self.model = NaiveBayesClassifier.from_dict(json.load(f))
+                    print(f"Loaded local classifier {self.model.model_id} from {self.path}")
+                except Exception as e:
+                    print(f"Error loading local classifier: {e}")
+            else:
+                print(f"No local classifier at {self.path}; every email will be escalated")
+            self._loaded = True
+
+    @property
+    def model_id(self) -> str:
+        self._ensure_loaded()
+        return self.model.model_id if self.model else "untrained"
+
+    def predict(self, subject: str, sender: str, body: str) -> Tuple[Optional[str], float]:
+        self._ensure_loaded()
+        if self.model is None:
+            return None, 0.0
+        return self.model.predict(email_features(subject, sender, body))
+
+    def set_model(self, model: NaiveBayesClassifier):
+        with self._lock:
+            self.model = model
+            self._loaded = True
+
+    def save(self):
+        if self.model is None:
+            return
+        data = self.model.to_dict()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+local_classifier = LocalClassifier()
+
+def llm_labelled(emails: List[Email]) -> List[Email]:
+    """Emails categorized by the LLM (older results have no decided_by and were all LLM decisions)."""
+    return [e for e in emails if e.category and e.decided_by in (None, "llm")]
+
+def train(emails: List[Email]) -> NaiveBayesClassifier:
+    """Fit a classifier on emails the LLM has already categorized."""
+    labelled = llm_labelled(emails)
+    if len(labelled) < LOCAL_CLASSIFIER_MIN_EXAMPLES:
+        raise ValueError(f"Need at least {LOCAL_CLASSIFIER_MIN_EXAMPLES} categorized emails to train, found {len(labelled)}")
+    return NaiveBayesClassifier().fit(
+        [email_features(e.subject, e.sender, e.body) for e in labelled],
+        [e.category for e in labelled],
+    )
+
+def evaluate(model: NaiveBayesClassifier, emails: List[Email], threshold: float = LOCAL_CLASSIFIER_THRESHOLD) -> Dict[str, float]:
+    """Accuracy overall and on the emails the classifier would decide without escalating."""
+    labelled = llm_labelled(emails)
+    confident = correct = confident_correct = 0
+    for email in labelled:
+        label, confidence = model.predict(email_features(email.subject, email.sender, email.body))
+        correct += label == email.category
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += label == email.category
+    total = max(1, len(labelled))
+    return {
+        "emails": len(labelled),
+        "accuracy": round(correct / total, 4),
+        "coverage": round(confident / total, 4),
+        "accuracy_when_confident": round(confident_correct / max(1, confident), 4),
+        "threshold": threshold,
+    }
+
+def main():
+    from services.store import store
+
+    parser = argparse.ArgumentParser(description="Train or evaluate the local email classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="Train on categorized emails in the store")
+    train_cmd.add_argument("--holdout", type=float, default=0.2, help="Share of emails held out for evaluation")
+    sub.add_parser("evaluate", help="Evaluate the saved classifier on the store")
+    args = parser.parse_args()
+
+    emails = llm_labelled(store.get_all_emails())
+    if args.command == "train":
+        random.Random(0).shuffle(emails)
+        cut = int(len(emails) * (1 - args.holdout))
+        try:
+            if args.holdout > 0 and cut < len(emails):
+                if cut < LOCAL_CLASSIFIER_MIN_EXAMPLES:
+                    # Too few emails to split; the full model can still be trained
+                    print(f"Warning: skipping holdout evaluation, the training split has {cut} emails (need {LOCAL_CLASSIFIER_MIN_EXAMPLES})")
+                else:
+                    print(json.dumps({"holdout": evaluate(train(emails[:cut]), emails[cut:])}, indent=2))
+            local_classifier.set_model(train(emails))
+        except ValueError as e:
+            raise SystemExit(str(e))
+        local_classifier.save()
+        print(f"Saved {local_classifier.model_id} trained on {len(emails)} emails to {local_classifier.path}")
+    else:
+        if local_classifier.model_id == "untrained":
+            raise SystemExit(f"No classifier at {local_classifier.path}; run `train` first")
+        print(json.dumps(evaluate(local_classifier.model, emails), indent=2))
+    store.close()
+
+if __name__ == "__main__":
+    main()
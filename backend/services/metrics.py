@@ -0,0 +1,319 @@
+"""
+In-process metrics and tracing, exported in the Prometheus text format at /metrics.
+
+Metrics are plain counters, gauges and histograms with labels, so no client
+library is needed. A trace covers one unit of work (a /process run, a chat
+request): every span inside it is timed, aggregated per stage and fed to
+the stage_duration_seconds histogram, and the most recent traces are kept
+in memory for /traces.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Recent traces kept for /traces, and raw spans kept per trace (stage totals are always complete)
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "50"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+# Log one structured line per finished trace (logger "traces", level INFO)
+TRACE_LOG = os.getenv("TRACE_LOG", "false").lower() == "true"
+
+trace_logger = logging.getLogger("traces")
+if TRACE_LOG and not trace_logger.handlers:
+    # Without a handler the INFO lines would be dropped unless the app configures logging
+    trace_logger.addHandler(logging.StreamHandler())
+    trace_logger.setLevel(logging.INFO)
+
+# USD per million (prompt, completion) tokens; extend or override with LLM_PRICING='{"model": [in, out]}'
+LLM_PRICING: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+LLM_PRICING.update({k: tuple(v) for k, v in json.loads(os.getenv("LLM_PRICING", "{}")).items()})
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    """A gauge set directly, or read from `callback` (returning a number) at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (), callback: Callable[[], float] = None):
+        super().__init__(name, description, labels)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            return [f"{self.name} {_number(self.callback())}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # Per-bucket counts (last one is +Inf), then sum and count
+                counts = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[0][bisect.bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self.lock:
+            items = sorted((key, ([*counts[0]], counts[1], counts[2])) for key, counts in self.values.items())
+        for key, (buckets, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), buckets):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        # Re-registering a name (e.g. a module reloaded in tests) returns the existing metric
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Iterable[str] = (), callback: Callable[[], float] = None) -> Gauge:
+        return self._register(Gauge(name, description, labels, callback))
+
+    def histogram(self, name: str, description: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"Error rendering metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+# Global registry and the metrics recorded across the services
+registry = MetricsRegistry()
+
+LLM_REQUESTS = registry.counter("llm_requests_total", "LLM call attempts by task, model and outcome", ("task", "model", "status"))
+LLM_LATENCY = registry.histogram("llm_request_duration_seconds", "Latency of one LLM call attempt", ("task", "model"))
+LLM_FIRST_TOKEN = registry.histogram("llm_time_to_first_token_seconds", "Time to the first streamed token", ("task", "model"))
+LLM_PROMPT_TOKENS = registry.counter("llm_prompt_tokens_total", "Prompt tokens sent", ("task", "model"))
+LLM_COMPLETION_TOKENS = registry.counter("llm_completion_tokens_total", "Completion tokens received", ("task", "model"))
+LLM_COST = registry.counter("llm_cost_usd_total", "Estimated spend from token usage and LLM_PRICING", ("task", "model"))
+LLM_RETRIES = registry.counter("llm_retries_total", "LLM calls retried after a timeout or rate limit", ("task", "reason"))
+LLM_PARSE_FAILURES = registry.counter("llm_parse_failures_total", "LLM responses that did not match the expected format", ("task",))
+CACHE_LOOKUPS = registry.counter("llm_cache_lookups_total", "LLM result cache lookups", ("task", "result"))
+EMAILS_PROCESSED = registry.counter("emails_processed_total", "Processed emails by the path that decided their category", ("decided_by",))
+STAGE_DURATION = registry.histogram("stage_duration_seconds", "Duration of traced processing stages", ("stage",))
+STORE_FLUSH = registry.histogram("store_flush_duration_seconds", "Time to write pending store changes to disk", ("backend",))
+STORE_FLUSH_ERRORS = registry.counter("store_flush_errors_total", "Failed writes of pending store changes", ("backend",))
+HTTP_LATENCY = registry.histogram("http_request_duration_seconds", "API request latency", ("method", "route", "status"))
+
+def record_llm_usage(task: str, model: str, prompt_tokens: int, completion_tokens: int):
+    LLM_PROMPT_TOKENS.inc(prompt_tokens, task=task, model=model)
+    LLM_COMPLETION_TOKENS.inc(completion_tokens, task=task, model=model)
+    price = LLM_PRICING.get(model)
+    if price:
+        LLM_COST.inc((prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000, task=task, model=model)
+
+def record_cache(task: str, hit: bool):
+    CACHE_LOOKUPS.inc(task=task, result="hit" if hit else "miss")
+
+
+class Trace:
+    """Timed spans for one unit of work, with per-stage totals."""
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.id = f"trace_{uuid.uuid4().hex[:12]}"
+        self.name = name
+        self.attrs = attrs
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.lock = threading.Lock()
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped_spans = 0
+        # stage -> [count, total seconds, self seconds (excluding nested spans), max seconds]
+        self.stages: Dict[str, List[float]] = {}
+
+    def record(self, name: str, start: float, duration: float, self_time: float, attrs: Dict[str, Any], parent: Optional[str]):
+        with self.lock:
+            stage = self.stages.setdefault(name, [0, 0.0, 0.0, 0.0])
+            stage[0] += 1
+            stage[1] += duration
+            stage[2] += self_time
+            stage[3] = max(stage[3], duration)
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append({
+                    "name": name, "parent": parent, "offset_ms": round((start - self.start) * 1000, 3),
+                    "duration_ms": round(duration * 1000, 3), **attrs,
+                })
+            else:
+                self.dropped_spans += 1
+
+    def summary(self, include_spans: bool = True) -> Dict[str, Any]:
+        with self.lock:
+            # Ranked by self time, so a parent stage doesn't hide the nested stage doing the work
+            stages = sorted(self.stages.items(), key=lambda item: item[1][2], reverse=True)
+            result = {
+                "id": self.id,
+                "name": self.name,
+                "attrs": self.attrs,
+                "started_at": self.started_at.isoformat(),
+                "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+                # Stages overlap when work runs concurrently, so totals can exceed the trace duration
+                "stages": [
+                    {"stage": name, "count": int(count), "total_ms": round(total * 1000, 3), "self_ms": round(own * 1000, 3), "max_ms": round(longest * 1000, 3)}
+                    for name, (count, total, own, longest) in stages
+                ],
+                "slowest_stage": stages[0][0] if stages else None,
+            }
+            if include_spans:
+                result["spans"] = list(self.spans)
+                result["dropped_spans"] = self.dropped_spans
+        return result
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, history: int = TRACE_HISTORY):
+        self.lock = threading.Lock()
+        self.traces: deque = deque(maxlen=history)
+
+    def current(self) -> Optional[Trace]:
+        return _current_trace.get()
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Start a trace, or join the current one if this work is already being traced."""
+        current = _current_trace.get()
+        if current is not None:
+            with self.span(name, **attrs):
+                yield current
+            return
+        trace = Trace(name, attrs)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            trace.duration = time.perf_counter() - trace.start
+            _current_trace.reset(token)
+            with self.lock:
+                self.traces.append(trace)
+            if TRACE_LOG:
+                # One structured line per finished trace, for log-based tooling
+                summary = trace.summary(include_spans=False)
+                summary["stages"] = summary["stages"][:5]
+                trace_logger.info("TRACE %s", json.dumps(summary, default=str))
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time a stage. The yielded dict can be filled with attributes (status, tokens, ...)."""
+        start = time.perf_counter()
+        parent = _current_span.get()
+        # (name, seconds spent in nested spans); concurrent children can add up to more than the span itself
+        current = (name, [0.0])
+        token = _current_span.set(current)
+        try:
+            yield attrs
+        finally:
+            duration = time.perf_counter() - start
+            _current_span.reset(token)
+            if parent is not None:
+                parent[1][0] += duration
+            STAGE_DURATION.observe(duration, stage=name)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.record(name, start, duration, max(0.0, duration - current[1][0]), attrs, parent[0] if parent else None)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self.lock:
+            return next((t for t in self.traces if t.id == trace_id), None)
+
+    def recent(self, limit: int = 20) -> List[Trace]:
+        with self.lock:
+            return list(self.traces)[-limit:][::-1]
+
+# Global tracer instance
+tracer = Tracer()
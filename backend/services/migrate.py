@@ -0,0 +1,46 @@
+"""
+One-shot migration of persistence.json into the SQLite backend.
+
+Usage (from the backend directory):
+    python -m services.migrate --source persistence.json --target persistence.db
+"""
+import argparse
+from types import SimpleNamespace
+from typing import Dict
+from models import Email, PromptConfig, Draft, Rule
+from services.storage import JsonFileBackend, SqliteBackend, JSON_PERSISTENCE_FILE, SQLITE_PERSISTENCE_FILE
+
+def migrate_json_to_sqlite(source: str = JSON_PERSISTENCE_FILE, target: str = SQLITE_PERSISTENCE_FILE, overwrite: bool = False) -> Dict[str, int]:
+    """Copy every email, prompt, draft and rule from a JSON persistence file into a SQLite database."""
+    data = JsonFileBackend(source).load()
+    if data is None:
+        raise FileNotFoundError(f"Persistence file not found: {source}")
+
+    # Validate through the models so the database only ever holds well-formed rows
+    state = SimpleNamespace(
+        emails={k: Email(**v) for k, v in data.get("emails", {}).items()},
+        prompts={k: PromptConfig(**v) for k, v in data.get("prompts", {}).items()},
+        drafts={k: Draft(**v) for k, v in data.get("drafts", {}).items()},
+        rules={k: Rule(**v) for k, v in data.get("rules", {}).items()},
+    )
+
+    backend = SqliteBackend(target)
+    try:
+        if backend.load() is not None and not overwrite:
+            raise ValueError(f"{target} already contains data (use --overwrite to replace it)")
+        backend.bind(state)
+        backend.save_all()
+    finally:
+        backend.close()
+
+    return {"emails": len(state.emails), "prompts": len(state.prompts), "drafts": len(state.drafts), "rules": len(state.rules)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate persistence.json to SQLite")
+    parser.add_argument("--source", default=JSON_PERSISTENCE_FILE)
+    parser.add_argument("--target", default=SQLITE_PERSISTENCE_FILE)
+    parser.add_argument("--overwrite", action="store_true", help="Replace existing data in the target database")
+    args = parser.parse_args()
+
+    counts = migrate_json_to_sqlite(args.source, args.target, overwrite=args.overwrite)
+    print(f"Migrated {counts['emails']} emails, {counts['prompts']} prompts, {counts['drafts']} drafts and {counts['rules']} rules into {args.target}")
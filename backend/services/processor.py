@@ -1,102 +1,426 @@
-from typing import List
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 from services.store import store
-from services.llm_engine import process_email_with_prompt
-from models import Email
+from services import llm_engine
+from services.llm_engine import process_email_with_prompt, extract_email_combined, classify_batch
+from services.result_cache import result_cache
+from services.rules import rule_engine
+from services.dedup import dedup_index, NearDupIndex, DEDUP_ENABLED
+from services.metrics import tracer, record_cache, EMAILS_PROCESSED
+from services.tenants import tenants
+from models import Email, PromptConfig
 
-async def process_inbox():
-    """
-    Iterates through all emails in the store and processes them if they haven't been processed.
-    """
-    emails = store.get_all_emails()
+# Maximum number of emails processed at the same time
+PROCESS_CONCURRENCY = int(os.getenv("PROCESS_CONCURRENCY", "8"))
+
+# Categories that get action item extraction
+ACTION_CATEGORIES = ["To-Do", "Important"]
+
+# "combined": one LLM call for category + action items + summary (falls back to two_step on parse failure)
+# "two_step": separate categorize and action item calls
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "combined")
+
+# Emails per categorization request in batch mode (0 or 1 disables batching)
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "0"))
+# Longer emails are never packed into a batch
+BATCH_MAX_EMAIL_CHARS = int(os.getenv("BATCH_MAX_EMAIL_CHARS", "2000"))
+
+def _get_processing_prompts():
     prompts = store.get_all_prompts()
-    
     categorize_prompt = next((p for p in prompts if p.id == "categorize"), None)
     action_prompt = next((p for p in prompts if p.id == "action_items"), None)
-    
-    if not categorize_prompt or not action_prompt:
-        print("Error: Default prompts not found.")
-        return
+    return categorize_prompt, action_prompt
 
-    # Clear existing categories and action items to force re-processing
-    print("Clearing existing categories and action items...")
-    for email in emails:
-        email.category = None
-        email.action_items = []
-    
-    for email in emails:
-        try:
-            print(f"Processing email: {email.id}")
-            
-            # Categorize
-            category = await process_email_with_prompt(
-                email.body, 
-                categorize_prompt.template, 
-                output_json=False,
-                system_template=categorize_prompt.system_template
-            )
-            if category:
-                # Use the LLM response directly without validation
-                email.category = category.strip()
-                
-            # Extract action items ONLY for To-Do and Important emails
-            if email.category in ["To-Do", "Important"]:
-                action_items = await process_email_with_prompt(
-                    email.body, 
-                    action_prompt.template, 
-                    output_json=True,
-                    system_template=action_prompt.system_template
-                )
-                if action_items:
-                    if isinstance(action_items, list) and len(action_items) > 0:
-                        email.action_items = action_items
-                    else:
-                        email.action_items = []
-            else:
-                # For Newsletter and Spam, no action items
-                email.action_items = []
-            
+def _pre_decide(email: Email, record: bool = True) -> Optional[Tuple[str, str]]:
+    """
+    (category, decided_by) from the paths that need no LLM call: rules, the
+    sender's history, then the local classifier if one is routed. None means
+    the email goes to the LLM.
+    """
+    decision = rule_engine.classify(email)
+    if decision:
+        return decision
+    category = llm_engine.local_category(email.subject, email.sender, email.body, record=record)
+    if category:
+        return category, "local_classifier"
+    return None
+
+async def _run_prompt(email: Email, prompt: PromptConfig, output_json: bool, force: bool = False) -> Any:
+    """Run a prompt against an email, serving the result from the cache when possible."""
+    task = "action_items" if output_json else "categorize"
+    key = result_cache.make_key(email.body, prompt, llm_engine.model_name_for(task))
+    if not force:
+        cached = result_cache.get(key)
+        record_cache(task, cached is not None)
+        if cached is not None:
+            return cached
+
+    result = await process_email_with_prompt(
+        email.body,
+        prompt.template,
+        output_json=output_json,
+        system_template=prompt.system_template,
+        task=task,
+    )
+    if result is not None:
+        if isinstance(result, str):
+            result = result.strip()
+        result_cache.set(key, prompt.id, result)
+    return result
+
+async def _run_combined(email: Email, categorize_prompt: PromptConfig, action_prompt: PromptConfig, force: bool = False) -> Optional[Dict[str, Any]]:
+    """Run the single-call extraction, serving the result from the cache when possible."""
+    key = result_cache.make_combined_key(email.body, [categorize_prompt, action_prompt], llm_engine.model_name_for("combined"), "combined")
+    if not force:
+        cached = result_cache.get(key)
+        record_cache("combined", cached is not None)
+        if cached is not None:
+            return cached
+
+    result = await extract_email_combined(email.body, categorize_prompt, action_prompt)
+    if result is not None:
+        if result["category"] not in ACTION_CATEGORIES:
+            result["action_items"] = []
+        result_cache.set(key, [categorize_prompt.id, action_prompt.id], result)
+    return result
+
+def _action_items_up_to_date(email: Email, action_prompt: PromptConfig) -> bool:
+    if email.category not in ACTION_CATEGORIES:
+        return True
+    action_items = result_cache.get(result_cache.make_key(email.body, action_prompt, llm_engine.model_name_for("action_items")))
+    return action_items is not None and (email.action_items or []) == action_items
+
+def _cluster_source_id(email: Email) -> Optional[str]:
+    if email.decided_by and email.decided_by.startswith("cluster:"):
+        return email.decided_by.split(":", 1)[1]
+    return None
+
+def _fanned_out_up_to_date(email: Email, source_id: str, categorize_prompt: PromptConfig, action_prompt: PromptConfig) -> bool:
+    """A fanned-out email is current while its source is, is still a near-duplicate, and the copied results match."""
+    source = store.get_email(source_id)
+    if source is None or source.decided_by != "llm":
+        return False
+    if (email.category, email.action_items or [], email.summary) != (source.category, source.action_items or [], source.summary):
+        return False
+    return dedup_index.is_near_duplicate(email, source) and _is_up_to_date(source, categorize_prompt, action_prompt)
+
+def _is_up_to_date(email: Email, categorize_prompt: PromptConfig, action_prompt: PromptConfig) -> bool:
+    """True if the email's stored results match the current rules, or the cache for the current prompts and model."""
+    decision = _pre_decide(email, record=False)
+    if decision is not None:
+        return (email.category, email.decided_by) == decision and _action_items_up_to_date(email, action_prompt)
+    source_id = _cluster_source_id(email)
+    if source_id:
+        return _fanned_out_up_to_date(email, source_id, categorize_prompt, action_prompt)
+    if email.decided_by != "llm":
+        return False
+
+    combined = result_cache.get(result_cache.make_combined_key(email.body, [categorize_prompt, action_prompt], llm_engine.model_name_for("combined"), "combined"))
+    if combined is not None and email.category == combined["category"] and (email.action_items or []) == combined["action_items"]:
+        return True
+
+    category = result_cache.get(result_cache.make_key(email.body, categorize_prompt, llm_engine.model_name_for("categorize")))
+    if category is None or email.category != category:
+        return False
+    return _action_items_up_to_date(email, action_prompt)
+
+async def _process_email(email: Email, categorize_prompt: Optional[PromptConfig], action_prompt: Optional[PromptConfig], force: bool = False, mode: str = None):
+    """
+    Categorize one email, extract its action items and write it back to the store. Returns the updated email.
+    Rules, sender history and the local classifier are tried before the LLM; `decided_by` records the path.
+    """
+    # Work on a copy so concurrent readers never see a half-updated email
+    email = email.copy()
+    with tracer.span("pre_decide"):
+        decision = _pre_decide(email)
+    if decision is not None:
+        email.category, email.decided_by = decision
+    elif (mode or EXTRACTION_MODE) == "combined" and categorize_prompt and action_prompt:
+        extraction = await _run_combined(email, categorize_prompt, action_prompt, force=force)
+        if extraction is not None:
+            email.category = extraction["category"]
+            email.action_items = extraction["action_items"]
+            email.summary = extraction["summary"]
+            email.decided_by = "llm"
             store.update_email(email)
-            print(f"Finished processing {email.id}: category={email.category}")
-        except Exception as e:
-            print(f"Error processing email {email.id}: {e}")
+            return email
+        print(f"Combined extraction failed for {email.id}, falling back to two-step processing")
 
-async def process_single_email(email_id: str):
-    """Process a single email by ID."""
-    email = store.get_email(email_id)
-    if not email:
-        return
-        
-    prompts = store.get_all_prompts()
-    categorize_prompt = next((p for p in prompts if p.id == "categorize"), None)
-    action_prompt = next((p for p in prompts if p.id == "action_items"), None)
-    
-    if categorize_prompt:
-        category = await process_email_with_prompt(
-            email.body, 
-            categorize_prompt.template, 
-            output_json=False,
-            system_template=categorize_prompt.system_template
-        )
+    if categorize_prompt and decision is None:
+        category = await _run_prompt(email, categorize_prompt, output_json=False, force=force)
         if category:
             # Use the LLM response directly without validation
-            email.category = category.strip()
+            email.category = category
+            email.decided_by = "llm"
 
     # Extract action items ONLY for To-Do and Important emails
-    if email.category in ["To-Do", "Important"]:
+    if email.category in ACTION_CATEGORIES:
         if action_prompt:
-            action_items = await process_email_with_prompt(
-                email.body, 
-                action_prompt.template, 
-                output_json=True,
-                system_template=action_prompt.system_template
-            )
-            if action_items:
-                if isinstance(action_items, list) and len(action_items) > 0:
-                    email.action_items = action_items
-                else:
-                    email.action_items = []
+            action_items = await _run_prompt(email, action_prompt, output_json=True, force=force)
+            if isinstance(action_items, list):
+                email.action_items = action_items
     else:
         # For Newsletter and Spam, no action items
         email.action_items = []
 
     store.update_email(email)
+    return email
+
+def _fan_out(source: Email, member: Email) -> Email:
+    """Copy an LLM-processed email's results onto a near-duplicate of it and write it back."""
+    email = member.copy()
+    email.category = source.category
+    email.action_items = [dict(item) for item in source.action_items or []]
+    email.summary = source.summary
+    email.decided_by = f"cluster:{source.id}"
+    store.update_email(email)
+    return email
+
+def _group_duplicates(pending: List[Email], categorize_prompt: PromptConfig, action_prompt: PromptConfig, force: bool = False):
+    """
+    Split pending emails into those that need processing and near-duplicates
+    that can copy another email's results. Returns (to_process, followers, ready):
+    `followers` maps a representative's id to the members that copy it once
+    processed; `ready` pairs an already processed, up-to-date cluster member
+    with pending members that copy it straight away.
+    """
+    index = dedup_index if dedup_index.attached else NearDupIndex.build(pending)
+    pending_ids = {e.id for e in pending}
+    to_process: List[Email] = []
+    groups: Dict[str, List[Email]] = {}
+    for email in pending:
+        cluster_id = index.cluster_id(email.id)
+        # Rules and the local classifier are cheaper than fan-out and decide per email
+        if cluster_id is None or _pre_decide(email, record=False) is not None:
+            to_process.append(email)
+        else:
+            groups.setdefault(cluster_id, []).append(email)
+
+    followers: Dict[str, List[Email]] = {}
+    ready: List[Tuple[Email, List[Email]]] = []
+    for cluster_id, members in groups.items():
+        source = None
+        if not force:
+            # A few processed members are enough to find a current one
+            for candidate_id in sorted(index.cluster_members(cluster_id) - pending_ids)[:3]:
+                candidate = store.get_email(candidate_id)
+                if candidate and candidate.decided_by == "llm" and _is_up_to_date(candidate, categorize_prompt, action_prompt):
+                    source = candidate
+                    break
+        if source is not None:
+            ready.append((source, members))
+            continue
+        representative, *rest = members
+        to_process.append(representative)
+        if rest:
+            followers[representative.id] = rest
+    return to_process, followers, ready
+
+async def _classify_in_batches(emails: List[Email], categorize_prompt: PromptConfig, batch_size: int, concurrency: int, force: bool = False) -> Tuple[int, Set[str]]:
+    """
+    Fill the categorize cache for short emails using multi-email requests,
+    so the per-email pass only has to extract action items.
+    Returns the number of batch requests made and the ids of the emails they categorized.
+    """
+    model_name = llm_engine.model_name_for("categorize")
+    keys = {e.id: result_cache.make_key(e.body, categorize_prompt, model_name) for e in emails}
+    todo = []
+    for email in emails:
+        if len(email.body) > BATCH_MAX_EMAIL_CHARS or not (force or result_cache.get(keys[email.id]) is None):
+            continue
+        # Emails settled without the LLM are left to the per-email pass
+        if _pre_decide(email, record=False) is None:
+            todo.append(email)
+    chunks = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+    tenant_slots = tenants.current().process_slots
+    classified: Set[str] = set()
+
+    async def run(chunk: List[Email]):
+        async with semaphore, tenant_slots:
+            results = await classify_batch([(e.id, e.body) for e in chunk], categorize_prompt)
+            for email_id, category in results.items():
+                result_cache.set(keys[email_id], categorize_prompt.id, category)
+                classified.add(email_id)
+
+    await asyncio.gather(*(run(chunk) for chunk in chunks))
+    return len(chunks), classified
+
+async def process_inbox(
+    concurrency: int = None,
+    force: bool = False,
+    mode: str = None,
+    batch_size: int = None,
+    email_ids: List[str] = None,
+    on_result: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    dedup: bool = None,
+) -> Dict[str, Any]:
+    """
+    Traced process_inbox run: the stats also carry the trace id (see /traces)
+    and the stages that took the most time.
+    """
+    with tracer.trace("process_inbox", emails=len(email_ids) if email_ids is not None else "all", force=force) as trace:
+        stats = await _process_inbox(concurrency, force, mode, batch_size, email_ids, on_result, dedup)
+    summary = trace.summary(include_spans=False)
+    stats["trace_id"] = trace.id
+    stats["slowest_stages"] = summary["stages"][:5]
+    return stats
+
+async def _process_inbox(
+    concurrency: int = None,
+    force: bool = False,
+    mode: str = None,
+    batch_size: int = None,
+    email_ids: List[str] = None,
+    on_result: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    dedup: bool = None,
+) -> Dict[str, Any]:
+    """
+    Processes new or changed emails concurrently, at most `concurrency` at a time.
+    `email_ids` restricts the run to specific emails (e.g. newly ingested ones).
+    `on_result(email_id, status, error)` is called once per email with
+    status "processed", "skipped" or "failed".
+    Emails whose body, prompts and model are unchanged are skipped unless `force` is set.
+    With `batch_size` > 1, short emails are categorized several per request first.
+    With `dedup` (DEDUP_ENABLED by default), near-duplicate emails from the same
+    sender are processed once and the results copied to the rest of the cluster.
+    Returns throughput stats so the concurrency limit can be tuned.
+    """
+    if email_ids is None:
+        emails = store.get_all_emails()
+    else:
+        emails = [e for e in (store.get_email(i) for i in email_ids) if e is not None]
+    categorize_prompt, action_prompt = _get_processing_prompts()
+
+    if not categorize_prompt or not action_prompt:
+        print("Error: Default prompts not found.")
+        return {"processed": 0, "skipped": 0, "failed": 0, "batch_requests": 0, "deduplicated": 0, "decided_by": {}, "elapsed_seconds": 0.0, "emails_per_sec": 0.0}
+
+    with tracer.span("select_pending", emails=len(emails)):
+        if force:
+            pending = emails
+        else:
+            pending = [e for e in emails if not _is_up_to_date(e, categorize_prompt, action_prompt)]
+    print(f"{len(pending)} of {len(emails)} emails need processing")
+    if on_result:
+        pending_ids = {e.id for e in pending}
+        for email in emails:
+            if email.id not in pending_ids:
+                on_result(email.id, "skipped", None)
+
+    start = time.perf_counter()
+    # Emails a worker finished; near-duplicates copied from them count as deduplicated
+    processed = 0
+    failed: List[str] = []
+    decided_by: Counter = Counter()
+    to_process, followers, ready = pending, {}, []
+    if DEDUP_ENABLED if dedup is None else dedup:
+        with tracer.span("dedup_grouping", emails=len(pending)):
+            to_process, followers, ready = _group_duplicates(pending, categorize_prompt, action_prompt, force=force)
+
+    def fan_out(source: Email, members: List[Email]):
+        with tracer.span("fan_out", members=len(members)):
+            for member in members:
+                current = store.get_email(member.id)
+                if current is None:
+                    continue
+                _fan_out(source, current)
+                decided_by["cluster"] += 1
+                EMAILS_PROCESSED.inc(decided_by="cluster")
+                if on_result:
+                    on_result(member.id, "processed", None)
+
+    for source, members in ready:
+        fan_out(source, members)
+
+    batch_size = CLASSIFY_BATCH_SIZE if batch_size is None else batch_size
+    batch_requests = 0
+    # Emails the batch pass categorized; the per-email pass must not categorize them again
+    batch_classified: Set[str] = set()
+    if batch_size > 1:
+        with tracer.span("batch_classify", emails=len(to_process)):
+            batch_requests, batch_classified = await _classify_in_batches(to_process, categorize_prompt, batch_size, concurrency or PROCESS_CONCURRENCY, force=force)
+        # Categories now come from the fresh cache; the per-email pass only extracts action items
+        mode = "two_step"
+        if force:
+            # Forced emails the batch pass skipped (long bodies, pre-decided, failed batches) stay forced
+            for email in to_process:
+                if email.id in batch_classified:
+                    result_cache.delete(result_cache.make_key(email.body, action_prompt, llm_engine.model_name_for("action_items")))
+
+    semaphore = asyncio.Semaphore(concurrency or PROCESS_CONCURRENCY)
+    # The tenant's quota, shared with its other jobs running at the same time
+    tenant_slots = tenants.current().process_slots
+
+    async def worker(email: Email):
+        nonlocal processed
+        result = None
+        with tracer.span("slot_wait"):
+            await semaphore.acquire()
+            try:
+                await tenant_slots.acquire()
+            except BaseException:
+                semaphore.release()
+                raise
+        try:
+            # Pick up edits made while waiting for a slot, and don't resurrect deleted emails
+            current = store.get_email(email.id)
+            if current is not None:
+                print(f"Processing email: {email.id}")
+                with tracer.span("process_email", email_id=email.id):
+                    result = await _process_email(current, categorize_prompt, action_prompt, force=force and email.id not in batch_classified, mode=mode)
+                # "rule:<id>" counts as "rule"
+                path = (result.decided_by or "none").split(":", 1)[0]
+                decided_by[path] += 1
+                processed += 1
+                EMAILS_PROCESSED.inc(decided_by=path)
+                print(f"Finished processing {result.id}: category={result.category} ({result.decided_by})")
+                if on_result:
+                    on_result(result.id, "processed", None)
+        except Exception as e:
+            failed.append(email.id)
+            print(f"Error processing email {email.id}: {e}")
+            if on_result:
+                on_result(email.id, "failed", str(e))
+        finally:
+            tenant_slots.release()
+            semaphore.release()
+
+        members = followers.get(email.id)
+        if members:
+            if result is not None and result.decided_by == "llm":
+                fan_out(result, members)
+            else:
+                # Nothing trustworthy to copy, so the members are processed on their own
+                await asyncio.gather(*(worker(member) for member in members))
+
+    await asyncio.gather(*(worker(email) for email in to_process))
+    elapsed = time.perf_counter() - start
+    with tracer.span("save_cache"):
+        await result_cache.save()
+
+    stats = {
+        "processed": processed,
+        "skipped": len(emails) - len(pending),
+        "failed": len(failed),
+        "batch_requests": batch_requests,
+        "deduplicated": decided_by["cluster"],
+        "decided_by": dict(decided_by),
+        "elapsed_seconds": round(elapsed, 3),
+        "emails_per_sec": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    print(f"Processed {processed} emails in {elapsed:.2f}s ({stats['emails_per_sec']} emails/sec, concurrency={concurrency or PROCESS_CONCURRENCY})")
+    return stats
+
+async def process_single_email(email_id: str, force: bool = False, mode: str = None):
+    """Process a single email by ID."""
+    email = store.get_email(email_id)
+    if not email:
+        return
+
+    categorize_prompt, action_prompt = _get_processing_prompts()
+    await _process_email(email, categorize_prompt, action_prompt, force=force, mode=mode)
+    await result_cache.save()
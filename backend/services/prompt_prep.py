@@ -0,0 +1,176 @@
+"""
+Prompt preprocessing: strips quoted reply history, signatures, disclaimers and
+HTML from email bodies, counts tokens with a local tokenizer and fits each
+body into a per-task token budget before it is sent to the model.
+"""
+import html
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to a character estimate
+    tiktoken = None
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+# "head_tail": keep the start and end of the body; "summary": summarize over-budget bodies with the LLM
+TRUNCATION_STRATEGY = os.getenv("TRUNCATION_STRATEGY", "head_tail")
+
+# Token budget for the email body in each task's prompt
+TOKEN_BUDGETS: Dict[str, int] = {
+    task: int(os.getenv(f"{task.upper()}_TOKEN_BUDGET", str(default)))
+    for task, default in {
+        "categorize": 800,
+        "action_items": 2000,
+        "combined": 2000,
+        "batch": 400,
+        "chat": 4000,
+        "draft": 3000,
+    }.items()
+}
+
+# Share of the budget kept from the start of the body when truncating; the rest comes from the end
+HEAD_RATIO = 0.7
+TRUNCATION_MARKER_TOKENS = 12
+
+# Lines that start quoted history; everything from the first match on is dropped
+REPLY_HEADER_PATTERNS = [
+    re.compile(r"^On .{0,200}wrote:\s*$"),
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),
+]
+# Outlook-style quoted headers: "From: ..." followed by "Sent:" or "Date:"
+QUOTED_FROM_RE = re.compile(r"^\*?From:\*? .+")
+QUOTED_SENT_RE = re.compile(r"^\*?(Sent|Date):\*? .+")
+# Lines that start a signature or disclaimer block
+SIGNATURE_PATTERNS = [
+    re.compile(r"^-- ?$"),
+    re.compile(r"^Sent from my \w+", re.IGNORECASE),
+    re.compile(r"^Get Outlook for \w+", re.IGNORECASE),
+    re.compile(r"^(CONFIDENTIALITY NOTICE|DISCLAIMER)\b", re.IGNORECASE),
+    re.compile(r"^This (e-?mail|message) and any attachments", re.IGNORECASE),
+]
+# Only bodies with real markup are treated as HTML ("<<<" or "<name@example.com>" are plain text)
+HTML_DETECT_RE = re.compile(r"<(html|body|div|p|br|span|table|font|a|b|i|strong|ul|li)\b[^<>]*>", re.IGNORECASE)
+HTML_TAG_RE = re.compile(r"</?[a-zA-Z!][^<>]*>")
+HTML_BLOCK_RE = re.compile(r"<(script|style|head)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+HTML_BREAK_RE = re.compile(r"<(br|/p|/div|/li|/tr|/h\d)\b[^>]*>", re.IGNORECASE)
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        # The BPE file is downloaded on first use; offline installs can set TIKTOKEN_CACHE_DIR
+        print(f"Tokenizer {TOKENIZER_ENCODING} unavailable ({type(e).__name__}), estimating tokens from length")
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
+
+def strip_html(text: str) -> str:
+    if "<" not in text or not HTML_DETECT_RE.search(text):
+        return text
+    text = HTML_BLOCK_RE.sub("", text)
+    text = HTML_BREAK_RE.sub("\n", text)
+    return html.unescape(HTML_TAG_RE.sub("", text))
+
+def _quoted_lines(lines) -> set:
+    """Indexes of ">"-quoted lines in runs of two or more (a lone ">>> CLICK HERE <<<" is content)."""
+    quoted, run = set(), []
+    for i, line in enumerate(lines + [""]):
+        if line.lstrip().startswith(">"):
+            run.append(i)
+            continue
+        if len(run) > 1:
+            quoted.update(run)
+        run = []
+    return quoted
+
+def clean_email_body(body: str) -> str:
+    """Remove HTML, quoted reply history, signatures and disclaimers. Falls back to the original if nothing is left."""
+    text = strip_html(body or "").replace("\r\n", "\n").replace("\xa0", " ")
+    lines = text.split("\n")
+    quoted = _quoted_lines(lines)
+    kept = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if kept and any(p.match(stripped) for p in REPLY_HEADER_PATTERNS):
+            break
+        if kept and QUOTED_FROM_RE.match(stripped) and i + 1 < len(lines) and QUOTED_SENT_RE.match(lines[i + 1].strip()):
+            break
+        if any(p.match(stripped) for p in SIGNATURE_PATTERNS):
+            break
+        if i in quoted:
+            continue
+        kept.append(line.rstrip())
+    cleaned = BLANK_LINES_RE.sub("\n\n", "\n".join(kept)).strip()
+    return cleaned or text.strip()
+
+def truncate_head_tail(text: str, budget: int) -> str:
+    """Keep the first and last parts of the text so it fits in `budget` tokens."""
+    total = count_tokens(text)
+    if total <= budget:
+        return text
+    # Leave room for the omission marker
+    budget = max(budget - TRUNCATION_MARKER_TOKENS, 2)
+    head_budget = int(budget * HEAD_RATIO)
+    tail_budget = budget - head_budget
+    encoding = _encoding()
+    if encoding is None:
+        head, tail = text[:head_budget * 4], text[len(text) - tail_budget * 4:]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        head, tail = encoding.decode(tokens[:head_budget]), encoding.decode(tokens[-tail_budget:])
+    return f"{head}\n\n[... {total - budget} tokens omitted ...]\n\n{tail}"
+
+@dataclass
+class PreparedEmail:
+    text: str
+    original_tokens: int
+    tokens: int
+    truncated: bool
+
+# Running totals, reported by the token benchmark and useful for logging
+prep_stats = {"emails": 0, "original_tokens": 0, "prepared_tokens": 0, "truncated": 0}
+
+def _record(prepared: PreparedEmail) -> PreparedEmail:
+    prep_stats["emails"] += 1
+    prep_stats["original_tokens"] += prepared.original_tokens
+    prep_stats["prepared_tokens"] += prepared.tokens
+    prep_stats["truncated"] += int(prepared.truncated)
+    return prepared
+
+def prepare_email(body: str, task: str, budget: Optional[int] = None) -> PreparedEmail:
+    """Clean the body and fit it into the task's token budget with head+tail truncation."""
+    budget = budget or TOKEN_BUDGETS[task]
+    cleaned = clean_email_body(body)
+    text = truncate_head_tail(cleaned, budget)
+    return _record(PreparedEmail(text, count_tokens(body or ""), count_tokens(text), text is not cleaned))
+
+async def prepare_email_async(body: str, task: str, budget: Optional[int] = None) -> PreparedEmail:
+    """
+    Like prepare_email, but with TRUNCATION_STRATEGY=summary an over-budget
+    body is replaced by an LLM summary of its sections instead of being cut.
+    """
+    budget = budget or TOKEN_BUDGETS[task]
+    if TRUNCATION_STRATEGY != "summary":
+        return prepare_email(body, task, budget)
+    cleaned = clean_email_body(body)
+    if count_tokens(cleaned) <= budget:
+        return prepare_email(body, task, budget)
+
+    from services.llm_engine import summarize_for_budget
+    summary = await summarize_for_budget(cleaned, budget)
+    text = truncate_head_tail(summary, budget) if summary else truncate_head_tail(cleaned, budget)
+    return _record(PreparedEmail(text, count_tokens(body or ""), count_tokens(text), True))
@@ -0,0 +1,139 @@
+"""
+Short-lived cache for chat and draft responses, with request coalescing.
+
+Unlike the persistent result cache used for processing, these answers are
+free text for a user's question, so they are kept in memory only: entries
+expire after RESPONSE_CACHE_TTL seconds and the least recently used ones
+are evicted once the cache holds more than RESPONSE_CACHE_MAX_ENTRIES
+entries or RESPONSE_CACHE_MAX_BYTES of text. Each tenant has its own cache.
+Identical calls that arrive while the first is still waiting on the LLM
+share its result instead of making their own call.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from services.metrics import registry
+from services.result_cache import content_hash
+from services.tenant_context import TenantLocal
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+RESPONSE_CACHE_LOOKUPS = registry.counter("response_cache_lookups_total", "Chat and draft response lookups by outcome", ("task", "result"))
+
+def make_key(task: str, email_content: str, question: str, prompt_version: str, model_name: str) -> str:
+    """Key on everything that shapes the response: email, question or instructions, prompt and model."""
+    return content_hash(f"{task}|{content_hash(email_content)}|{content_hash(question or '')}|{prompt_version}|{model_name}")
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # key -> (value, expires at, size in bytes), least recently used first
+        self.entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self.bytes = 0
+        # key -> task computing it, shared by identical concurrent calls
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.counts = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "evictions": 0, "expirations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                self.counts["expirations"] += 1
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        size = len(value.encode("utf-8")) + len(key)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, time.monotonic() + self.ttl, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.counts["evictions"] += 1
+
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]], task: str = "other", fresh: bool = False) -> str:
+        """
+        Cached response for `key`, else the result of the identical call already
+        in flight, else `compute()`. Exceptions reach every waiter and are not cached.
+        `fresh` skips both (e.g. to regenerate a draft) but still caches the new answer.
+        """
+        if fresh or not self.enabled:
+            self.counts["bypassed"] += 1
+            RESPONSE_CACHE_LOOKUPS.inc(task=task, result="bypassed")
+            value = await compute()
+            self.set(key, value)
+            return value
+        value = self.get(key)
+        if value is not None:
+            self.counts["hits"] += 1
+            RESPONSE_CACHE_LOOKUPS.inc(task=task, result="hit")
+            return value
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            self.counts["coalesced"] += 1
+            RESPONSE_CACHE_LOOKUPS.inc(task=task, result="coalesced")
+        else:
+            self.counts["misses"] += 1
+            RESPONSE_CACHE_LOOKUPS.inc(task=task, result="miss")
+            pending = asyncio.ensure_future(self._compute(key, compute))
+            self.in_flight[key] = pending
+        # A caller that goes away (client disconnect) must not cancel the call for the others
+        return await asyncio.shield(pending)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        try:
+            value = await compute()
+            self.set(key, value)
+            return value
+        finally:
+            self.in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counts["hits"] + self.counts["misses"] + self.counts["coalesced"]
+        with self.lock:
+            return {
+                **self.counts,
+                "hit_rate": round((self.counts["hits"] + self.counts["coalesced"]) / lookups, 4) if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "in_flight": len(self.in_flight),
+                "ttl_seconds": self.ttl,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+# The current tenant's cache (see services.tenants), so answers and size limits are never shared between mailboxes
+response_cache = TenantLocal("response_cache")
@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Union
+from models import PromptConfig
+from services.serialization import dumps
+from services.tenant_context import TenantLocal
+
+CACHE_FILE = "llm_cache.json"
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def prompt_hash(prompt: PromptConfig) -> str:
+    """Hash of everything in a prompt that affects the LLM output."""
+    return content_hash(prompt.template + "\0" + (prompt.system_template or ""))
+
+class ResultCache:
+    """
+    Persistent cache of LLM results keyed on
+    (email body hash, prompt template + system_template hash, model name).
+    Entries remember which prompt produced them so editing a prompt only
+    drops the results that depend on it.
+    """
+    def __init__(self, path: str = CACHE_FILE):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # Guards entries: processing updates them on the event loop while PUT /prompts
+        # invalidates from the threadpool
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.load_from_disk()
+
+    def make_key(self, email_body: str, prompt: PromptConfig, model_name: str) -> str:
+        return content_hash(f"{content_hash(email_body)}|{prompt_hash(prompt)}|{model_name}")
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        return entry["value"] if entry else None
+
+    def make_combined_key(self, email_body: str, prompts: List[PromptConfig], model_name: str, mode: str) -> str:
+        """Key for a result that depends on several prompts at once (e.g. combined extraction)."""
+        prompt_hashes = ",".join(prompt_hash(p) for p in prompts)
+        return content_hash(f"{content_hash(email_body)}|{mode}:{prompt_hashes}|{model_name}")
+
+    def set(self, key: str, prompt_ids: Union[str, List[str]], value: Any):
+        if isinstance(prompt_ids, str):
+            prompt_ids = [prompt_ids]
+        with self.lock:
+            self.entries[key] = {"prompt_ids": prompt_ids, "value": value}
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate_prompt(self, prompt_id: str) -> int:
+        """Remove every cached result produced by the given prompt."""
+        with self.lock:
+            stale = [k for k, v in self.entries.items() if prompt_id in v.get("prompt_ids", [v.get("prompt_id")])]
+            for k in stale:
+                del self.entries[k]
+        return len(stale)
+
+    def _snapshot(self) -> Dict[str, Dict[str, Any]]:
+        # Entries are replaced, never mutated, so a shallow copy is consistent
+        with self.lock:
+            return dict(self.entries)
+
+    def load_from_disk(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            print(f"Error loading LLM cache: {e}")
+            self.entries = {}
+
+    def save_to_disk(self):
+        self._write(self._snapshot())
+
+    async def save(self):
+        """save_to_disk off the event loop."""
+        await asyncio.to_thread(self._write, self._snapshot())
+
+    def _write(self, entries: Dict[str, Dict[str, Any]]):
+        # Atomic replace, so a crash mid-write leaves the previous cache intact
+        tmp_path = self.path + ".tmp"
+        with self.write_lock:
+            try:
+                data = dumps(entries)
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Error saving LLM cache: {e}")
+
+# The current tenant's cache (see services.tenants)
+result_cache = TenantLocal("result_cache")
@@ -0,0 +1,258 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from models import Email
+from services.tenant_context import TenantLocal
+
+try:
+    import numpy as np
+except ImportError:  # Embeddings are optional; BM25 works without NumPy
+    np = None
+
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "20"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "3000"))
+RETRIEVAL_EMBEDDER = os.getenv("RETRIEVAL_EMBEDDER", "hashing")
+
+# Weight of the embedding similarity when combined with normalized BM25 scores
+EMBEDDING_WEIGHT = 0.5
+# Cosine similarities below this are treated as hash-collision noise
+MIN_SIMILARITY = 0.1
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "that", "the", "this", "to", "was", "we", "what", "which",
+    "with", "you", "your", "any", "all", "do", "about", "show", "tell",
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+def email_document(email: Email) -> str:
+    # Subject is repeated so it weighs more than the body
+    return " ".join([email.subject, email.subject, email.sender, email.summary or "", email.body])
+
+def format_email_line(email: Email) -> str:
+    line = f"- From: {email.sender}, Subject: {email.subject}, Category: {email.category or 'Uncategorized'}\n"
+    if email.summary:
+        line += f"  Summary: {email.summary}\n"
+    elif len(email.body) < 200:
+        line += f"  Body: {email.body}\n"
+    else:
+        line += f"  Body Preview: {email.body[:200]}...\n"
+    return line
+
+
+class BM25Index:
+    """Incrementally maintained BM25 index over email documents."""
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Counter] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def add(self, doc_id: str, text: str):
+        self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        self.doc_terms[doc_id] = terms
+        length = sum(terms.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in terms:
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+
+    def clear(self):
+        self.__init__(self.k1, self.b)
+
+    def search(self, query: str) -> Dict[str, float]:
+        n = len(self.doc_terms)
+        if n == 0:
+            return {}
+        avg_length = self.total_length / n or 1
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: hashes word unigrams and bigrams into a fixed-size
+    L2-normalized vector. Any object with the same `dim`/`embed` interface
+    (e.g. a local sentence-transformer wrapper) can be plugged in instead.
+    """
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def embed(self, text: str):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = tokenize(text)
+        features = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            digest = hashlib.md5(feature.encode()).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class VectorStore:
+    """NumPy-backed vector store with in-place updates and swap-remove deletes."""
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+
+    def upsert(self, doc_id: str, vector):
+        row = self.rows.get(doc_id)
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.vectors):
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.ids.append(doc_id)
+            self.rows[doc_id] = row
+        self.vectors[row] = vector
+
+    def remove(self, doc_id: str):
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+        self.ids.pop()
+
+    def clear(self):
+        self.ids = []
+        self.rows = {}
+
+    def search(self, vector) -> Dict[str, float]:
+        if not self.ids:
+            return {}
+        similarities = self.vectors[:len(self.ids)] @ vector
+        return {doc_id: float(similarities[i]) for i, doc_id in enumerate(self.ids)}
+
+
+class InboxRetriever:
+    """
+    Local retrieval index over subject, sender, summary and body.
+    Kept up to date through store listeners; selects the most relevant
+    emails for inbox chat under a token budget.
+    """
+    def __init__(self, embedder=None):
+        self.lock = threading.Lock()
+        self.bm25 = BM25Index()
+        self.embedder = embedder
+        self.vectors = VectorStore(embedder.dim) if embedder else None
+        self.store = None
+
+    def attach(self, store):
+        self.store = store
+        with self.lock:
+            for email in store.get_all_emails():
+                self._add(email)
+        store.add_listener(self.on_store_event)
+
+    def _add(self, email: Email):
+        document = email_document(email)
+        self.bm25.add(email.id, document)
+        if self.vectors is not None:
+            self.vectors.upsert(email.id, self.embedder.embed(document))
+
+    def on_store_event(self, event: str, email: Optional[Email]):
+        with self.lock:
+            if event == "clear":
+                self.bm25.clear()
+                if self.vectors is not None:
+                    self.vectors.clear()
+            elif event == "upsert":
+                self._add(email)
+            elif event == "delete":
+                self.bm25.remove(email.id)
+                if self.vectors is not None:
+                    self.vectors.remove(email.id)
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> List[Tuple[str, float]]:
+        with self.lock:
+            scores = self.bm25.search(query)
+            if scores:
+                top = max(scores.values())
+                scores = {doc_id: score / top for doc_id, score in scores.items()}
+            if self.vectors is not None:
+                query_vector = self.embedder.embed(query)
+                if query_vector.any():
+                    for doc_id, similarity in self.vectors.search(query_vector).items():
+                        if similarity >= MIN_SIMILARITY:
+                            scores[doc_id] = scores.get(doc_id, 0.0) + EMBEDDING_WEIGHT * similarity
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def build_context(self, query: str, k: int = RETRIEVAL_TOP_K, token_budget: int = RETRIEVAL_TOKEN_BUDGET) -> str:
+        """
+        Build the inbox chat context from the top-k relevant emails that fit in the token budget.
+        Falls back to the most recent emails when nothing matches the query.
+        """
+        snapshot = self.store.snapshot()
+        emails = [snapshot.get_email(doc_id) for doc_id, _ in self.search(query, k)]
+        emails = [e for e in emails if e is not None]
+        if not emails:
+            emails, _ = snapshot.query_emails(limit=k)
+
+        total = len(snapshot)
+        lines = []
+        used = 0
+        for email in emails:
+            line = format_email_line(email)
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                break
+            lines.append(line)
+            used += cost
+
+        header = f"Inbox Overview ({total} emails, showing the {len(lines)} most relevant to the question):\n"
+        return header + "".join(lines)
+
+
+def create_embedder(kind: str = None):
+    kind = kind or RETRIEVAL_EMBEDDER
+    if kind == "none":
+        return None
+    if np is None:
+        print("NumPy not installed - inbox retrieval will use BM25 only")
+        return None
+    if kind == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unknown embedder: {kind}")
+
+# The current tenant's instance (see services.tenants)
+retriever = TenantLocal("retriever")
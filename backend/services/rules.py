@@ -0,0 +1,193 @@
+"""
+Rule-based pre-classifier that runs before any model is called.
+
+Decides an email's category from, in order:
+  1. sender and domain tables (exact lookups),
+  2. pattern rules, compiled into one alternation per field so each field is
+     scanned once regardless of the number of rules,
+  3. per-sender history: a sender whose past LLM categories agree closely
+     enough gets that category without another LLM call.
+Rules are stored with the prompts and drafts and edited through /rules.
+"""
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from models import Email, Rule
+from services.tenant_context import TenantLocal
+
+# Minimum LLM-decided emails from a sender before its history is trusted
+SENDER_HISTORY_MIN_EMAILS = int(os.getenv("SENDER_HISTORY_MIN_EMAILS", "5"))
+# Share of those emails that must agree on one category
+SENDER_HISTORY_AGREEMENT = float(os.getenv("SENDER_HISTORY_AGREEMENT", "0.95"))
+
+RULE_KINDS = ("sender", "domain", "pattern")
+RULE_FIELDS = ("subject", "body", "sender", "any")
+# Fields are scanned in this order; "any" rules are compiled into subject and body
+SCAN_FIELDS = ("sender", "subject", "body")
+
+def validate_rule(rule: Rule):
+    """Raise ValueError if the rule can't be compiled."""
+    if rule.kind not in RULE_KINDS:
+        raise ValueError(f"Unknown rule kind '{rule.kind}' (expected one of: {', '.join(RULE_KINDS)})")
+    if rule.field not in RULE_FIELDS:
+        raise ValueError(f"Unknown rule field '{rule.field}' (expected one of: {', '.join(RULE_FIELDS)})")
+    if not rule.pattern.strip():
+        raise ValueError("Rule pattern is empty")
+    if rule.kind == "pattern":
+        try:
+            re.compile(rule.pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}")
+
+def _domain_suffixes(sender: str) -> List[str]:
+    """example.mail.com -> ["example.mail.com", "mail.com", "com"]"""
+    domain = sender.rsplit("@", 1)[-1].lower()
+    parts = domain.split(".")
+    return [".".join(parts[i:]) for i in range(len(parts))]
+
+
+# Backreferences are numbered by position, so they would break inside a combined pattern
+BACKREFERENCE_RE = re.compile(r"\\[1-9]|\(\?P=")
+
+class PatternSet:
+    """
+    Pattern rules for one field combined into a single regex with a named
+    group per rule, so matching costs one scan. Rules that can't be combined
+    (backreferences, or clashing group names) are scanned one by one.
+    """
+    def __init__(self, rules: List[Rule]):
+        combinable = [rule for rule in rules if not BACKREFERENCE_RE.search(rule.pattern)]
+        self.rules = {f"r{i}": rule for i, rule in enumerate(combinable)}
+        self.combined = None
+        self.separate: List[Tuple[re.Pattern, Rule]] = []
+        if self.rules:
+            try:
+                self.combined = re.compile("|".join(f"(?P<{group}>{rule.pattern})" for group, rule in self.rules.items()), re.IGNORECASE)
+            except re.error:
+                self.rules = {}
+        separate = [rule for rule in rules if rule not in self.rules.values()]
+        self.separate = [(re.compile(rule.pattern, re.IGNORECASE), rule) for rule in separate]
+
+    def match(self, text: str) -> Optional[Rule]:
+        if self.combined is not None:
+            match = self.combined.search(text)
+            if match:
+                return self.rules[match.lastgroup]
+        for pattern, rule in self.separate:
+            if pattern.search(text):
+                return rule
+        return None
+
+
+class RuleEngine:
+    """Compiled rules plus per-sender category history, kept current through store listeners."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.senders: Dict[str, Rule] = {}
+        self.domains: Dict[str, Rule] = {}
+        self.patterns: Dict[str, PatternSet] = {field: PatternSet([]) for field in SCAN_FIELDS}
+        # sender -> categories the LLM assigned to its emails, and what each email contributed
+        self.sender_categories: Dict[str, Counter] = {}
+        self.contributions: Dict[str, Tuple[str, str]] = {}
+
+    def compile(self, rules: List[Rule]):
+        """Rebuild the lookup tables and pattern sets from the enabled rules."""
+        senders, domains = {}, {}
+        by_field: Dict[str, List[Rule]] = {field: [] for field in SCAN_FIELDS}
+        for rule in rules:
+            if not rule.enabled:
+                continue
+            if rule.kind == "sender":
+                senders[rule.pattern.strip().lower()] = rule
+            elif rule.kind == "domain":
+                domains[rule.pattern.strip().lower().lstrip("@")] = rule
+            elif rule.field == "any":
+                by_field["subject"].append(rule)
+                by_field["body"].append(rule)
+            else:
+                by_field[rule.field].append(rule)
+        patterns = {field: PatternSet(field_rules) for field, field_rules in by_field.items()}
+        with self.lock:
+            self.senders, self.domains, self.patterns = senders, domains, patterns
+
+    def attach(self, store):
+        self.compile(store.get_all_rules())
+        with self.lock:
+            for email in store.get_all_emails():
+                self._learn(email)
+        store.add_listener(self.on_store_event)
+
+    def on_store_event(self, event: str, email: Optional[Email]):
+        with self.lock:
+            if event == "clear":
+                self.sender_categories.clear()
+                self.contributions.clear()
+            elif event == "upsert":
+                self._learn(email)
+            elif event == "delete":
+                self._forget(email.id)
+
+    def _forget(self, email_id: str):
+        previous = self.contributions.pop(email_id, None)
+        if previous:
+            sender, category = previous
+            counts = self.sender_categories[sender]
+            counts[category] -= 1
+            if counts[category] <= 0:
+                del counts[category]
+
+    def _learn(self, email: Email):
+        # Only LLM decisions count, so rules and history never reinforce themselves
+        self._forget(email.id)
+        if email.decided_by == "llm" and email.category:
+            sender = email.sender.lower()
+            self.sender_categories.setdefault(sender, Counter())[email.category] += 1
+            self.contributions[email.id] = (sender, email.category)
+
+    def match_rule(self, email: Email) -> Optional[Rule]:
+        sender = email.sender.lower()
+        rule = self.senders.get(sender)
+        if rule:
+            return rule
+        for domain in _domain_suffixes(sender):
+            rule = self.domains.get(domain)
+            if rule:
+                return rule
+        for field in SCAN_FIELDS:
+            text = sender if field == "sender" else getattr(email, field)
+            rule = self.patterns[field].match(text)
+            if rule:
+                return rule
+        return None
+
+    def sender_history(self, email: Email) -> Optional[str]:
+        """The sender's usual LLM category, not counting this email's own past result."""
+        sender = email.sender.lower()
+        with self.lock:
+            counts = Counter(self.sender_categories.get(sender, ()))
+            own = self.contributions.get(email.id)
+        if own and own[0] == sender:
+            counts[own[1]] -= 1
+        counts = +counts
+        if not counts:
+            return None
+        category, count = counts.most_common(1)[0]
+        total = sum(counts.values())
+        if total >= SENDER_HISTORY_MIN_EMAILS and count / total >= SENDER_HISTORY_AGREEMENT:
+            return category
+        return None
+
+    def classify(self, email: Email) -> Optional[Tuple[str, str]]:
+        """(category, decided_by) if a rule or the sender's history decides the email, else None."""
+        rule = self.match_rule(email)
+        if rule:
+            return rule.category, f"rule:{rule.id}"
+        category = self.sender_history(email)
+        if category:
+            return category, "sender_history"
+        return None
+
+# The current tenant's instance (see services.tenants)
+rule_engine = TenantLocal("rule_engine")
@@ -0,0 +1,133 @@
+"""
+Fast JSON encoding for API responses and persistence.
+
+Uses orjson when it is installed and the standard library otherwise; both
+produce compact JSON that the other can read. Emails are encoded once and
+the bytes reused by every response and persistence flush until the email
+changes.
+"""
+import json
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi.responses import Response
+
+from models import Email
+from services.tenant_context import TenantLocal
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library encoder
+    orjson = None
+
+LIST_PREVIEW_CHARS = 200
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "dict"):
+        return value.dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+if orjson is not None:
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+    loads: Callable[[Any], Any] = orjson.loads
+else:
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    loads = json.loads
+
+def join_array(items: Iterable[bytes]) -> bytes:
+    """A JSON array from already encoded items."""
+    return b"[" + b",".join(items) + b"]"
+
+def join_object(items: Iterable[Tuple[str, bytes]]) -> bytes:
+    """A JSON object from (key, already encoded value) pairs."""
+    return b"{" + b",".join(dumps(key) + b":" + value for key, value in items) + b"}"
+
+
+class FastJSONResponse(Response):
+    """JSON response that accepts pre-encoded bytes and skips FastAPI's re-validation and encoding."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+
+def list_item(email: Email) -> Dict[str, Any]:
+    """The lean list view of an email (see EmailListItem): no body, action items or routing details."""
+    body = email.body or ""
+    return {
+        "id": email.id,
+        "sender": email.sender,
+        "subject": email.subject,
+        "timestamp": email.timestamp,
+        "read": email.read,
+        "category": email.category,
+        "summary": email.summary,
+        "preview": body[:LIST_PREVIEW_CHARS],
+        "action_item_count": len(email.action_items or []),
+    }
+
+
+class EmailJSONCache:
+    """
+    Encoded JSON per email, for the full and the list view.
+
+    Entries remember the Email object they were encoded from. The store
+    replaces an email with a new object on every update (never mutating it
+    in place), so a lookup for a different object is a miss and can never
+    serve stale bytes. Store listeners drop entries for changed and deleted
+    emails so memory tracks the inbox.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # email id -> (email object, full JSON or None, list JSON or None)
+        self.entries: Dict[str, Tuple[Email, Optional[bytes], Optional[bytes]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self, store):
+        store.add_listener(self.on_store_event)
+
+    def on_store_event(self, event: str, email: Optional[Email]):
+        if event == "clear":
+            with self.lock:
+                self.entries = {}
+        elif email is not None:
+            with self.lock:
+                self.entries.pop(email.id, None)
+
+    def _get(self, email: Email, view: int) -> bytes:
+        entry = self.entries.get(email.id)
+        if entry is not None and entry[0] is email and entry[view] is not None:
+            self.hits += 1
+            return entry[view]
+        self.misses += 1
+        encoded = dumps(email.dict() if view == 1 else list_item(email))
+        with self.lock:
+            entry = self.entries.get(email.id)
+            if entry is None or entry[0] is not email:
+                entry = (email, None, None)
+            self.entries[email.id] = (email, encoded, entry[2]) if view == 1 else (email, entry[1], encoded)
+        return encoded
+
+    def full(self, email: Email) -> bytes:
+        return self._get(email, 1)
+
+    def list_view(self, email: Email) -> bytes:
+        return self._get(email, 2)
+
+    def partial(self, email: Email, include) -> bytes:
+        # Sparse field selections vary per request, so they are not cached
+        return dumps(email.dict(include=include))
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+# The current tenant's cache (each Store owns one)
+email_json = TenantLocal("email_json")
@@ -0,0 +1,413 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from models import Email, PromptConfig, Draft, Rule
+from services.metrics import STORE_FLUSH, STORE_FLUSH_ERRORS
+from services.serialization import dumps, loads, join_object
+
+STORE_BACKEND = os.getenv("STORE_BACKEND", "json")
+JSON_PERSISTENCE_FILE = "persistence.json"
+SQLITE_PERSISTENCE_FILE = "persistence.db"
+
+# Debounce interval (seconds) for coalescing JSON writes
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "0.5"))
+
+
+class StorageBackend:
+    """
+    Persistence interface used by Store.
+    The store keeps the working set in memory and calls the backend for every mutation.
+    """
+    def bind(self, store):
+        self.store = store
+
+    def encode_email(self, email: Email) -> bytes:
+        """JSON for an email, reusing the bound store's cached encoding when it has one."""
+        email_json = getattr(self.store, "email_json", None)
+        return email_json.full(email) if email_json is not None else dumps(email.dict())
+
+    def load(self) -> Optional[Dict[str, Dict[str, Dict[str, Any]]]]:
+        """Return {"emails": {...}, "prompts": {...}, "drafts": {...}, "rules": {...}} as raw dicts, or None if nothing is persisted."""
+        raise NotImplementedError
+
+    def upsert_email(self, email: Email):
+        raise NotImplementedError
+
+    def delete_email(self, email_id: str):
+        raise NotImplementedError
+
+    def clear_emails(self):
+        raise NotImplementedError
+
+    def upsert_prompt(self, prompt: PromptConfig):
+        raise NotImplementedError
+
+    def upsert_draft(self, draft: Draft):
+        raise NotImplementedError
+
+    def delete_draft(self, draft_id: str):
+        raise NotImplementedError
+
+    def upsert_rule(self, rule: Rule):
+        raise NotImplementedError
+
+    def delete_rule(self, rule_id: str):
+        raise NotImplementedError
+
+    def save_all(self):
+        """Persist the full state of the bound store."""
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self):
+        """Group many mutations into a single write."""
+        yield
+
+    def flush(self):
+        """Write any pending changes synchronously."""
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonFileBackend(StorageBackend):
+    """
+    Original format: the whole store serialized to a single JSON file.
+    Writes are write-behind: mutations mark the store dirty and a background
+    flusher coalesces them into one atomic write (temp file + fsync + rename)
+    every STORE_FLUSH_INTERVAL seconds.
+    """
+    def __init__(self, path: str = JSON_PERSISTENCE_FILE, flush_interval: float = None):
+        self.path = path
+        self.flush_interval = STORE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.dirty = threading.Event()
+        self.write_lock = threading.Lock()
+        # Guards batch_depth and version, which mutations and the flusher both touch
+        self.lock = threading.Lock()
+        self.batch_depth = 0
+        # Bumped on every mutation (prompts, drafts and rules too, unlike the store version),
+        # so a snapshot encoded before a newer one never replaces it on disk
+        self.version = 0
+        self.written_version = -1
+        self.closed = False
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                return loads(f.read())
+        except json.JSONDecodeError as e:
+            # Keep the damaged file for inspection instead of overwriting it with defaults
+            corrupt_path = f"{self.path}.corrupt-{int(time.time())}"
+            os.replace(self.path, corrupt_path)
+            print(f"Error: {self.path} is corrupt ({e}); moved it to {corrupt_path}")
+            return None
+
+    def mark_dirty(self):
+        with self.lock:
+            self.version += 1
+            if self.batch_depth == 0:
+                self.dirty.set()
+
+    @contextmanager
+    def batch(self):
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+            self.mark_dirty()
+
+    def _flush_loop(self):
+        while not self.closed:
+            self.dirty.wait()
+            if self.closed:
+                break
+            # Let further mutations accumulate before writing
+            time.sleep(self.flush_interval)
+            with self.lock:
+                if self.batch_depth > 0:
+                    continue
+                self.dirty.clear()
+            self._write_snapshot()
+
+    def encode_snapshot(self) -> bytes:
+        # Emails reuse their cached encoding, so a flush only encodes the ones that changed
+        return join_object([
+            ("emails", join_object((k, self.encode_email(v)) for k, v in list(self.store.emails.items()))),
+            ("prompts", dumps({k: v.dict() for k, v in list(self.store.prompts.items())})),
+            ("drafts", dumps({k: v.dict() for k, v in list(self.store.drafts.items())})),
+            ("rules", dumps({k: v.dict() for k, v in list(self.store.rules.items())})),
+        ])
+
+    def _write_snapshot(self):
+        # Mutations update the store before marking it dirty, so the encoding covers at least this version
+        with self.lock:
+            version = self.version
+        data = self.encode_snapshot()
+        tmp_path = self.path + ".tmp"
+        with self.write_lock:
+            if version < self.written_version:
+                # A concurrent flush already wrote a newer snapshot
+                return
+            self.written_version = version
+            start = time.perf_counter()
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                STORE_FLUSH.observe(time.perf_counter() - start, backend="json")
+            except Exception as e:
+                STORE_FLUSH_ERRORS.inc(backend="json")
+                print(f"Error saving persistence file: {e}")
+
+    def flush(self):
+        self.dirty.clear()
+        self._write_snapshot()
+
+    def save_all(self):
+        self.mark_dirty()
+
+    def upsert_email(self, email: Email):
+        self.mark_dirty()
+
+    def delete_email(self, email_id: str):
+        self.mark_dirty()
+
+    def clear_emails(self):
+        self.mark_dirty()
+
+    def upsert_prompt(self, prompt: PromptConfig):
+        self.mark_dirty()
+
+    def upsert_draft(self, draft: Draft):
+        self.mark_dirty()
+
+    def delete_draft(self, draft_id: str):
+        self.mark_dirty()
+
+    def upsert_rule(self, rule: Rule):
+        self.mark_dirty()
+
+    def delete_rule(self, rule_id: str):
+        self.mark_dirty()
+
+    def close(self):
+        """Stop the flusher and drain pending changes to disk."""
+        if self.closed:
+            return
+        self.closed = True
+        pending = self.dirty.is_set()
+        self.dirty.set()
+        self.flusher.join(timeout=5)
+        if pending:
+            self.flush()
+
+
+class SqliteBackend(StorageBackend):
+    """
+    SQLite (WAL mode) backend. Every mutation is a single-row upsert.
+    Emails keep category, sender and timestamp in indexed columns next to the JSON payload.
+    Writes are write-behind like the JSON backend: statements are queued and a
+    background writer commits them in one transaction every STORE_FLUSH_INTERVAL
+    seconds, so callers (including the event loop) never wait on disk.
+    Inside batch() nothing is committed until the outermost batch exits.
+    """
+    def __init__(self, path: str = SQLITE_PERSISTENCE_FILE, flush_interval: float = None):
+        self.path = path
+        self.flush_interval = STORE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending: List[Tuple[str, Any, bool]] = []
+        self.dirty = threading.Event()
+        self.batch_depth = 0
+        self.closed = False
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        self.writer = threading.Thread(target=self._flush_loop, daemon=True)
+        self.writer.start()
+
+    def _create_schema(self):
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS emails (
+                    id TEXT PRIMARY KEY,
+                    sender TEXT NOT NULL,
+                    category TEXT,
+                    timestamp TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_emails_category ON emails(category);
+                CREATE INDEX IF NOT EXISTS idx_emails_sender ON emails(sender);
+                CREATE INDEX IF NOT EXISTS idx_emails_timestamp ON emails(timestamp);
+                CREATE TABLE IF NOT EXISTS prompts (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS drafts (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS rules (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+            """)
+
+    def _enqueue(self, sql: str, params: Any, many: bool = False):
+        with self.pending_lock:
+            self.pending.append((sql, params, many))
+            if self.batch_depth == 0:
+                self.dirty.set()
+
+    @contextmanager
+    def batch(self):
+        with self.pending_lock:
+            self.batch_depth += 1
+        try:
+            yield
+        finally:
+            with self.pending_lock:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self.dirty.set()
+
+    def _flush_loop(self):
+        while not self.closed:
+            self.dirty.wait()
+            if self.closed:
+                break
+            # Let further mutations accumulate before committing
+            time.sleep(self.flush_interval)
+            with self.pending_lock:
+                if self.batch_depth > 0:
+                    continue
+                self.dirty.clear()
+            self._drain()
+
+    def _drain(self):
+        """Execute every queued statement in one transaction."""
+        with self.lock:
+            with self.pending_lock:
+                ops, self.pending = self.pending, []
+            if not ops or self.conn is None:
+                return
+            start = time.perf_counter()
+            try:
+                for sql, params, many in ops:
+                    if many:
+                        self.conn.executemany(sql, params)
+                    else:
+                        self.conn.execute(sql, params)
+                self.conn.commit()
+                STORE_FLUSH.observe(time.perf_counter() - start, backend="sqlite")
+            except Exception as e:
+                self.conn.rollback()
+                STORE_FLUSH_ERRORS.inc(backend="sqlite")
+                print(f"Error saving to {self.path}: {e}")
+
+    def flush(self):
+        self.dirty.clear()
+        self._drain()
+
+    def _email_row(self, email: Email):
+        return (email.id, email.sender, email.category, email.timestamp.isoformat(), self.encode_email(email).decode("utf-8"))
+
+    def load(self):
+        with self.lock:
+            emails = {row[0]: loads(row[1]) for row in self.conn.execute("SELECT id, data FROM emails")}
+            prompts = {row[0]: loads(row[1]) for row in self.conn.execute("SELECT id, data FROM prompts")}
+            drafts = {row[0]: loads(row[1]) for row in self.conn.execute("SELECT id, data FROM drafts")}
+            rules = {row[0]: loads(row[1]) for row in self.conn.execute("SELECT id, data FROM rules")}
+        if not (emails or prompts or drafts or rules):
+            return None
+        return {"emails": emails, "prompts": prompts, "drafts": drafts, "rules": rules}
+
+    def upsert_email(self, email: Email):
+        self._enqueue(
+            "INSERT INTO emails (id, sender, category, timestamp, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET sender=excluded.sender, category=excluded.category, "
+            "timestamp=excluded.timestamp, data=excluded.data",
+            self._email_row(email)
+        )
+
+    def delete_email(self, email_id: str):
+        self._enqueue("DELETE FROM emails WHERE id = ?", (email_id,))
+
+    def clear_emails(self):
+        self._enqueue("DELETE FROM emails", ())
+
+    def upsert_prompt(self, prompt: PromptConfig):
+        self._enqueue(
+            "INSERT INTO prompts (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data=excluded.data",
+            (prompt.id, dumps(prompt.dict()).decode("utf-8"))
+        )
+
+    def upsert_draft(self, draft: Draft):
+        self._enqueue(
+            "INSERT INTO drafts (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data=excluded.data",
+            (draft.id, dumps(draft.dict()).decode("utf-8"))
+        )
+
+    def delete_draft(self, draft_id: str):
+        self._enqueue("DELETE FROM drafts WHERE id = ?", (draft_id,))
+
+    def upsert_rule(self, rule: Rule):
+        self._enqueue(
+            "INSERT INTO rules (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data=excluded.data",
+            (rule.id, dumps(rule.dict()).decode("utf-8"))
+        )
+
+    def delete_rule(self, rule_id: str):
+        self._enqueue("DELETE FROM rules WHERE id = ?", (rule_id,))
+
+    def save_all(self):
+        # Rows are serialized now so later in-memory changes can't leak into this write
+        with self.batch():
+            self._enqueue("DELETE FROM emails", ())
+            self._enqueue("DELETE FROM prompts", ())
+            self._enqueue("DELETE FROM drafts", ())
+            self._enqueue("DELETE FROM rules", ())
+            self._enqueue(
+                "INSERT INTO emails (id, sender, category, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+                [self._email_row(e) for e in list(self.store.emails.values())], many=True
+            )
+            self._enqueue(
+                "INSERT INTO prompts (id, data) VALUES (?, ?)",
+                [(p.id, dumps(p.dict()).decode("utf-8")) for p in list(self.store.prompts.values())], many=True
+            )
+            self._enqueue(
+                "INSERT INTO drafts (id, data) VALUES (?, ?)",
+                [(d.id, dumps(d.dict()).decode("utf-8")) for d in list(self.store.drafts.values())], many=True
+            )
+            self._enqueue(
+                "INSERT INTO rules (id, data) VALUES (?, ?)",
+                [(r.id, dumps(r.dict()).decode("utf-8")) for r in list(self.store.rules.values())], many=True
+            )
+
+    def close(self):
+        """Stop the writer and commit pending changes."""
+        if self.closed:
+            return
+        self.closed = True
+        self.dirty.set()
+        self.writer.join(timeout=5)
+        self._drain()
+        with self.lock:
+            self.conn.close()
+            self.conn = None
+
+
+def create_backend(kind: str = None, path: str = None) -> StorageBackend:
+    """Build the storage backend selected by STORE_BACKEND (json or sqlite)."""
+    kind = kind or STORE_BACKEND
+    if kind == "sqlite":
+        return SqliteBackend(path or os.getenv("STORE_PATH", SQLITE_PERSISTENCE_FILE))
+    if kind == "json":
+        return JsonFileBackend(path or os.getenv("STORE_PATH", JSON_PERSISTENCE_FILE))
+    raise ValueError(f"Unknown storage backend: {kind}")
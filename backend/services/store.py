@@ -1,19 +1,151 @@
+import atexit
+import base64
+import bisect
 import json
-import os
-from typing import List, Dict
-from models import Email, PromptConfig, Draft
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, List, Dict, Optional, Tuple
+from models import Email, PromptConfig, Draft, Rule
+from services.storage import StorageBackend, create_backend
+from services.serialization import EmailJSONCache
+from services.tenant_context import TenantLocal
+
+# Fields with a secondary index usable as GET /emails filters
+INDEXED_FIELDS = ("category", "sender", "read")
+
+def _utc_seconds(moment: datetime) -> float:
+    """POSIX time of a datetime; naive ones are UTC (as in the mailbox exports), not server-local time."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def _time_key(email: Email) -> Tuple[float, str]:
+    return (_utc_seconds(email.timestamp), email.id)
+
+def encode_cursor(key: Tuple[float, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    ts, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return (float(ts), str(email_id))
+
+class StoreSnapshot:
+    """
+    Read-only view of the emails and their indexes at one store version.
+    The store never mutates containers after handing them out in a snapshot,
+    so a snapshot can be read from any thread without locks.
+    """
+    def __init__(self, version: int, emails: Dict[str, Email], time_index: Dict[tuple, List[Tuple[float, str]]], indexed_values: Dict[str, tuple]):
+        self.version = version
+        self.emails = emails
+        self.time_index = time_index
+        self.indexed_values = indexed_values
+
+    def __len__(self) -> int:
+        return len(self.emails)
+
+    def get_email(self, email_id: str) -> Optional[Email]:
+        return self.emails.get(email_id)
+
+    def get_all_emails(self) -> List[Email]:
+        return list(self.emails.values())
+
+    def query_emails(
+        self,
+        category: Optional[str] = None,
+        sender: Optional[str] = None,
+        read: Optional[bool] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        descending: bool = True,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        uncategorized: bool = False,
+    ) -> Tuple[List[Email], Optional[str]]:
+        """
+        Page through emails ordered by (timestamp, id) using the secondary indexes.
+        Walks the smallest matching index from the cursor, so cost depends on the
+        page size rather than on the inbox size. Returns (emails, next_cursor).
+        `uncategorized` keeps only emails without a category (not yet processed).
+        """
+        filters = {"category": category, "sender": sender.lower() if sender else None, "read": read}
+        filters = {k: v for k, v in filters.items() if v is not None}
+        if uncategorized:
+            filters["category"] = None
+
+        candidates = [self.time_index.get((field, value), []) for field, value in filters.items()]
+        keys = min(candidates, key=len) if candidates else self.time_index[("all", None)]
+
+        lo, hi = 0, len(keys)
+        if since is not None:
+            lo = bisect.bisect_left(keys, (_utc_seconds(since), ""))
+        if until is not None:
+            hi = bisect.bisect_right(keys, (_utc_seconds(until), "\uffff"))
+        if cursor:
+            position = decode_cursor(cursor)
+            if descending:
+                hi = min(hi, bisect.bisect_left(keys, position))
+            else:
+                lo = max(lo, bisect.bisect_right(keys, position))
+
+        results: List[Email] = []
+        last_key = None
+        indexes = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        for i in indexes:
+            key = keys[i]
+            values = self.indexed_values[key[1]][1]
+            if all((field, value) in values for field, value in filters.items()):
+                results.append(self.emails[key[1]])
+                last_key = key
+                if limit is not None and len(results) >= limit:
+                    break
+        else:
+            last_key = None
+
+        next_cursor = encode_cursor(last_key) if last_key is not None else None
+        return results, next_cursor
 
-PERSISTENCE_FILE = "persistence.json"
 
 class Store:
-    def __init__(self):
+    """
+    In-memory working set backed by a StorageBackend.
+
+    Writers are serialized by `write_lock`. Readers that need more than one
+    lookup take a snapshot(): the email dict and indexes are copy-on-write,
+    so the first write after a snapshot was handed out copies them instead
+    of mutating what readers are iterating. Single-key reads (get_email)
+    go straight to the current dict.
+    """
+    def __init__(self, backend: StorageBackend = None):
         self.emails: Dict[str, Email] = {}
         self.prompts: Dict[str, PromptConfig] = {}
         self.drafts: Dict[str, Draft] = {}
+        self.rules: Dict[str, Rule] = {}
+        # Secondary indexes: (field, value) -> list of (timestamp, id) kept sorted,
+        # plus the values each email was indexed under so updates can move it
+        self.time_index: Dict[tuple, List[Tuple[float, str]]] = {("all", None): []}
+        self.indexed_values: Dict[str, tuple] = {}
+        # Bumped on every email mutation; snapshots and derived caches key on it
+        self.version = 0
+        self.write_lock = threading.RLock()
+        # Guards the shared flag and in-place mutation of the current containers
+        self.state_lock = threading.Lock()
+        self.shared = False
+        # Callbacks notified on email changes: listener(event, email) with event "upsert", "delete" or "clear"
+        self.listeners: List[Callable[[str, Optional[Email]], None]] = []
+        # Encoded JSON per email, reused by API responses and persistence flushes
+        self.email_json = EmailJSONCache()
+        self.add_listener(self.email_json.on_store_event)
+        self.backend = backend or create_backend()
+        self.backend.bind(self)
+        # Make sure pending writes reach disk even without a clean shutdown event
+        atexit.register(self.close)
 
         # Try loading from disk first
         if not self.load_from_disk():
             # If no persistence file, initialize defaults
+            self._init_default_rules()
             self._init_default_prompts()
 
     def _init_default_prompts(self):
@@ -63,63 +195,249 @@ Your response must be a single word.""",
             self.prompts[p.id] = p
         self.save_to_disk()
 
+    def _init_default_rules(self):
+        defaults = [
+            Rule(
+                id="unsubscribe_footer",
+                name="Unsubscribe footer",
+                kind="pattern",
+                pattern=r"\bunsubscribe\b|\bmanage (your )?(email )?(preferences|subscriptions)\b|\bview (this email )?in (your )?browser\b",
+                field="body",
+                category="Newsletter",
+                description="Bulk mail with a List-Unsubscribe style footer.",
+            ),
+            Rule(
+                id="bulk_senders",
+                name="Bulk mail senders",
+                kind="pattern",
+                pattern=r"^(newsletters?|digest|marketing|deals|promotions?)@",
+                field="sender",
+                category="Newsletter",
+                description="Mailbox names used for newsletters and promotions.",
+            ),
+            Rule(
+                id="lottery_spam",
+                name="Lottery and prize scams",
+                kind="pattern",
+                pattern=r"\b(lottery|you('ve| have) won|claim your (prize|reward|winnings))\b",
+                field="any",
+                category="Spam",
+                description="Prize and lottery scams.",
+            ),
+        ]
+        for r in defaults:
+            self.rules[r.id] = r
+
     def load_from_disk(self) -> bool:
-        if not os.path.exists(PERSISTENCE_FILE):
-            return False
         try:
-            with open(PERSISTENCE_FILE, "r") as f:
-                data = json.load(f)
+            data = self.backend.load()
+            if data is None:
+                return False
+            with self.write_lock, self._mutation():
                 self.emails = {k: Email(**v) for k, v in data.get("emails", {}).items()}
                 self.prompts = {k: PromptConfig(**v) for k, v in data.get("prompts", {}).items()}
                 self.drafts = {k: Draft(**v) for k, v in data.get("drafts", {}).items()}
-            print(f"Loaded state from {PERSISTENCE_FILE}")
+                self.rules = {k: Rule(**v) for k, v in data.get("rules", {}).items()}
+                self._rebuild_indexes()
+            if "rules" not in data:
+                # Persisted before rules existed
+                self._init_default_rules()
+                self.save_to_disk()
+            print(f"Loaded state from {self.backend.path}")
             return True
         except Exception as e:
             print(f"Error loading persistence file: {e}")
             return False
 
     def save_to_disk(self):
-        data = {
-            "emails": {k: v.dict() for k, v in self.emails.items()},
-            "prompts": {k: v.dict() for k, v in self.prompts.items()},
-            "drafts": {k: v.dict() for k, v in self.drafts.items()}
-        }
-        try:
-            with open(PERSISTENCE_FILE, "w") as f:
-                json.dump(data, f, indent=2, default=str)
-        except Exception as e:
-            print(f"Error saving persistence file: {e}")
+        with self.write_lock:
+            self.backend.save_all()
+
+    def batch(self):
+        """Context manager that coalesces all mutations inside it into a single write."""
+        return self.backend.batch()
+
+    def flush(self):
+        self.backend.flush()
+
+    def close(self):
+        """Drain pending writes and release the backend."""
+        self.backend.close()
+
+    def add_listener(self, listener: Callable[[str, Optional[Email]], None]):
+        """Register a callback for email changes (used to keep derived indexes up to date)."""
+        self.listeners.append(listener)
+
+    def _notify(self, event: str, email: Optional[Email] = None):
+        for listener in self.listeners:
+            try:
+                listener(event, email)
+            except Exception as e:
+                print(f"Error in store listener: {e}")
+
+    @contextmanager
+    def _mutation(self):
+        """Mutate the email containers in place, copying them first if a snapshot still references them."""
+        with self.state_lock:
+            if self.shared:
+                self.emails = dict(self.emails)
+                self.time_index = {entry: list(keys) for entry, keys in self.time_index.items()}
+                self.indexed_values = dict(self.indexed_values)
+                self.shared = False
+            self.version += 1
+            yield
+
+    def snapshot(self) -> StoreSnapshot:
+        """Consistent read-only view of the emails and indexes, cheap to take."""
+        with self.state_lock:
+            self.shared = True
+            return StoreSnapshot(self.version, self.emails, self.time_index, self.indexed_values)
+
+    def _index_entries(self, email: Email) -> List[tuple]:
+        return [("all", None), ("category", email.category), ("sender", email.sender.lower()), ("read", email.read)]
+
+    def _index_email(self, email: Email):
+        self._unindex_email(email.id)
+        key = _time_key(email)
+        entries = self._index_entries(email)
+        for entry in entries:
+            bisect.insort(self.time_index.setdefault(entry, []), key)
+        self.indexed_values[email.id] = (key, entries)
+
+    def _unindex_email(self, email_id: str):
+        previous = self.indexed_values.pop(email_id, None)
+        if not previous:
+            return
+        key, entries = previous
+        for entry in entries:
+            keys = self.time_index.get(entry)
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+            if not keys and entry != ("all", None):
+                del self.time_index[entry]
+
+    def _rebuild_indexes(self):
+        self.time_index = {("all", None): []}
+        self.indexed_values = {}
+        for email in self.emails.values():
+            entries = self._index_entries(email)
+            key = _time_key(email)
+            for entry in entries:
+                self.time_index.setdefault(entry, []).append(key)
+            self.indexed_values[email.id] = (key, entries)
+        for keys in self.time_index.values():
+            keys.sort()
 
     def add_email(self, email: Email):
-        self.emails[email.id] = email
-        self.save_to_disk()
+        with self.write_lock:
+            with self._mutation():
+                self.emails[email.id] = email
+                self._index_email(email)
+            self.backend.upsert_email(email)
+            self._notify("upsert", email)
+
+    def delete_email(self, email_id: str) -> bool:
+        with self.write_lock:
+            if email_id not in self.emails:
+                return False
+            with self._mutation():
+                email = self.emails.pop(email_id)
+                self._unindex_email(email_id)
+            self.backend.delete_email(email_id)
+            self._notify("delete", email)
+            return True
+
+    def clear_emails(self):
+        with self.write_lock:
+            with self._mutation():
+                # Fresh containers: snapshots keep the old ones intact
+                self.emails = {}
+                self._rebuild_indexes()
+            self.backend.clear_emails()
+            self._notify("clear")
+
+    def query_emails(
+        self,
+        category: Optional[str] = None,
+        sender: Optional[str] = None,
+        read: Optional[bool] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        descending: bool = True,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        uncategorized: bool = False,
+    ) -> Tuple[List[Email], Optional[str]]:
+        """Page through emails on a consistent snapshot (see StoreSnapshot.query_emails)."""
+        return self.snapshot().query_emails(
+            category=category, sender=sender, read=read, since=since, until=until,
+            descending=descending, cursor=cursor, limit=limit, uncategorized=uncategorized,
+        )
 
     def get_all_emails(self) -> List[Email]:
-        return list(self.emails.values())
+        return self.snapshot().get_all_emails()
 
     def get_email(self, email_id: str) -> Email:
         return self.emails.get(email_id)
 
     def update_email(self, email: Email):
-        self.emails[email.id] = email
-        self.save_to_disk()
+        """
+        Replace the stored email. Pass a copy rather than mutating the stored
+        object in place, otherwise readers can see a half-updated email.
+        """
+        with self.write_lock:
+            with self._mutation():
+                self.emails[email.id] = email
+                self._index_email(email)
+            self.backend.upsert_email(email)
+            self._notify("upsert", email)
 
     def get_prompt(self, prompt_id: str) -> PromptConfig:
         return self.prompts.get(prompt_id)
     
     def update_prompt(self, prompt: PromptConfig):
-        self.prompts[prompt.id] = prompt
-        self.save_to_disk()
+        with self.write_lock:
+            self.prompts[prompt.id] = prompt
+            self.backend.upsert_prompt(prompt)
 
     def get_all_prompts(self) -> List[PromptConfig]:
         return list(self.prompts.values())
 
     def save_draft(self, draft: Draft):
-        self.drafts[draft.id] = draft
-        self.save_to_disk()
+        with self.write_lock:
+            self.drafts[draft.id] = draft
+            self.backend.upsert_draft(draft)
+
+    def delete_draft(self, draft_id: str) -> bool:
+        with self.write_lock:
+            if draft_id not in self.drafts:
+                return False
+            del self.drafts[draft_id]
+            self.backend.delete_draft(draft_id)
+            return True
 
     def get_all_drafts(self) -> List[Draft]:
         return list(self.drafts.values())
 
-# Global store instance
-store = Store()
+    def get_rule(self, rule_id: str) -> Optional[Rule]:
+        return self.rules.get(rule_id)
+
+    def get_all_rules(self) -> List[Rule]:
+        return list(self.rules.values())
+
+    def update_rule(self, rule: Rule):
+        with self.write_lock:
+            self.rules[rule.id] = rule
+            self.backend.upsert_rule(rule)
+
+    def delete_rule(self, rule_id: str) -> bool:
+        with self.write_lock:
+            if rule_id not in self.rules:
+                return False
+            del self.rules[rule_id]
+            self.backend.delete_rule(rule_id)
+            return True
+
+# The current tenant's store (see services.tenants)
+store = TenantLocal("store")
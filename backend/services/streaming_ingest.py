@@ -0,0 +1,289 @@
+"""
+Streaming ingestion for large mailbox exports (mbox, JSONL, JSON arrays).
+
+Records are parsed incrementally by generators, validated in chunks and
+committed to the store in batches, so parser memory does not depend on
+the file size. Malformed records are logged, counted as invalid and
+skipped. Every INGEST_CHECKPOINT_INTERVAL seconds the store is flushed and
+a checkpoint with the byte offset of the last committed record is written;
+an interrupted job resumes from it. Flushing per batch instead would rewrite
+the whole JSON store file every batch.
+
+Usage (from the backend directory):
+    python -m services.streaming_ingest export.mbox --batch-size 1000
+"""
+import argparse
+import codecs
+import email
+import hashlib
+import json
+import os
+import re
+import time
+from email.header import decode_header, make_header
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from services.ingestion import parse_email, upsert_emails, queue_for_processing
+from services.store import store
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+# Seconds between durable checkpoints; a resumed job re-ingests at most this much work
+INGEST_CHECKPOINT_INTERVAL = float(os.getenv("INGEST_CHECKPOINT_INTERVAL", "10"))
+READ_CHUNK_SIZE = 1 << 20
+# Larger JSON array records are treated as malformed, which bounds the parser's buffer
+MAX_RECORD_BYTES = int(os.getenv("INGEST_MAX_RECORD_BYTES", str(16 << 20)))
+RECORD_START = re.compile(r",\s*\{")
+
+# (record, or None for a malformed one; byte offset just after the record)
+Record = Tuple[Optional[Dict[str, Any]], int]
+
+def iter_jsonl(path: str, start: int = 0) -> Iterator[Record]:
+    """One JSON object per line."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    print(f"Skipping malformed JSON line at byte {f.tell() - len(line)} of {path}: {e}")
+                    record = None
+                yield record, f.tell()
+
+def iter_json_array(path: str, start: int = 0) -> Iterator[Record]:
+    """
+    Objects of a top-level JSON array, decoded one at a time from a sliding buffer.
+    A malformed record is skipped up to the next "," + "{" and yielded once as None.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    separators = " \t\r\n,["
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = ""
+        pos = 0
+        offset = start
+        eof = False
+        skipping = False
+        while True:
+            if skipping:
+                match = RECORD_START.search(text, pos)
+                if match:
+                    # Resume at the "{" of the next record
+                    resume = match.end() - 1
+                    offset += len(text[pos:resume].encode("utf-8"))
+                    pos = resume
+                    skipping = False
+                    yield None, offset
+                    continue
+                if eof:
+                    offset += len(text[pos:].encode("utf-8"))
+                    yield None, offset
+                    return
+                # Keep only a trailing "," that the next chunk may complete into a boundary
+                comma = text.rfind(",", pos)
+                drop_to = comma if comma >= 0 and not text[comma + 1:].strip() else len(text)
+                offset += len(text[pos:drop_to].encode("utf-8"))
+                pos = drop_to
+            else:
+                # Skip separators between records: whitespace, the opening bracket and commas
+                while pos < len(text) and text[pos] in separators:
+                    pos += 1
+                    offset += 1
+                if pos < len(text) and text[pos] == "]":
+                    if text[pos + 1:].strip():
+                        print(f"Skipping unexpected data at byte {offset} of {path}")
+                        skipping = True
+                        continue
+                    if eof:
+                        return
+                elif pos < len(text):
+                    try:
+                        record, end = decoder.raw_decode(text, pos)
+                    except json.JSONDecodeError as e:
+                        # Usually an incomplete record at the end of the buffer; malformed once
+                        # the file ends or the record outgrows INGEST_MAX_RECORD_BYTES
+                        if eof or len(text) - pos > MAX_RECORD_BYTES:
+                            print(f"Skipping malformed JSON record at byte {offset} of {path}: {e.msg}")
+                            skipping = True
+                            continue
+                    else:
+                        offset += len(text[pos:end].encode("utf-8"))
+                        pos = end
+                        yield record, offset
+                        continue
+                elif eof:
+                    return
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            # Drop the consumed prefix before appending the next chunk
+            text = text[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+
+def _header(message, name: str) -> str:
+    value = message.get(name)
+    if value is None:
+        return ""
+    # Decode RFC 2047 encoded words (=?utf-8?...?=)
+    return str(make_header(decode_header(value))) if "=?" in value else value
+
+def _message_body(message) -> str:
+    # Prefer the first text/plain part, then text/html
+    parts = [p for p in message.walk() if not p.is_multipart()]
+    for content_type in ("text/plain", "text/html"):
+        for part in parts:
+            if part.get_content_type() == content_type:
+                payload = part.get_payload(decode=True) or b""
+                return payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+    return ""
+
+def _mbox_record(raw: bytes) -> Dict[str, Any]:
+    # The compat32 policy parses several times faster than email.policy.default
+    message = email.message_from_bytes(raw)
+    try:
+        timestamp = parsedate_to_datetime(message["Date"]).isoformat()
+    except (TypeError, ValueError):
+        timestamp = "1970-01-01T00:00:00+00:00"
+    message_id = _header(message, "Message-ID").strip("<> ") or hashlib.sha1(raw).hexdigest()
+    return {
+        "id": message_id,
+        "sender": _header(message, "From"),
+        "subject": _header(message, "Subject"),
+        "body": _message_body(message).strip(),
+        "timestamp": timestamp,
+    }
+
+def iter_mbox(path: str, start: int = 0) -> Iterator[Record]:
+    """Messages of an mbox file, split on "From " separator lines."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        lines = []
+        position = start
+        while True:
+            line = f.readline()
+            if not line or line.startswith(b"From "):
+                if lines:
+                    yield _mbox_record(b"".join(lines)), position
+                    lines = []
+                if not line:
+                    break
+            else:
+                # mboxrd escaping: ">From " inside a body
+                lines.append(line[1:] if line.startswith(b">From ") else line)
+            position = f.tell()
+
+READERS = {"jsonl": iter_jsonl, "json": iter_json_array, "mbox": iter_mbox}
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext in (".mbox", ".mbx"):
+        return "mbox"
+    return "json"
+
+def _load_checkpoint(checkpoint_path: str, path: str) -> Dict[str, Any]:
+    if not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path, "r") as f:
+        checkpoint = json.load(f)
+    # Only resume if the checkpoint belongs to this file and the file was not truncated
+    if checkpoint.get("path") != os.path.abspath(path) or checkpoint.get("offset", 0) > os.path.getsize(path):
+        return {}
+    return checkpoint
+
+def _save_checkpoint(checkpoint_path: str, checkpoint: Dict[str, Any]):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def print_progress(stats: Dict[str, Any]):
+    percent = 100.0 * stats["bytes"] / stats["total_bytes"] if stats["total_bytes"] else 100.0
+    print(f"Ingested {stats['records']} records ({percent:.1f}%, {stats['records_per_sec']:.0f} records/sec, {stats['invalid']} invalid)")
+
+def ingest_stream(
+    path: str,
+    fmt: str = None,
+    batch_size: int = None,
+    checkpoint_path: str = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = print_progress,
+) -> Dict[str, Any]:
+    """
+    Stream a mailbox export into the store in batches, resuming from the
+    checkpoint if one exists for this file. Returns the final stats.
+    """
+    fmt = fmt or detect_format(path)
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    checkpoint_path = checkpoint_path or path + ".checkpoint"
+    checkpoint = _load_checkpoint(checkpoint_path, path)
+    if checkpoint:
+        print(f"Resuming {path} from byte {checkpoint['offset']} ({checkpoint['records']} records already ingested)")
+
+    stats = {
+        "records": checkpoint.get("records", 0),
+        "invalid": checkpoint.get("invalid", 0),
+        "queued_for_processing": 0,
+        "bytes": checkpoint.get("offset", 0),
+        "total_bytes": os.path.getsize(path),
+        "records_per_sec": 0.0,
+    }
+    start_time = time.perf_counter()
+    start_records = stats["records"]
+    last_checkpoint = start_time
+
+    def commit(batch, offset):
+        nonlocal last_checkpoint
+        emails = []
+        for record in batch:
+            if record is None:
+                stats["invalid"] += 1
+                continue
+            try:
+                emails.append(parse_email(record))
+            except Exception:
+                stats["invalid"] += 1
+        result = upsert_emails(emails)
+        stats["queued_for_processing"] += queue_for_processing(result["inserted"] + result["changed"])
+        stats["records"] += len(batch)
+        stats["bytes"] = offset
+        now = time.perf_counter()
+        stats["records_per_sec"] = (stats["records"] - start_records) / (now - start_time) if now > start_time else 0.0
+        if now - last_checkpoint >= INGEST_CHECKPOINT_INTERVAL:
+            # Writes are write-behind; make the batches durable before the checkpoint records them
+            store.flush()
+            _save_checkpoint(checkpoint_path, {"path": os.path.abspath(path), "offset": offset, "records": stats["records"], "invalid": stats["invalid"]})
+            last_checkpoint = now
+        if progress:
+            progress(stats)
+
+    batch = []
+    offset = stats["bytes"]
+    # Only checkpoints write the store; the background flusher waits for the batch to end
+    with store.batch():
+        for record, offset in READERS[fmt](path, stats["bytes"]):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                commit(batch, offset)
+                batch = []
+        if batch:
+            commit(batch, offset)
+    store.flush()
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a mailbox export into the store")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(READERS), help="Defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    result = ingest_stream(args.path, fmt=args.format, batch_size=args.batch_size)
+    print(f"Done: {result['records']} records, {result['invalid']} invalid")
+    store.close()
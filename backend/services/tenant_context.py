@@ -0,0 +1,78 @@
+"""
+Which mailbox (tenant) the current request or job belongs to.
+
+The current tenant lives in a context variable, so it follows a request
+through its tasks and worker threads. Per-tenant services (store, indexes,
+caches) are reached through TenantLocal stand-ins that resolve to the
+current tenant's instance on every attribute access, so code written against
+`store` or `retriever` works unchanged. Without a tenant set (startup, the
+file watcher thread, CLI tools) the default tenant is used.
+
+Tenants are spread over SHARD_COUNT server processes by a stable hash of
+their id; each process only serves the tenants of its SHARD_INDEX.
+"""
+import os
+import re
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+DEFAULT_TENANT = "default"
+TENANT_HEADER = "X-Tenant-Id"
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+SHARD_COUNT = max(1, int(os.getenv("SHARD_COUNT", "1")))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+
+_current_tenant: ContextVar = ContextVar("current_tenant", default=DEFAULT_TENANT)
+# Set by services.tenants: tenant id -> loaded Tenant
+_resolver: Optional[Callable[[str], Any]] = None
+
+def set_resolver(resolver: Callable[[str], Any]):
+    global _resolver
+    _resolver = resolver
+
+def current_tenant_id() -> str:
+    return _current_tenant.get()
+
+def valid_tenant_id(tenant_id: str) -> bool:
+    return bool(TENANT_ID_PATTERN.match(tenant_id or ""))
+
+def shard_for(tenant_id: str, shard_count: int = SHARD_COUNT) -> int:
+    """Shard serving a tenant; CRC-32, so every process (and a router) agrees."""
+    return zlib.crc32(tenant_id.encode("utf-8")) % shard_count
+
+def owns(tenant_id: str) -> bool:
+    return shard_for(tenant_id) == SHARD_INDEX
+
+@contextmanager
+def tenant_context(tenant_id: str):
+    token = _current_tenant.set(tenant_id)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+class TenantLocal:
+    """Stand-in for a per-tenant service: attribute access goes to the current tenant's instance."""
+    __slots__ = ("_name",)
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "_name", name)
+
+    def _target(self) -> Any:
+        if _resolver is None:
+            # First use: load the registry (it imports the modules defining the stand-ins)
+            import services.tenants  # noqa: F401
+        return getattr(_resolver(_current_tenant.get()), self._name)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._target(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._target(), attr, value)
+
+    def __repr__(self) -> str:
+        return f"<TenantLocal {self._name} of tenant {_current_tenant.get()!r}>"
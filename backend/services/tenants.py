@@ -0,0 +1,234 @@
+"""
+Tenant registry: one store, set of indexes, LLM result cache and response cache per mailbox.
+
+Each tenant persists to its own shard directory (TENANTS_DIR/<tenant id>;
+the default tenant keeps the original files in the working directory).
+Tenants are loaded on first use and evicted (flushed to disk and dropped
+from memory) once idle for TENANT_IDLE_SECONDS, or least recently used
+first when more than TENANT_MAX_LOADED are loaded. The default tenant is
+never evicted.
+
+A tenant's shard is locked while it is loaded, so a second server process
+can't load the same mailbox and silently diverge from the first. The server
+also locks its SHARD_INDEX for its whole lifetime, so a second process for
+the same shard (such as another `uvicorn --workers` worker without
+SHARD_COUNT/SHARD_INDEX) fails to start instead of failing every request.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from services.dedup import NearDupIndex
+from services.digest import InboxDigest
+from services.metrics import registry
+from services.response_cache import ResponseCache
+from services.result_cache import CACHE_FILE, ResultCache
+from services.retrieval import InboxRetriever, create_embedder
+from services.rules import RuleEngine
+from services.storage import STORE_BACKEND, JSON_PERSISTENCE_FILE, SQLITE_PERSISTENCE_FILE, create_backend
+from services.store import Store
+from services.tenant_context import DEFAULT_TENANT, SHARD_COUNT, SHARD_INDEX, current_tenant_id, owns, set_resolver, shard_for, tenant_context, valid_tenant_id
+
+try:
+    import fcntl
+except ImportError:  # Windows: shards are not locked
+    fcntl = None
+
+TENANTS_DIR = os.getenv("TENANTS_DIR", "tenants")
+TENANT_IDLE_SECONDS = float(os.getenv("TENANT_IDLE_SECONDS", "900"))
+TENANT_MAX_LOADED = int(os.getenv("TENANT_MAX_LOADED", "100"))
+# Emails of one tenant processed by the LLM at the same time, across all its jobs
+TENANT_PROCESS_CONCURRENCY = int(os.getenv("TENANT_PROCESS_CONCURRENCY", "8"))
+LOCK_FILE = "tenant.lock"
+SERVER_LOCK_FILE = "server.lock" if SHARD_COUNT == 1 else f"server.shard-{SHARD_INDEX}.lock"
+
+
+class TenantError(Exception):
+    """Base class for errors routing a request to a tenant."""
+
+class UnknownTenant(TenantError):
+    pass
+
+class TenantNotServedHere(TenantError):
+    def __init__(self, tenant_id: str):
+        self.shard = shard_for(tenant_id)
+        super().__init__(f"Tenant {tenant_id} is served by shard {self.shard}")
+
+class TenantLocked(TenantError):
+    def __init__(self, tenant_id: str):
+        super().__init__(f"Tenant {tenant_id} is loaded by another server process")
+
+
+def tenant_dir(tenant_id: str) -> str:
+    return "." if tenant_id == DEFAULT_TENANT else os.path.join(TENANTS_DIR, tenant_id)
+
+def _lock_shard(path: str, tenant_id: str):
+    handle = open(os.path.join(path, LOCK_FILE), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            raise TenantLocked(tenant_id)
+    return handle
+
+def lock_server_shard():
+    """Lock this process's shard of the working directory; returns the handle to keep open."""
+    handle = open(SERVER_LOCK_FILE, "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            raise RuntimeError(
+                f"Shard {SHARD_INDEX} of {SHARD_COUNT} is already served by another process. "
+                "Run one process per shard, each with its own SHARD_INDEX; uvicorn --workers is not supported."
+            )
+    return handle
+
+
+class Tenant:
+    def __init__(self, tenant_id: str):
+        self.id = tenant_id
+        self.path = tenant_dir(tenant_id)
+        os.makedirs(self.path, exist_ok=True)
+        self.lock_handle = _lock_shard(self.path, tenant_id)
+        try:
+            if tenant_id == DEFAULT_TENANT:
+                # Original layout: STORE_PATH or persistence.json / llm_cache.json in the working directory
+                backend = create_backend()
+                self.result_cache = ResultCache()
+            else:
+                filename = SQLITE_PERSISTENCE_FILE if STORE_BACKEND == "sqlite" else JSON_PERSISTENCE_FILE
+                backend = create_backend(path=os.path.join(self.path, filename))
+                self.result_cache = ResultCache(os.path.join(self.path, CACHE_FILE))
+            self.store = Store(backend=backend)
+            self.response_cache = ResponseCache()
+            self.retriever = InboxRetriever(create_embedder())
+            self.rule_engine = RuleEngine()
+            self.dedup_index = NearDupIndex()
+            self.inbox_digest = InboxDigest()
+            for index in (self.retriever, self.rule_engine, self.dedup_index, self.inbox_digest):
+                index.attach(self.store)
+        except Exception:
+            self.lock_handle.close()
+            raise
+        # Shared by every processing job of this tenant
+        self.process_slots = asyncio.Semaphore(TENANT_PROCESS_CONCURRENCY)
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.users = 0
+
+    @property
+    def email_json(self):
+        return self.store.email_json
+
+    def close(self):
+        """Flush everything to the shard and release it."""
+        try:
+            self.store.close()
+            self.result_cache.save_to_disk()
+        finally:
+            self.lock_handle.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "emails": len(self.store.emails),
+            "in_use": self.users,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "loaded_at": self.loaded_at,
+            "cached_results": len(self.result_cache.entries),
+            "process_slots_free": self.process_slots._value,
+        }
+
+
+class TenantRegistry:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.tenants: Dict[str, Tenant] = {}
+
+    def get(self, tenant_id: Optional[str] = None) -> Tenant:
+        """The loaded tenant, loading it from its shard first if needed."""
+        tenant_id = tenant_id or current_tenant_id()
+        tenant = self.tenants.get(tenant_id)
+        if tenant is not None:
+            return tenant
+        if not valid_tenant_id(tenant_id):
+            raise UnknownTenant(f"Invalid tenant id: {tenant_id!r}")
+        if not owns(tenant_id):
+            raise TenantNotServedHere(tenant_id)
+        with self.lock:
+            tenant = self.tenants.get(tenant_id)
+            if tenant is None:
+                self._evict_over_limit(TENANT_MAX_LOADED - 1)
+                start = time.perf_counter()
+                tenant = Tenant(tenant_id)
+                self.tenants[tenant_id] = tenant
+                print(f"Loaded tenant {tenant_id} ({len(tenant.store.emails)} emails) in {time.perf_counter() - start:.2f}s")
+        return tenant
+
+    def current(self) -> Tenant:
+        return self.get(current_tenant_id())
+
+    def is_loaded(self, tenant_id: str) -> bool:
+        return tenant_id in self.tenants
+
+    @contextmanager
+    def use(self, tenant_id: str):
+        """Make `tenant_id` current for the block and keep it loaded until the block ends."""
+        # Eviction runs under the same lock, so the tenant can't be closed between lookup and pinning
+        with self.lock:
+            tenant = self.get(tenant_id)
+            tenant.users += 1
+        try:
+            with tenant_context(tenant_id):
+                yield tenant
+        finally:
+            with self.lock:
+                tenant.users -= 1
+                tenant.last_used = time.monotonic()
+
+    def _evictable(self, tenant: Tenant) -> bool:
+        return tenant.id != DEFAULT_TENANT and tenant.users == 0
+
+    def _evict(self, tenant_id: str):
+        tenant = self.tenants.pop(tenant_id)
+        tenant.close()
+        print(f"Evicted tenant {tenant_id}")
+
+    def _evict_over_limit(self, limit: int):
+        idle = sorted((t for t in self.tenants.values() if self._evictable(t)), key=lambda t: t.last_used)
+        for tenant in idle[:max(0, len(self.tenants) - limit)]:
+            self._evict(tenant.id)
+
+    def evict_idle(self, idle_seconds: float = TENANT_IDLE_SECONDS) -> List[str]:
+        """Flush and unload tenants unused for `idle_seconds`. Returns their ids."""
+        now = time.monotonic()
+        with self.lock:
+            idle = [t.id for t in self.tenants.values() if self._evictable(t) and now - t.last_used >= idle_seconds]
+            for tenant_id in idle:
+                self._evict(tenant_id)
+        return idle
+
+    def close_all(self):
+        with self.lock:
+            for tenant_id in list(self.tenants):
+                self._evict(tenant_id)
+
+    def loaded(self) -> List[Tenant]:
+        return list(self.tenants.values())
+
+# Global registry; TenantLocal stand-ins resolve through it
+tenants = TenantRegistry()
+set_resolver(tenants.get)
+
+registry.gauge("tenants_loaded", "Tenants loaded in this process", callback=lambda: len(tenants.tenants))
+registry.gauge("store_emails", "Emails in the loaded tenants' stores", callback=lambda: sum(len(t.store.emails) for t in tenants.loaded()))
+registry.gauge("store_version", "Email mutations since the loaded tenants were loaded", callback=lambda: sum(t.store.version for t in tenants.loaded()))
+registry.gauge("llm_cache_entries", "Entries in the loaded tenants' LLM result caches", callback=lambda: sum(len(t.result_cache.entries) for t in tenants.loaded()))
+registry.gauge("response_cache_entries", "Entries in the loaded tenants' chat and draft response caches", callback=lambda: sum(len(t.response_cache.entries) for t in tenants.loaded()))
+registry.gauge("response_cache_bytes", "Size of the loaded tenants' cached chat and draft responses", callback=lambda: sum(t.response_cache.bytes for t in tenants.loaded()))
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Tests import the backend modules the way the server does, from the backend directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# The global services keep their data in the working directory; keep it away from the real inbox
+os.chdir(tempfile.mkdtemp())
+os.environ["LLM_BACKEND"] = "fake"
+# Jobs only run when a test queues them
+os.environ["AUTO_PROCESS_NEW_EMAILS"] = "false"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def close_tenants():
+    yield
+    # Flush while still in the temporary directory; pytest restores the original one before exiting
+    from services.tenants import tenants
+    tenants.close_all()
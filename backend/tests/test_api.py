@@ -0,0 +1,101 @@
+"""HTTP API against the fake chat model."""
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.llm_engine import chat_with_email
+from services.response_cache import response_cache
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Runs the startup event: default tenant, mock inbox sync and the job workers
+    with TestClient(app) as client:
+        yield client
+
+
+def add_emails(client, prefix: str, count: int, sender: str = "a@b.com") -> list:
+    ids = []
+    for i in range(count):
+        email = {"id": f"{prefix}-{i}", "sender": sender, "subject": f"{prefix} {i}", "body": f"Please review the {prefix} report number {i}.",
+                 "timestamp": f"2024-02-{i + 1:02d}T09:00:00Z"}
+        assert client.post("/emails", json=email).status_code == 200
+        ids.append(email["id"])
+    return ids
+
+
+def run_inbox_job(client) -> dict:
+    response = client.post("/process")
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    deadline = time.monotonic() + 30
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        assert time.monotonic() < deadline, f"Job {job_id} did not finish"
+        time.sleep(0.05)
+
+
+def test_process_runs_a_background_job(client):
+    ids = add_emails(client, "job", 3)
+    job = run_inbox_job(client)
+    assert job["status"] == "completed"
+    assert job["pending"] == 0 and job["failed"] == 0
+    assert all(client.get(f"/emails/{email_id}").json()["category"] for email_id in ids)
+    assert job["id"] in [j["id"] for j in client.get("/jobs", params={"status": "completed"}).json()]
+
+
+def test_processing_skips_unchanged_emails(client):
+    add_emails(client, "skip", 2)
+    run_inbox_job(client)
+    job = run_inbox_job(client)
+    assert job["status"] == "completed"
+    assert job["processed"] == 0 and job["skipped"] == job["total"]
+    assert job["stats"]["processed"] == 0
+
+
+def test_emails_are_paged_with_a_cursor(client):
+    ids = add_emails(client, "page", 5, sender="pager@example.com")
+    seen, cursor = [], None
+    while True:
+        params = {"sender": "pager@example.com", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/emails", params=params)
+        assert response.status_code == 200
+        seen += [email["id"] for email in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == ids[::-1]
+    assert client.get("/emails", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_chat_and_draft_answers_are_cached(client):
+    email_id = add_emails(client, "cache", 1)[0]
+    before = client.get("/cache/responses").json()
+    first = client.post("/chat", json={"email_id": email_id, "query": "What is this about?"}).json()
+    second = client.post("/chat", json={"email_id": email_id, "query": "What is this about?"}).json()
+    draft = client.post("/drafts/generate", json={"email_id": email_id}).json()
+    assert client.post("/drafts/generate", json={"email_id": email_id}).json() == draft
+    client.post("/drafts/generate", json={"email_id": email_id, "fresh": True})
+    after = client.get("/cache/responses").json()
+
+    assert first == second
+    assert after["misses"] - before["misses"] == 2
+    assert after["hits"] - before["hits"] == 2
+    assert after["bypassed"] - before["bypassed"] == 1
+
+
+def test_identical_concurrent_chats_share_one_call():
+    before = dict(response_cache.counts)
+
+    async def ask():
+        return await asyncio.gather(*(chat_with_email("Lunch at noon on Friday?", "When is lunch?") for _ in range(4)))
+
+    answers = asyncio.run(ask())
+    assert len(set(answers)) == 1
+    assert response_cache.counts["misses"] - before["misses"] == 1
+    assert response_cache.counts["coalesced"] - before["coalesced"] == 3
@@ -0,0 +1,54 @@
+"""Aggregate chat answers from the inbox digest."""
+from datetime import date, datetime
+
+from models import Email
+from services.digest import InboxDigest
+
+TODAY = date(2024, 5, 15)  # a Wednesday
+
+
+def make_digest():
+    digest = InboxDigest()
+    emails = [
+        Email(id="e1", sender="boss@corp.com", subject="Report", body="Send the report", timestamp=datetime(2024, 1, 10),
+              category="To-Do", action_items=[{"task": "Send report", "deadline": "2024-05-16"}]),
+        Email(id="e2", sender="news@site.com", subject="Weekly", body="News", timestamp=datetime(2024, 2, 1), category="Newsletter", read=True),
+        Email(id="e3", sender="boss@corp.com", subject="Budget", body="Review budget", timestamp=datetime(2024, 3, 5),
+              category="To-Do", action_items=[{"task": "Review budget", "deadline": "2024-06-30"}]),
+        Email(id="e4", sender="spam@x.com", subject="Win", body="Prize", timestamp=datetime(2024, 4, 20), category="Spam"),
+        Email(id="e5", sender="boss@corp.com", subject="Hi", body="Hello", timestamp=datetime(2024, 5, 14), category="Important"),
+    ]
+    for email in emails:
+        digest.on_store_event("upsert", email)
+    return digest
+
+
+def test_counts_come_from_the_digest():
+    digest = make_digest()
+    assert digest.answer("How many emails do I have?", TODAY) == "Your inbox has 5 emails (4 unread)."
+    assert digest.answer("How many unread emails?", TODAY) == "You have 4 unread emails."
+    assert digest.answer("How many To-Dos?", TODAY) == "You have 2 To-Do emails (2 unread)."
+
+
+def test_due_windows_apply_to_action_items():
+    answer = make_digest().answer("How many tasks are due this week?", TODAY)
+    assert answer.startswith("1 action items due this week across 1 emails.")
+
+
+def test_time_scoped_email_counts_go_to_the_llm():
+    digest = make_digest()
+    assert digest.answer("How many emails this week?", TODAY) is None
+    assert digest.answer("How many unread emails today?", TODAY) is None
+    assert digest.answer("How many To-Dos this month?", TODAY) is None
+
+
+def test_questions_with_other_conditions_go_to_the_llm():
+    assert make_digest().answer("How many emails from boss about the budget?", TODAY) is None
+
+
+def test_updates_and_deletes_are_reflected():
+    digest = make_digest()
+    digest.on_store_event("delete", Email(id="e4", sender="spam@x.com", subject="Win", body="Prize", timestamp=datetime(2024, 4, 20)))
+    read = Email(id="e5", sender="boss@corp.com", subject="Hi", body="Hello", timestamp=datetime(2024, 5, 14), category="Important", read=True)
+    digest.on_store_event("upsert", read)
+    assert digest.answer("How many emails do I have?", TODAY) == "Your inbox has 4 emails (2 unread)."
@@ -0,0 +1,28 @@
+"""Mock inbox sync."""
+from datetime import datetime
+
+from models import Email
+from services.ingestion import sync_emails
+from services.store import store
+
+
+def make_email(email_id: str, body: str = "Hello") -> Email:
+    return Email(id=email_id, sender="a@b.com", subject=email_id, body=body, timestamp=datetime(2024, 1, 1))
+
+
+def test_sync_deletes_only_emails_it_synced():
+    store.add_email(make_email("imported"))
+    assert sync_emails([make_email("sync-a"), make_email("sync-b")])["inserted"] == 2
+
+    result = sync_emails([make_email("sync-a", body="Edited")])
+
+    assert result["deleted"] == 1 and result["updated"] == 1
+    assert store.get_email("sync-b") is None
+    assert store.get_email("imported") is not None
+
+
+def test_sync_adopts_untagged_emails_it_lists():
+    store.add_email(make_email("legacy"))
+    assert sync_emails([make_email("legacy")])["updated"] == 1
+    assert sync_emails([])["deleted"] == 1
+    assert store.get_email("legacy") is None
@@ -0,0 +1,52 @@
+"""Background processing jobs."""
+import asyncio
+import threading
+from datetime import datetime
+
+from models import Email
+from services.job_queue import JobQueue
+from services.store import store
+
+
+def test_concurrent_submissions_and_reads(tmp_path):
+    email_ids = [f"job-{i}" for i in range(10)]
+    with store.batch():
+        for i, email_id in enumerate(email_ids):
+            store.add_email(Email(id=email_id, sender="a@b.com", subject=f"Subject {i}", body=f"Body {i}", timestamp=datetime(2024, 1, 1)))
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    errors, done = [], threading.Event()
+
+    def read():
+        # Readers poll the jobs while the writer thread commits
+        while not done.is_set():
+            try:
+                for job in queue.list_jobs():
+                    assert queue.get_job(job.id) is not None
+            except Exception as e:
+                errors.append(e)
+
+    async def run():
+        queue.start(workers=2)
+        # Every email is submitted twice; the second submission joins the first job
+        results = await asyncio.gather(*(queue.submit_emails([email_id]) for email_id in email_ids * 2))
+        await queue.queue.join()
+        await queue.stop()
+        return results
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        results = asyncio.run(run())
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+    queue.close()
+    jobs = JobQueue(str(tmp_path / "jobs.db")).list_jobs()
+
+    assert errors == []
+    assert [deduplicated for _, deduplicated in results] == [False] * 10 + [True] * 10
+    assert [job.id for job, _ in results[:10]] == [job.id for job, _ in results[10:]]
+    assert len(jobs) == 10
+    assert all(job.status == "completed" and job.processed == 1 and job.pending == 0 for job in jobs)
@@ -0,0 +1,50 @@
+"""persistence.json -> SQLite migration, end to end."""
+import json
+from datetime import datetime
+
+import pytest
+
+from models import Email
+from services.migrate import migrate_json_to_sqlite
+from services.storage import SqliteBackend
+
+
+def write_json_state(path, emails):
+    data = {
+        "emails": {e.id: json.loads(e.json()) for e in emails},
+        "prompts": {},
+        "drafts": {},
+        "rules": {},
+    }
+    path.write_text(json.dumps(data))
+
+
+def make_email(i: int) -> Email:
+    return Email(id=f"email_{i}", sender=f"user{i}@example.com", subject=f"Subject {i}",
+                 body=f"Body {i}", timestamp=datetime(2024, 1, 1, 9, i), category="Important" if i % 2 else None)
+
+
+def test_migrate_copies_every_email(tmp_path):
+    source, target = tmp_path / "persistence.json", tmp_path / "persistence.db"
+    emails = [make_email(i) for i in range(5)]
+    write_json_state(source, emails)
+
+    counts = migrate_json_to_sqlite(str(source), str(target))
+
+    assert counts["emails"] == 5
+    backend = SqliteBackend(str(target))
+    try:
+        loaded = backend.load()
+    finally:
+        backend.close()
+    assert {k: Email(**v) for k, v in loaded["emails"].items()} == {e.id: e for e in emails}
+
+
+def test_migrate_refuses_to_overwrite(tmp_path):
+    source, target = tmp_path / "persistence.json", tmp_path / "persistence.db"
+    write_json_state(source, [make_email(0)])
+    migrate_json_to_sqlite(str(source), str(target))
+
+    with pytest.raises(ValueError):
+        migrate_json_to_sqlite(str(source), str(target))
+    assert migrate_json_to_sqlite(str(source), str(target), overwrite=True)["emails"] == 1
@@ -0,0 +1,27 @@
+"""Inbox processing against the fake chat model."""
+import asyncio
+from datetime import datetime
+
+from models import Email
+from services.processor import process_inbox
+from services.store import store
+
+REPORT = "Your weekly build report for project atlas: 42 tests passed, 0 failed, coverage steady at 81 percent. Build number {}."
+
+
+def add_emails(prefix: str) -> list:
+    emails = [
+        Email(id=f"{prefix}-report-{i}", sender="ci@builds.example.com", subject="Build report", body=REPORT.format(i), timestamp=datetime(2024, 1, 1 + i))
+        for i in range(3)
+    ]
+    emails.append(Email(id=f"{prefix}-lunch", sender="alice@example.com", subject="Lunch", body="Lunch tomorrow at noon?", timestamp=datetime(2024, 1, 5)))
+    for email in emails:
+        store.add_email(email)
+    return [email.id for email in emails]
+
+
+def test_copied_near_duplicates_are_not_counted_as_processed():
+    stats = asyncio.run(process_inbox(email_ids=add_emails("dedup"), dedup=True))
+    assert stats["processed"] == 2
+    assert stats["deduplicated"] == 2
+    assert stats["failed"] == 0
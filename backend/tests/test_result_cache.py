@@ -0,0 +1,70 @@
+"""LLM result cache."""
+import asyncio
+import json
+import sys
+import threading
+
+from models import PromptConfig
+from services.result_cache import ResultCache
+
+
+def make_prompt(prompt_id: str, template: str = "Classify: {email_content}") -> PromptConfig:
+    return PromptConfig(id=prompt_id, name=prompt_id, template=template, description="")
+
+
+def test_invalidating_a_prompt_keeps_other_results(tmp_path):
+    cache = ResultCache(str(tmp_path / "llm_cache.json"))
+    categorize, actions = make_prompt("categorize"), make_prompt("actions", "Extract: {email_content}")
+    cache.set(cache.make_key("body", categorize, "m"), "categorize", "To-Do")
+    cache.set(cache.make_key("body", actions, "m"), "actions", [])
+    cache.set(cache.make_combined_key("body", [categorize, actions], "m", "combined"), ["categorize", "actions"], {})
+
+    assert cache.invalidate_prompt("categorize") == 2
+    assert cache.get(cache.make_key("body", actions, "m")) == []
+
+
+def test_save_round_trips(tmp_path):
+    path = tmp_path / "llm_cache.json"
+    cache = ResultCache(str(path))
+    key = cache.make_key("body", make_prompt("categorize"), "m")
+    cache.set(key, "categorize", "Spam")
+    asyncio.run(cache.save())
+
+    assert ResultCache(str(path)).get(key) == "Spam"
+    assert not (tmp_path / "llm_cache.json.tmp").exists()
+    assert json.loads(path.read_text())[key]["value"] == "Spam"
+
+
+def test_invalidation_while_results_are_added(tmp_path):
+    cache = ResultCache(str(tmp_path / "llm_cache.json"))
+    prompt = make_prompt("categorize")
+    for i in range(20000):
+        cache.set(cache.make_key(f"old {i}", prompt, "m"), "other", "To-Do")
+    errors = []
+    done = threading.Event()
+    # Switch threads as often as possible so the writer lands inside the invalidation scan
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    def add_results():
+        for i in range(20000):
+            cache.set(cache.make_key(f"body {i}", prompt, "m"), "other", "To-Do")
+        done.set()
+
+    def invalidate():
+        try:
+            while not done.is_set():
+                cache.invalidate_prompt("categorize")
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add_results), threading.Thread(target=invalidate)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(previous)
+    assert errors == []
+    assert len(cache.entries) == 40000
@@ -0,0 +1,61 @@
+"""Write-behind JSON persistence."""
+import json
+import threading
+import time
+from datetime import datetime
+
+from models import Email
+from services.storage import JsonFileBackend
+from services.store import Store
+
+
+def make_email(i: int) -> Email:
+    return Email(id=f"email_{i}", sender="a@example.com", subject=f"Subject {i}", body="Body", timestamp=datetime(2024, 1, 1))
+
+
+def stored_ids(path) -> set:
+    with open(path) as f:
+        return set(json.load(f)["emails"])
+
+
+def test_older_snapshot_never_replaces_a_newer_one(tmp_path):
+    path = tmp_path / "persistence.json"
+    backend = JsonFileBackend(str(path), flush_interval=1)
+    store = Store(backend=backend)
+    store.add_email(make_email(1))
+
+    encode = backend.encode_snapshot
+    calls = []
+
+    def slow_first_encode():
+        data = encode()
+        calls.append(data)
+        if len(calls) == 1:
+            # The first flush encodes, then stalls until the second has written
+            time.sleep(0.3)
+        return data
+
+    backend.encode_snapshot = slow_first_encode
+    first = threading.Thread(target=backend.flush)
+    first.start()
+    time.sleep(0.05)
+    store.add_email(make_email(2))
+    backend.flush()
+    first.join()
+
+    assert stored_ids(path) == {"email_1", "email_2"}
+    store.close()
+
+
+def test_batch_defers_flushes_until_it_ends(tmp_path):
+    path = tmp_path / "persistence.json"
+    backend = JsonFileBackend(str(path), flush_interval=0.01)
+    store = Store(backend=backend)
+    with store.batch():
+        for i in range(3):
+            store.add_email(make_email(i))
+        time.sleep(0.1)
+        assert backend.batch_depth == 1
+    store.flush()
+    assert stored_ids(path) == {"email_0", "email_1", "email_2"}
+    store.close()
@@ -0,0 +1,51 @@
+"""Store queries."""
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import Email
+from services.storage import JsonFileBackend
+from services.store import Store
+
+
+@pytest.fixture
+def local_time_is_not_utc(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = Store(backend=JsonFileBackend(str(tmp_path / "persistence.json")))
+    yield store
+    store.close()
+
+
+def make_email(email_id: str, timestamp: datetime, category: str = None) -> Email:
+    return Email(id=email_id, sender="a@b.com", subject=email_id, body="Hello", timestamp=timestamp, category=category)
+
+
+def test_naive_timestamps_and_bounds_are_utc(store, local_time_is_not_utc):
+    store.add_email(make_email("naive", datetime(2024, 1, 1, 12, 0)))
+    store.add_email(make_email("aware", datetime(2024, 1, 1, 16, 0, tzinfo=timezone(timedelta(hours=2)))))  # 14:00 UTC
+    emails, _ = store.query_emails(descending=False)
+    assert [e.id for e in emails] == ["naive", "aware"]
+
+    emails, _ = store.query_emails(until=datetime(2024, 1, 1, 13, 0, tzinfo=timezone.utc))
+    assert [e.id for e in emails] == ["naive"]
+    emails, _ = store.query_emails(since=datetime(2024, 1, 1, 13, 0))
+    assert [e.id for e in emails] == ["aware"]
+
+
+def test_uncategorized_filter(store):
+    store.add_email(make_email("todo", datetime(2024, 1, 1), "To-Do"))
+    store.add_email(make_email("new-1", datetime(2024, 1, 2)))
+    store.add_email(make_email("new-2", datetime(2024, 1, 3)))
+    emails, cursor = store.query_emails(uncategorized=True, limit=1)
+    assert [e.id for e in emails] == ["new-2"]
+    emails, _ = store.query_emails(uncategorized=True, cursor=cursor)
+    assert [e.id for e in emails] == ["new-1"]
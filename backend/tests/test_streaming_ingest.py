@@ -0,0 +1,44 @@
+"""Streaming mailbox import."""
+import json
+
+from services import streaming_ingest
+from services.store import store
+from services.streaming_ingest import ingest_stream
+
+
+def write_export(path, count: int):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": f"stream-{i}", "sender": "a@b.com", "subject": f"Subject {i}", "body": f"Body {i}", "timestamp": "2024-01-01T00:00:00Z"}) + "\n")
+
+
+def test_store_is_flushed_per_checkpoint_not_per_batch(tmp_path, monkeypatch):
+    path = tmp_path / "export.jsonl"
+    write_export(path, 50)
+    flushes = []
+    backend_type = type(store.backend)
+    flush = backend_type.flush
+    monkeypatch.setattr(backend_type, "flush", lambda self: flushes.append(self) or flush(self))
+    monkeypatch.setattr(streaming_ingest, "INGEST_CHECKPOINT_INTERVAL", 3600)
+
+    stats = ingest_stream(str(path), batch_size=10, progress=None)
+
+    assert stats["records"] == 50 and stats["invalid"] == 0
+    assert len(flushes) == 1
+    assert all(store.get_email(f"stream-{i}") is not None for i in range(50))
+    assert not (tmp_path / "export.jsonl.checkpoint").exists()
+
+
+def test_checkpoints_are_written_after_a_flush(tmp_path, monkeypatch):
+    path = tmp_path / "export.jsonl"
+    write_export(path, 30)
+    events = []
+    backend_type = type(store.backend)
+    flush, save_checkpoint = backend_type.flush, streaming_ingest._save_checkpoint
+    monkeypatch.setattr(backend_type, "flush", lambda self: events.append("flush") or flush(self))
+    monkeypatch.setattr(streaming_ingest, "_save_checkpoint", lambda *args: events.append("checkpoint") or save_checkpoint(*args))
+    monkeypatch.setattr(streaming_ingest, "INGEST_CHECKPOINT_INTERVAL", 0)
+
+    ingest_stream(str(path), batch_size=10, progress=None)
+
+    assert events == ["flush", "checkpoint"] * 3 + ["flush"]
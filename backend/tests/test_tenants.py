@@ -0,0 +1,14 @@
+"""Tenant shards."""
+import pytest
+
+from services.tenants import lock_server_shard
+
+
+def test_a_second_server_for_the_same_shard_fails_to_start():
+    handle = lock_server_shard()
+    try:
+        with pytest.raises(RuntimeError, match="already served by another process"):
+            lock_server_shard()
+    finally:
+        handle.close()
+    lock_server_shard().close()
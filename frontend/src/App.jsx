@@ -67,15 +67,25 @@ function App() {
   const handleProcess = async () => {
     setLoading(true);
     try {
-      await api.post('/process');
+      const res = await api.post('/process');
+      const jobId = res.data.job_id;
 
-      // Poll for updates every 2 seconds for 1 minute
+      // Poll the processing job every 2 seconds and refresh emails until it finishes
       await fetchEmails();
-      const pollInterval = setInterval(fetchEmails, 2000);
-      setTimeout(() => {
-        clearInterval(pollInterval);
-        setLoading(false);
-      }, 60000); // 1 minute = 60000ms
+      const pollInterval = setInterval(async () => {
+        try {
+          const job = await api.get(`/jobs/${jobId}`);
+          await fetchEmails();
+          if (job.data.status !== 'queued' && job.data.status !== 'running') {
+            clearInterval(pollInterval);
+            setLoading(false);
+          }
+        } catch (err) {
+          console.error("Error polling processing job", err);
+          clearInterval(pollInterval);
+          setLoading(false);
+        }
+      }, 2000);
 
     } catch (err) {
       console.error("Error processing inbox", err);